@@ -1,4 +1,17 @@
-WITH daily AS (
+WITH wm AS (
+  SELECT MAX(bucket) + interval '1' day AS next_day
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+),
+
+daily AS (
+  SELECT
+    CAST(bucket AS date) AS day,
+    low, high, open, close
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+    AND bucket >= current_date - interval '110' day
+  UNION ALL
   SELECT
     CAST(date_trunc('day', minute) AS date) AS day,
     MIN(price)                               AS low,
@@ -8,6 +21,7 @@ WITH daily AS (
   FROM prices.usd
   WHERE symbol = 'SOL'
     AND minute >= current_date - interval '110' day   
+    AND minute >= COALESCE((SELECT next_day FROM wm), current_date - interval '110' day)
   GROUP BY 1
 ),
   
@@ -0,0 +1,14 @@
+SELECT
+  symbol,
+  date_trunc('day', minute) AS bucket,
+  min_by(price, minute)     AS open,
+  MAX(price)                AS high,
+  MIN(price)                AS low,
+  max_by(price, minute)     AS close,
+  COUNT(*)                  AS samples
+FROM prices.usd
+WHERE symbol IN ('SOL', 'BTC', 'ETH')
+  AND minute >= current_date - interval '400' day
+  AND minute <  current_date
+GROUP BY 1, 2
+ORDER BY 1, 2;
@@ -1,11 +1,18 @@
-WITH minute_price AS (
-  SELECT date_trunc('day', minute) AS day, price, minute
-  FROM prices.usd
-  WHERE symbol = 'SOL' AND minute >= now() - interval '90' day
+WITH wm AS (
+  SELECT MAX(bucket) + interval '1' day AS next_day
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
 ),
 daily AS (
-  SELECT day, (ARRAY_AGG(price ORDER BY minute DESC))[1] AS close
-  FROM minute_price GROUP BY 1
+  SELECT bucket AS day, close
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL' AND bucket >= date_trunc('day', now() - interval '90' day)
+  UNION ALL
+  SELECT date_trunc('day', minute) AS day, max_by(price, minute) AS close
+  FROM prices.usd
+  WHERE symbol = 'SOL' AND minute >= now() - interval '90' day
+    AND minute >= COALESCE((SELECT next_day FROM wm), now() - interval '90' day)
+  GROUP BY 1
 ),
 chg AS (
   SELECT
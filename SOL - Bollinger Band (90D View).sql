@@ -1,16 +1,23 @@
-WITH daily_prices AS (
+WITH wm AS (
+  SELECT MAX(bucket) + interval '1' day AS next_day
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+),
+unique_daily AS (
+  SELECT bucket AS day, open, close
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+    AND bucket >= current_date - interval '90' day
+  UNION ALL
   SELECT
     date_trunc('day', minute) AS day,
-    first_value(price) OVER (PARTITION BY date_trunc('day', minute) ORDER BY minute) AS open,
-    last_value(price) OVER (PARTITION BY date_trunc('day', minute) ORDER BY minute 
-                           ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS close
+    min_by(price, minute) AS open,
+    max_by(price, minute) AS close
   FROM prices.usd
   WHERE symbol = 'SOL'
     AND minute >= current_date - interval '90' day
-),
-unique_daily AS (
-  SELECT DISTINCT day, open, close
-  FROM daily_prices
+    AND minute >= COALESCE((SELECT next_day FROM wm), current_date - interval '90' day)
+  GROUP BY 1
 ),
 bollinger_bands AS (
   SELECT
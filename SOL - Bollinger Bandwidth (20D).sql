@@ -1,10 +1,21 @@
-WITH daily AS (
+WITH wm AS (
+  SELECT MAX(bucket) + interval '1' day AS next_day
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+),
+daily AS (
+  SELECT bucket AS day, close
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol = 'SOL'
+    AND bucket >= current_date - interval '90' day
+  UNION ALL
   SELECT
-    date_trunc('day', minute)                 AS day,
-    max_by(price, minute)                     AS close
+    date_trunc('day', minute) AS day,
+    max_by(price, minute) AS close
   FROM prices.usd
   WHERE symbol = 'SOL'
     AND minute >= current_date - interval '90' day
+    AND minute >= COALESCE((SELECT next_day FROM wm), current_date - interval '90' day)
   GROUP BY 1
 ),
 bb AS (
@@ -1,14 +1,38 @@
+WITH wm AS (
+  SELECT
+    now() - INTERVAL '1' HOUR * {{lookback_hours}} AS start_ts,
+    LEAST(
+      COALESCE(MAX(bucket) + INTERVAL '1' HOUR, now() - INTERVAL '1' HOUR * {{lookback_hours}}),
+      date_trunc('hour', now())
+    ) AS next_hour
+  FROM dune.abbysuyuyan.result_ohlc_1h
+  WHERE symbol = 'SOL'
+),
+bars AS (
+  SELECT bucket AS ts, open, high, low, close
+  FROM dune.abbysuyuyan.result_ohlc_1h
+  WHERE symbol = 'SOL'
+    AND bucket >= (SELECT start_ts FROM wm)
+    AND bucket <  (SELECT next_hour FROM wm)
+  UNION ALL
+  SELECT minute AS ts, price AS open, price AS high, price AS low, price AS close
+  FROM prices.usd
+  WHERE symbol = 'SOL'
+    AND minute >= (SELECT start_ts FROM wm)
+    AND minute < now()
+    AND (
+      (minute < (SELECT start_ts FROM wm) + INTERVAL '1' HOUR AND date_trunc('hour', minute) < (SELECT start_ts FROM wm))
+      OR minute >= (SELECT next_hour FROM wm)
+    )
+)
 SELECT
   from_unixtime(
-    floor(to_unixtime(minute) / (3600 * {{k_hours}})) * 3600 * {{k_hours}}
+    floor(to_unixtime(ts) / (3600 * {{k_hours}})) * 3600 * {{k_hours}}
   ) AS bucket,
-  min_by(price, minute) AS open,
-  MAX(price) AS high,
-  MIN(price) AS low,
-  max_by(price, minute) AS close
-FROM prices.usd
-WHERE symbol = 'SOL'
-  AND minute >= now() - INTERVAL '1' HOUR * {{lookback_hours}}
-  AND minute < now()
-GROUP BY floor(to_unixtime(minute) / (3600 * {{k_hours}}))
+  min_by(open, ts) AS open,
+  MAX(high) AS high,
+  MIN(low) AS low,
+  max_by(close, ts) AS close
+FROM bars
+GROUP BY floor(to_unixtime(ts) / (3600 * {{k_hours}}))
 ORDER BY bucket;
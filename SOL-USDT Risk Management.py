@@ -1,30 +1,42 @@
-from google.colab import drive
-drive.mount('/content/drive', force_remount=True)
-
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import json
 import os
+import tempfile
 from datetime import datetime
-import matplotlib.pyplot as plt
-from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
 
+from var_engine import ScenarioEngine, tail_metrics, generate_scenarios, evaluate_portfolios
+
+# yfinance / matplotlib / scipy 只在用到時才載入: 批次計算不需要繪圖, 繪圖也不需要下載
+
+def mount_drive(save_dir):
+    """在 Colab 且輸出目錄位於 Google Drive 時才掛載"""
+    if not save_dir.startswith('/content/drive') or os.path.ismount('/content/drive'):
+        return
+    try:
+        from google.colab import drive
+    except ImportError:
+        return
+    drive.mount('/content/drive', force_remount=True)
+
 class SOLVaRCalculator:
-    def __init__(self, portfolio_value=100000, num_simulations=50000):
+    def __init__(self, portfolio_value=100000, num_simulations=50000,
+                 save_dir="/content/drive/MyDrive/crypto_analysis"):
         self.portfolio_value = portfolio_value
         self.num_simulations = num_simulations
         self.ticker = "SOL-USD"
-        self.save_dir = "/content/drive/MyDrive/crypto_analysis"
+        self.save_dir = save_dir
         
+        mount_drive(self.save_dir)
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
         
         np.random.seed(42)
     
     def fetch_and_calculate(self):
+        import yfinance as yf
         sol = yf.Ticker(self.ticker)
         df = sol.history(period="2y", interval="1d")[['Close']]
         df.columns = ['price']
@@ -39,11 +51,9 @@ class SOLVaRCalculator:
         portfolio_changes = self.portfolio_value * (np.exp(random_returns) - 1)
         
         losses = -portfolio_changes
-        var_95 = np.percentile(losses, 95)
-        var_99 = np.percentile(losses, 99)
-        
-        cvar_95 = np.mean(losses[losses >= var_95])
-        cvar_99 = np.mean(losses[losses >= var_99])
+        tails = tail_metrics(losses, (0.95, 0.99))
+        var_95, cvar_95 = tails[0.95]['var'], tails[0.95]['cvar']
+        var_99, cvar_99 = tails[0.99]['var'], tails[0.99]['cvar']
         
         prob_loss = (np.sum(portfolio_changes < 0) / self.num_simulations) * 100
         
@@ -66,66 +76,84 @@ class SOLVaRCalculator:
             }
         }
     
-    def plot_and_save(self, data):
-        fig, axes = plt.subplots(2, 3, figsize=(15, 10))
-        
-        axes[0,0].plot(data['df'].index, data['df']['price'], 'b-', linewidth=1)
-        axes[0,0].set_title('SOL-USD Price History')
-        axes[0,0].set_xlabel('Date')
-        axes[0,0].set_ylabel('Price (USD)')
-        axes[0,0].grid(True, alpha=0.3)
-        
-        axes[0,1].hist(data['returns'], bins=50, alpha=0.7, color='g', edgecolor='black')
-        axes[0,1].set_title('Daily Returns Distribution')
-        axes[0,1].set_xlabel('Returns')
-        axes[0,1].grid(True, alpha=0.3)
+    def load_returns(self, tickers):
+        """各 ticker 對齊後的日對數報酬 (欄位順序同 tickers)"""
+        import yfinance as yf
+        closes = yf.download(list(tickers), period="2y", interval="1d", progress=False)['Close']
+        closes = closes.to_frame(tickers[0]) if isinstance(closes, pd.Series) else closes[list(tickers)]
+        closes = closes.dropna()
+        return np.log(closes / closes.shift(1)).dropna()
+    
+    def calculate_portfolio_var(self, positions, horizons=(1, 10, 30), distribution='t',
+                                num_paths=10_000_000, df=4.0):
+        """多資產、多期間 Monte Carlo VaR
+
+        positions: {ticker: 持倉金額 USD}, 例如 {'SOL-USD': 60000, 'BTC-USD': 40000}
+        distribution: 'normal' / 't' / 'bootstrap'
+        """
+        tickers = list(positions)
+        returns = self.load_returns(tickers)
         
-        axes[0,2].hist(data['portfolio_changes'], bins=100, alpha=0.7, color='orange', edgecolor='black')
-        axes[0,2].axvline(0, color='r', linestyle='--', linewidth=2, label='Break-even')
-        axes[0,2].axvline(-data['var']['95']['value'], color='b', linestyle='--', label='95% VaR')
-        axes[0,2].axvline(-data['var']['99']['value'], color='purple', linestyle='--', label='99% VaR')
-        axes[0,2].set_title(f'Monte Carlo ({self.num_simulations:,} simulations)')
-        axes[0,2].set_xlabel('Portfolio Change (USD)')
-        axes[0,2].legend()
-        axes[0,2].grid(True, alpha=0.3)
+        engine = ScenarioEngine(returns.values, distribution=distribution, df=df, horizons=horizons)
+        var = engine.run([positions[t] for t in tickers], n_paths=num_paths)
         
-        sorted_changes = np.sort(data['portfolio_changes'])
-        cumulative = np.arange(1, len(sorted_changes) + 1) / len(sorted_changes)
-        axes[1,0].plot(sorted_changes, cumulative, 'b-', linewidth=2)
-        axes[1,0].axhline(0.05, color='orange', linestyle='--', alpha=0.7, label='5%')
-        axes[1,0].axhline(0.01, color='r', linestyle='--', alpha=0.7, label='1%')
-        axes[1,0].set_title('Cumulative Distribution')
-        axes[1,0].set_xlabel('Portfolio Change (USD)')
-        axes[1,0].legend()
-        axes[1,0].grid(True, alpha=0.3)
+        return {
+            'positions': positions,
+            'distribution': distribution,
+            'paths': num_paths,
+            'observations': len(returns),
+            'correlation': returns.corr().round(4).to_dict(),
+            'var': var
+        }
+    
+    def run_batch(self, books, horizons=(1, 10, 30), levels=(0.95, 0.99), distribution='t',
+                  num_paths=10_000_000, df=4.0, workers=None, scratch_dir=None):
+        """批次模式: 價格只下載一次, 情境矩陣只產生一次 (memmap), 所有核心平行評估
+
+        books: {名稱: {ticker: 持倉金額 USD}}; 不同規模的同一組合直接列為不同 book
+        scratch_dir: 情境 memmap 的暫存目錄 (預設為系統暫存目錄); 數 GB 且多個 process 同時讀寫,
+        要放本機磁碟, 不要放 save_dir (Google Drive)
+        回傳一張 DataFrame (portfolio, horizon, level, var, var_pct, cvar, prob_loss) 並存成 CSV
+        """
+        tickers = sorted({t for book in books.values() for t in book})
+        returns = self.load_returns(tickers)
+        engine = ScenarioEngine(returns.values, distribution=distribution, df=df, horizons=horizons)
         
-        stats.probplot(data['returns'], dist="norm", plot=axes[1,1])
-        axes[1,1].set_title('Q-Q Plot')
-        axes[1,1].grid(True, alpha=0.3)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        fd, scenario_path = tempfile.mkstemp(prefix='SOL_VaR_scenarios_', suffix='.npy', dir=scratch_dir)
+        os.close(fd)
         
-        axes[1,2].axis('off')
-        summary = f"""VaR Analysis Results
-{'='*25}
-Portfolio: ${self.portfolio_value:,.0f}
-
-95% VaR: ${data['var']['95']['value']:,.2f}
-        ({data['var']['95']['pct']:.2f}%)
-95% CVaR: ${data['var']['95']['cvar']:,.2f}
-
-99% VaR: ${data['var']['99']['value']:,.2f}
-        ({data['var']['99']['pct']:.2f}%)
-99% CVaR: ${data['var']['99']['cvar']:,.2f}
-
-Loss Probability: {data['var']['prob_loss']:.1f}%"""
+        portfolios = {name: [book.get(t, 0.0) for t in tickers] for name, book in books.items()}
+        try:
+            generate_scenarios(engine, scenario_path, num_paths, workers=workers)
+            table = evaluate_portfolios(scenario_path, portfolios, engine.horizons, levels, workers=workers)
+        finally:
+            os.remove(scenario_path)
         
-        axes[1,2].text(0.1, 0.5, summary, fontsize=11, family='monospace', verticalalignment='center')
+        csv_path = f'{self.save_dir}/SOL_VaR_batch_{timestamp}.csv'
+        table.to_csv(csv_path, index=False)
+        print(f"{len(books)} 個投資組合 × {len(engine.horizons)} 期間 × {len(levels)} 信賴水準 已儲存至: {csv_path}")
+        return table
+    
+    def backtest(self, period="5y", window=250, levels=(0.95, 0.99), methods=('historical', 'ewma', 'montecarlo')):
+        """滾動回測: 每天以前 window 天的報酬預測 VaR/CVaR, 並做 Kupiec / Christoffersen 檢定"""
+        import yfinance as yf
+        from var_backtest import backtest
+        df = yf.Ticker(self.ticker).history(period=period, interval="1d")[['Close']].dropna()
+        returns = np.log(df['Close'] / df['Close'].shift(1)).dropna()
         
-        plt.tight_layout()
+        forecasts, summary = backtest(returns, self.portfolio_value, methods=methods, window=window,
+                                      levels=levels, num_simulations=self.num_simulations)
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        fig_path = f'{self.save_dir}/SOL_VaR_{timestamp}.png'
-        plt.savefig(fig_path, dpi=100, bbox_inches='tight')
-        plt.show()
+        summary.to_csv(f'{self.save_dir}/SOL_VaR_backtest_{timestamp}.csv', index=False)
+        pd.concat(forecasts, axis=1).to_csv(f'{self.save_dir}/SOL_VaR_backtest_daily_{timestamp}.csv')
+        print(summary.round(4).to_string(index=False))
+        return forecasts, summary
+    
+    def save_results(self, data):
+        """只輸出 JSON / TXT 報告, 另存繪圖所需陣列 (.npz) 供之後 render 使用"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         save_data = {
             'portfolio_value': self.portfolio_value,
@@ -141,6 +169,12 @@ Loss Probability: {data['var']['prob_loss']:.1f}%"""
         with open(json_path, 'w') as f:
             json.dump(save_data, f, indent=2)
         
+        np.savez(f'{self.save_dir}/SOL_VaR_{timestamp}.npz',
+                 dates=data['df'].index.values.astype('datetime64[ns]').astype(np.int64),
+                 price=data['df']['price'].values,
+                 returns=np.asarray(data['returns'], dtype=np.float64),
+                 portfolio_changes=data['portfolio_changes'])
+        
         report = f"""
 SOL VaR 分析報告
 ================
@@ -173,11 +207,117 @@ SOL VaR 分析報告
         print(report)
         print(f"\n檔案已儲存至: {self.save_dir}/")
         
+        return json_path, report_path
+    
+    @staticmethod
+    def load_results(json_path):
+        """讀回 save_results 的輸出, 組成 plot 所需的 data"""
+        with open(json_path) as f:
+            saved = json.load(f)
+        arrays = np.load(os.path.splitext(json_path)[0] + '.npz')
+        index = pd.to_datetime(arrays['dates'], utc=True)
+        var = {'95': saved['var_95'], '99': saved['var_99'], 'prob_loss': saved['probability_of_loss']}
+        data = {
+            'df': pd.DataFrame({'price': arrays['price']}, index=index),
+            'returns': pd.Series(arrays['returns'], index=index[1:]),
+            'portfolio_changes': arrays['portfolio_changes'],
+            'stats': saved['statistics'],
+            'var': var
+        }
+        return saved, data
+    
+    @classmethod
+    def render(cls, json_path, show=False):
+        """繪圖階段: 由已儲存的結果產生 PNG, 可在計算完成後另外執行"""
+        import matplotlib
+        if not show:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from scipy import stats
+        
+        saved, data = cls.load_results(json_path)
+        portfolio_value = saved['portfolio_value']
+        num_simulations = saved['simulations']
+        
+        fig, axes = plt.subplots(2, 3, figsize=(15, 10))
+        
+        axes[0,0].plot(data['df'].index, data['df']['price'], 'b-', linewidth=1)
+        axes[0,0].set_title('SOL-USD Price History')
+        axes[0,0].set_xlabel('Date')
+        axes[0,0].set_ylabel('Price (USD)')
+        axes[0,0].grid(True, alpha=0.3)
+        
+        axes[0,1].hist(data['returns'], bins=50, alpha=0.7, color='g', edgecolor='black')
+        axes[0,1].set_title('Daily Returns Distribution')
+        axes[0,1].set_xlabel('Returns')
+        axes[0,1].grid(True, alpha=0.3)
+        
+        axes[0,2].hist(data['portfolio_changes'], bins=100, alpha=0.7, color='orange', edgecolor='black')
+        axes[0,2].axvline(0, color='r', linestyle='--', linewidth=2, label='Break-even')
+        axes[0,2].axvline(-data['var']['95']['value'], color='b', linestyle='--', label='95% VaR')
+        axes[0,2].axvline(-data['var']['99']['value'], color='purple', linestyle='--', label='99% VaR')
+        axes[0,2].set_title(f'Monte Carlo ({num_simulations:,} simulations)')
+        axes[0,2].set_xlabel('Portfolio Change (USD)')
+        axes[0,2].legend()
+        axes[0,2].grid(True, alpha=0.3)
+        
+        sorted_changes = np.sort(data['portfolio_changes'])
+        cumulative = np.arange(1, len(sorted_changes) + 1) / len(sorted_changes)
+        axes[1,0].plot(sorted_changes, cumulative, 'b-', linewidth=2)
+        axes[1,0].axhline(0.05, color='orange', linestyle='--', alpha=0.7, label='5%')
+        axes[1,0].axhline(0.01, color='r', linestyle='--', alpha=0.7, label='1%')
+        axes[1,0].set_title('Cumulative Distribution')
+        axes[1,0].set_xlabel('Portfolio Change (USD)')
+        axes[1,0].legend()
+        axes[1,0].grid(True, alpha=0.3)
+        
+        stats.probplot(data['returns'], dist="norm", plot=axes[1,1])
+        axes[1,1].set_title('Q-Q Plot')
+        axes[1,1].grid(True, alpha=0.3)
+        
+        axes[1,2].axis('off')
+        summary = f"""VaR Analysis Results
+{'='*25}
+Portfolio: ${portfolio_value:,.0f}
+
+95% VaR: ${data['var']['95']['value']:,.2f}
+        ({data['var']['95']['pct']:.2f}%)
+95% CVaR: ${data['var']['95']['cvar']:,.2f}
+
+99% VaR: ${data['var']['99']['value']:,.2f}
+        ({data['var']['99']['pct']:.2f}%)
+99% CVaR: ${data['var']['99']['cvar']:,.2f}
+
+Loss Probability: {data['var']['prob_loss']:.1f}%"""
+        
+        axes[1,2].text(0.1, 0.5, summary, fontsize=11, family='monospace', verticalalignment='center')
+        
+        plt.tight_layout()
+        
+        fig_path = os.path.splitext(json_path)[0] + '.png'
+        plt.savefig(fig_path, dpi=100, bbox_inches='tight')
+        if show:
+            plt.show()
+        plt.close(fig)
+        
+        return fig_path
+    
+    def plot_and_save(self, data):
+        json_path, report_path = self.save_results(data)
+        fig_path = self.render(json_path, show=True)
         return fig_path, json_path, report_path
     
-    def run(self):
+    def run(self, headless=False):
+        """headless=True 只計算並輸出 JSON / TXT (不載入 matplotlib), 之後可用 render(json_path) 繪圖"""
         data = self.fetch_and_calculate()
+        if headless:
+            return self.save_results(data)
         return self.plot_and_save(data)
 
-calculator = SOLVaRCalculator(portfolio_value=100000, num_simulations=50000)
-fig_path, json_path, report_path = calculator.run()
+if __name__ == "__main__":
+    import sys
+    calculator = SOLVaRCalculator(portfolio_value=100000, num_simulations=50000)
+    if '--headless' in sys.argv:
+        json_path, report_path = calculator.run(headless=True)
+    else:
+        fig_path, json_path, report_path = calculator.run()
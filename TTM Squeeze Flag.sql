@@ -1,8 +1,18 @@
-WITH d AS (
+WITH wm AS (
+  SELECT MAX(bucket) + interval '1' day AS next_day
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol='SOL'
+),
+d AS (
+  SELECT CAST(bucket AS date) AS day, low, high, close
+  FROM dune.abbysuyuyan.result_ohlc_1d
+  WHERE symbol='SOL' AND bucket >= current_date - interval '120' day
+  UNION ALL
   SELECT CAST(date_trunc('day', minute) AS date) AS day,
          MIN(price) AS low, MAX(price) AS high, max_by(price, minute) AS close
   FROM prices.usd
   WHERE symbol='SOL' AND minute >= current_date - interval '120' day
+    AND minute >= COALESCE((SELECT next_day FROM wm), current_date - interval '120' day)
   GROUP BY 1
 ),
 win AS (
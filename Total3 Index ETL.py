@@ -1,87 +1,214 @@
-from google.colab import drive
 import os
 
-drive.mount('/content/drive')
-
-output_folder = '/content/drive/My Drive/crypto_analysis'
-
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-    print(f"Created folder: {output_folder}")
-else:
-    print(f"Folder already exists: {output_folder}")
+output_folder = os.environ.get('TOTAL3_DIR', '/content/drive/My Drive/crypto_analysis')
 
 import requests
+import sqlite3
+import heapq
+import threading
 import pandas as pd
-import matplotlib.pyplot as plt
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+COINGECKO = os.environ.get('COINGECKO_BASE_URL', 'https://api.coingecko.com/api/v3').rstrip('/')
+DB_PATH = os.path.join(output_folder, 'total3.db')
+TOP_N = 200              # 每天依當天市值取前 N 個 altcoin
+EXCLUDE = {'bitcoin', 'ethereum'}
+BACKFILL_DAYS = 180
+BACKFILL_UNIVERSE = 2    # 回補候選池 = 今日前 TOP_N * 2 個幣, 過去每天再從中依當天市值選前 TOP_N
+GAP_UNIVERSE = 1.1       # 補少數漏跑日期時的候選池 (market_chart 只能逐幣請求)
+MARKETS_PAGE = 250       # /coins/markets 每頁上限
+MAX_WORKERS = 4
+REQUEST_INTERVAL = 2.5   # CoinGecko 免費額度: 兩次請求至少間隔(秒)
+RETRIES = 5              # 429 / 5xx / 連線錯誤的重試次數
+RETRY_BACKOFF = 5.0      # 第一次重試前等待(秒), 之後每次加倍; 回應有 Retry-After 時依其秒數
+
+try:
+    from http_cache import CachedSession
+    # market_chart 為日資料, 6 小時內重跑直接讀快取, 也不用再等 2.5 秒
+    http = CachedSession(ttls={'/market_chart': 6 * 3600, '/coins/markets': 300},
+                         min_interval={COINGECKO.split('/')[2]: REQUEST_INTERVAL})
+except ImportError:
+    http = None
+
+_request_lock = threading.Lock()
+_next_request = [0.0]
+
+def _get(url, params):
+    if http is not None:
+        return http.get(url, params=params, timeout=60)
+    # 沒有快取時仍維持請求間隔 (多執行緒共用)
+    with _request_lock:
+        wait = _next_request[0] - time.monotonic()
+        _next_request[0] = max(time.monotonic(), _next_request[0]) + REQUEST_INTERVAL
+    if wait > 0:
+        time.sleep(wait)
+    return requests.get(url, params=params, timeout=60)
+
+def fetch_json(url, params, retries=RETRIES):
+    """GET JSON; 429 / 5xx / 連線錯誤以指數退避重試, 用完仍失敗時拋出例外"""
+    for attempt in range(retries):
+        try:
+            response = _get(url, params)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            if attempt == retries - 1 or (status is not None and status != 429 and status < 500):
+                raise
+            retry_after = e.response.headers.get('Retry-After', '') if e.response is not None else ''
+            delay = float(retry_after) if retry_after.isdigit() else RETRY_BACKOFF * 2 ** attempt
+            print(f"{url}: {e}, retrying in {delay:.0f}s")
+            time.sleep(delay)
 
 def fetch_coin_market_cap_data(coin_id, vs_currency='usd', days=180):
-    """Fetches historical market cap data for a given cryptocurrency from CoinGecko API."""
-    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart"
+    """Fetches historical market cap data for a given cryptocurrency from CoinGecko API.
+
+    回傳 None 代表重試後仍失敗 (與「沒有資料」的空 DataFrame 區分), 呼叫端不能把它當成市值為 0。
+    """
+    url = f"{COINGECKO}/coins/{coin_id}/market_chart"
     params = {'vs_currency': vs_currency, 'days': days, 'interval': 'daily'}
-    
+
     try:
-        time.sleep(2.5) 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
+        data = fetch_json(url, params)
+
         market_caps = data['market_caps']
         df = pd.DataFrame(market_caps, columns=['timestamp', 'market_cap'])
-        df['date'] = pd.to_datetime(df['timestamp'], unit='ms').dt.date
-        
-        return df[['date', 'market_cap']]
-    
+        df['date'] = pd.to_datetime(df['timestamp'], unit='ms').dt.strftime('%Y-%m-%d')
+
+        return df[['date', 'market_cap']].drop_duplicates('date', keep='last')
+
     except requests.exceptions.RequestException as e:
+        if e.response is not None and e.response.status_code == 404:
+            return pd.DataFrame()
         print(f"Error fetching data for {coin_id}: {e}")
-        return pd.DataFrame()
-
-def analyze_crypto_market_revised():
-    print("Fetching historical data for a select group of major coins...")
-    
-    coins_to_fetch = ['bitcoin', 'ethereum', 'solana', 'ripple', 'dogecoin']
-    
-    all_data = []
-    for coin_id in coins_to_fetch:
-        df = fetch_coin_market_cap_data(coin_id, days=180)
-        if not df.empty:
-            df['coin_id'] = coin_id
-            all_data.append(df)
-    
-    if not all_data:
-        print("Failed to fetch data for any coins. Aborting.")
-        return
-
-    full_df = pd.concat(all_data)
-    
-    pivoted_df = full_df.pivot_table(index='date', columns='coin_id', values='market_cap')
-    pivoted_df = pivoted_df.fillna(0)
-    
-    if 'bitcoin' not in pivoted_df.columns:
-        print("Error: Could not fetch Bitcoin data. Aborting.")
-        return
-
-    btc_market_cap = pivoted_df['bitcoin']
-    
-    altcoin_cols = [col for col in pivoted_df.columns if col not in ['bitcoin', 'ethereum']]
-    altcoin_market_cap = pivoted_df[altcoin_cols].sum(axis=1)
-
-    ratio_df = pd.DataFrame({
-        'date': btc_market_cap.index,
-        'altcoin_to_btc_ratio': altcoin_market_cap / btc_market_cap
-    }).dropna()
-
-    csv_filename = "altcoin_to_btc_ratio.csv"
-    csv_path = os.path.join(output_folder, csv_filename)
-    output_df = ratio_df.copy()
-    output_df.rename(columns={'date': 'Date', 'altcoin_to_btc_ratio': 'AltcoinToBTCRatio'}, inplace=True)
-    output_df.to_csv(csv_path, index=False)
+        return None
+
+def fetch_markets(count, vs_currency='usd'):
+    """目前市值前 count 名 {coin_id: market_cap}; 每頁 250 個, 各頁平行抓取"""
+    pages = range(1, -(-count // MARKETS_PAGE) + 1)
+    params = lambda page: {'vs_currency': vs_currency, 'order': 'market_cap_desc',
+                           'per_page': MARKETS_PAGE, 'page': page, 'sparkline': 'false'}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        results = pool.map(lambda p: fetch_json(f"{COINGECKO}/coins/markets", params(p)), pages)
+        rows = [row for page in results for row in page]
+    return {row['id']: row['market_cap'] for row in rows[:count] if row.get('market_cap')}
+
+def open_db(path=DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS caps (
+        date TEXT, coin_id TEXT, market_cap REAL,
+        PRIMARY KEY (date, coin_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS constituents (
+        date TEXT, coin_id TEXT, rank INTEGER,
+        PRIMARY KEY (date, coin_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS total3 (
+        date TEXT PRIMARY KEY,
+        btc_market_cap REAL,
+        alt_market_cap REAL,
+        constituents INTEGER,
+        added INTEGER,
+        removed INTEGER,
+        altcoin_to_btc_ratio REAL,
+        provisional INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(total3)")]
+    if 'provisional' not in columns:
+        # 舊資料庫: 最後一天是當日 /coins/markets 快照, 標成 provisional 讓下次 update 以 market_chart 重算
+        with conn:
+            conn.execute("ALTER TABLE total3 ADD COLUMN provisional INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE total3 SET provisional = 1 WHERE date = (SELECT MAX(date) FROM total3)")
+    return conn
+
+def index_day(conn, date, caps, top_n=TOP_N, provisional=False):
+    """寫入單日: 當天前 top_n 個 altcoin (point-in-time 成分) 與 Total3/BTC 比值
+
+    只讀前一天的成分名單計算進出, 不動其他日期; 成本為 O(幣數 log top_n)。
+    provisional=True 為盤中快照, UTC 日收盤後由 update() 以 market_chart 重寫。
+    """
+    btc = caps.get('bitcoin')
+    if not btc:
+        return None
+    alts = heapq.nlargest(top_n, ((cap, coin) for coin, cap in caps.items()
+                                  if coin not in EXCLUDE and cap and cap > 0))
+    members = {coin for _, coin in alts}
+    prev = {row[0] for row in conn.execute(
+        "SELECT coin_id FROM constituents WHERE date = (SELECT MAX(date) FROM constituents WHERE date < ?)",
+        (date,))}
+    alt_cap = sum(cap for cap, _ in alts)
+    row = (date, btc, alt_cap, len(alts), len(members - prev) if prev else 0,
+           len(prev - members) if prev else 0, alt_cap / btc, int(provisional))
+
+    with conn:
+        conn.execute("DELETE FROM caps WHERE date = ?", (date,))
+        conn.executemany("INSERT INTO caps VALUES (?, ?, ?)",
+                         [(date, coin, cap) for coin, cap in caps.items() if cap])
+        conn.execute("DELETE FROM constituents WHERE date = ?", (date,))
+        conn.executemany("INSERT INTO constituents VALUES (?, ?, ?)",
+                         [(date, coin, rank) for rank, (_, coin) in enumerate(alts, 1)])
+        conn.execute("INSERT OR REPLACE INTO total3 VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+    return row
+
+def backfill(conn, days, top_n=TOP_N, after=None, before=None, universe_factor=BACKFILL_UNIVERSE):
+    """以 market_chart 回補 after < date < before 的每日成分與比值 (候選池平行抓取)
+
+    候選池中任何一個幣抓取失敗就整批放棄 (RuntimeError), 不寫入少了成分的日期;
+    已成功的請求留在 http_cache, 重跑時只補失敗的幣。
+    """
+    universe = fetch_markets(int(top_n * universe_factor) + len(EXCLUDE))
+    coins = ['bitcoin'] + [c for c in universe if c not in EXCLUDE]
+    print(f"Backfilling {days} days for {len(coins)} coins...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        frames = list(pool.map(lambda c: fetch_coin_market_cap_data(c, days=days), coins))
+    failed = [coin for coin, df in zip(coins, frames) if df is None]
+    if failed:
+        raise RuntimeError(f"market_chart failed for {len(failed)} coins ({', '.join(failed[:5])}"
+                           f"{', ...' if len(failed) > 5 else ''}); backfill aborted, nothing written")
+
+    by_date = {}
+    for coin, df in zip(coins, frames):
+        for date, cap in zip(df.get('date', []), df.get('market_cap', [])):
+            by_date.setdefault(date, {})[coin] = cap
+    written = 0
+    for date in sorted(by_date):
+        if (after and date <= after) or (before and date >= before):
+            continue
+        if index_day(conn, date, by_date[date], top_n):
+            written += 1
+    return written
+
+def update(conn, top_n=TOP_N):
+    """每日增量: 缺漏與 provisional 的日期用 market_chart (00:00 UTC) 回補, 今天用一次 /coins/markets 快照
+
+    今天的列標成 provisional; 日子收盤後的下一次 update 會以與歷史相同的 market_chart 數據重寫。
+    """
+    today = datetime.now(timezone.utc).date()
+    last = conn.execute("SELECT MAX(date) FROM total3 WHERE provisional = 0").fetchone()[0]
+    if last is None:
+        backfill(conn, BACKFILL_DAYS, top_n, before=today.isoformat())
+    elif last < (today - timedelta(days=1)).isoformat():
+        gap = (today - datetime.fromisoformat(last).date()).days
+        backfill(conn, gap + 1, top_n, after=last, before=today.isoformat(), universe_factor=GAP_UNIVERSE)
+
+    caps = fetch_markets(top_n + len(EXCLUDE) + 10)
+    return index_day(conn, today.isoformat(), caps, top_n, provisional=True)
+
+def export(conn):
+    ratio_df = pd.read_sql_query("SELECT date AS Date, altcoin_to_btc_ratio AS AltcoinToBTCRatio FROM total3 ORDER BY date", conn)
+    csv_path = os.path.join(output_folder, "altcoin_to_btc_ratio.csv")
+    ratio_df.to_csv(csv_path, index=False)
     print(f"Data saved to {csv_path}")
+    return ratio_df
 
+def plot(output_df):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 7))
-    plt.plot(output_df['Date'], output_df['AltcoinToBTCRatio'])
+    plt.plot(pd.to_datetime(output_df['Date']), output_df['AltcoinToBTCRatio'])
     plt.title('Total3 Index', fontsize=16)
     plt.xlabel('Date', fontsize=12)
     plt.ylabel('Altcoin / BTC ', fontsize=12)
@@ -93,5 +220,30 @@ def analyze_crypto_market_revised():
     print(f"Plot saved to {plot_path}")
     plt.show()
 
+def analyze_crypto_market_revised(top_n=TOP_N, render=True):
+    print(f"Updating Total3 index (top {top_n} altcoins)...")
+    os.makedirs(output_folder, exist_ok=True)
+    conn = open_db()
+    try:
+        try:
+            row = update(conn, top_n)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            print(f"Error: {e}. Rerun later to fill the missing days.")
+            return
+        if row is None:
+            print("Error: Could not fetch Bitcoin data. Aborting.")
+            return
+        print(f"{row[0]}: {row[3]} constituents (+{row[4]} / -{row[5]}), ratio {row[6]:.4f} (provisional)")
+        output_df = export(conn)
+    finally:
+        conn.close()
+    if render:
+        plot(output_df)
+
 if __name__ == "__main__":
+    try:
+        from google.colab import drive
+        drive.mount('/content/drive')
+    except ImportError:
+        pass
     analyze_crypto_market_revised()
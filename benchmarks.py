@@ -0,0 +1,671 @@
+"""Benchmarks for the SOL risk monitor.
+
+    python benchmarks.py                          # 10k / 100k / 1M rows
+    python benchmarks.py --rows 10000 10000000    # up to 10M rows
+    python benchmarks.py --rules                  # alert rule engine: instruments x rules
+    python benchmarks.py --alerts                 # e-mail alerts against a local SMTP stand-in
+    python benchmarks.py --suite --save base.json # hot-path suite (asv style), results as JSON
+    python benchmarks.py --suite etl.* --compare base.json   # only the ETLs, flag regressions
+
+check_alerts: per-cycle alert evaluation time as market_data history grows.
+"legacy" is the old path (two pd.read_sql_query scans of the statistics window
+per cycle); "rolling" is the current check_alerts on the in-memory rolling
+statistics, measured after the one-time seed from the database.
+
+rules: one RuleEngine.evaluate() over the latest metrics of every instrument
+against hundreds of generated rules (depth bands, imbalance, slippage,
+crossings), i.e. the cost of a cycle as rules and instruments grow.
+
+alerts: time the monitor loop is blocked per alert and alert-to-delivery
+latency. "legacy" opens a new SMTP connection per alert inside the loop (the
+old send_alert); "dispatcher" is AlertDispatcher (queue, one reused
+connection, digests). The stand-in server adds a fixed delay per connection
+(TCP + TLS + AUTH handshake) and per message.
+
+suite: calculate_market_depth on synthetic order books, check_alerts, a full
+run_cycle, SOLVaRCalculator.fetch_and_calculate (yfinance replaced by a
+synthetic 2-year price history), the DefiLlama / CoinGecko ETLs and the replay
+harness. HTTP goes through MockHTTPAdapter (a requests transport adapter that
+serves generated JSON), so nothing touches the network and the timings are
+client-side work only. Each benchmark is set up once, run once to warm up,
+then timed --repeat times; times are per operation. --compare exits non-zero
+when a median is more than --threshold slower than the saved baseline.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import types
+import zlib
+import fnmatch
+import datetime
+import platform
+import itertools
+import contextlib
+import sqlite3
+import logging
+import smtplib
+import argparse
+import threading
+import socketserver
+import tempfile
+import importlib.util
+from email.mime.text import MIMEText
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+import pandas as pd
+import requests
+
+import sol_monitor as mon
+from sol_monitor_alerts import AlertDispatcher, RuleEngine
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(name: str, path: str):
+    """Import a repo script under `name` (for filenames that are not valid module names)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_monitor(mon, workdir: str):
+    """SOLMonitor on a scratch database, with e-mail alerts and indicators (network seed) disabled."""
+    mon.Config.INDICATORS = False
+    mon.Config.DB_PATH = os.path.join(workdir, "sol_risk.db")
+    mon.Config.LOG_PATH = os.path.join(workdir, "sol_risk.log")
+    mon.Config.HTTP_CACHE_DIR = os.path.join(workdir, "http_cache")
+    mon.Config.ARCHIVE_DIR = os.path.join(workdir, "market_archive")
+    monitor = mon.SOLMonitor({'sender_email': '', 'sender_password': '', 'recipients': []})
+    monitor.logger.setLevel(logging.WARNING)
+    monitor.send_alert = lambda *args, **kwargs: None
+    return monitor
+
+
+def synthetic_market_data(rows: int, end: int, seed: int = 7):
+    """One row per second ending at `end`: random-walk price, lognormal depth."""
+    rng = np.random.default_rng(seed)
+    ts = np.arange(end - rows + 1, end + 1, dtype=np.int64)
+    price = 150 * np.exp(np.cumsum(rng.normal(0, 0.0005, rows)))
+    depth = rng.lognormal(np.log(2e6), 0.3, rows)
+    spread = rng.uniform(0.5, 5, rows)
+    return ts, price, depth, spread
+
+
+def build_database(path: str, rows: int, end: int, batch: int = 500000):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS market_data (
+        timestamp INTEGER PRIMARY KEY, price REAL, volume_24h REAL, change_24h REAL,
+        bid_depth REAL, ask_depth REAL, total_depth REAL, spread_bps REAL, source TEXT
+    )""")
+    ts, price, depth, spread = synthetic_market_data(rows, end)
+    for start in range(0, rows, batch):
+        sl = slice(start, start + batch)
+        conn.executemany(
+            "INSERT INTO market_data VALUES (?, ?, 0, 1.5, ?, ?, ?, ?, 'bench')",
+            zip(ts[sl].tolist(), price[sl].tolist(), (depth[sl] / 2).tolist(),
+                (depth[sl] / 2).tolist(), depth[sl].tolist(), spread[sl].tolist())
+        )
+    conn.commit()
+    conn.close()
+
+
+def legacy_alert_statistics(db_path: str, cutoff: int):
+    """The statistics check_alerts used to compute by rereading the window every cycle."""
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query("SELECT total_depth FROM market_data WHERE timestamp > ?", conn, params=(cutoff,))
+    mean, std = df['total_depth'].mean(), df['total_depth'].std()
+    price_df = pd.read_sql_query("SELECT price FROM market_data WHERE timestamp > ? ORDER BY timestamp",
+                                 conn, params=(cutoff,))
+    realized_vol = np.std(np.diff(np.log(price_df['price'].values))) * np.sqrt(365 * 24 * 12)
+    conn.close()
+    return mean, std, realized_vol
+
+
+def bench_check_alerts(rows: int, cycles: int = 200, legacy_cycles: int = 3):
+    with tempfile.TemporaryDirectory() as workdir:
+        end = int(time.time())
+        mon.Config.STATS_WINDOW = rows + 3600
+        build_database(os.path.join(workdir, "sol_risk.db"), rows, end)
+
+        started = time.perf_counter()
+        monitor = make_monitor(mon, workdir)
+        seed_s = time.perf_counter() - started
+
+        cutoff = int(time.time()) - mon.Config.STATS_WINDOW
+        legacy = []
+        for _ in range(legacy_cycles):
+            started = time.perf_counter()
+            expected = legacy_alert_statistics(mon.Config.DB_PATH, cutoff)
+            legacy.append(time.perf_counter() - started)
+
+        actual = (monitor.depth_stats.mean, monitor.depth_stats.std(),
+                  monitor.return_stats.returns.std(ddof=0) * np.sqrt(365 * 24 * 12))
+        assert np.allclose(actual, expected, rtol=1e-9), (actual, expected)
+
+        rng = np.random.default_rng(0)
+        rolling = []
+        for i in range(cycles):
+            depth_data = {'price': 150 * np.exp(rng.normal(0, 0.0005)), 'total_depth': rng.lognormal(np.log(2e6), 0.3),
+                          'spread_bps': 2.0, 'change_24h': 1.5}
+            started = time.perf_counter()
+            monitor.update_statistics(end + 1 + i, depth_data)
+            monitor.check_alerts(depth_data)
+            rolling.append(time.perf_counter() - started)
+
+    return {
+        'rows': rows,
+        'seed_s': seed_s,
+        'legacy_ms': float(np.median(legacy)) * 1000,
+        'rolling_us': float(np.median(rolling)) * 1e6,
+    }
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """最小的 SMTP stand-in (EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT), 可模擬連線與寄送延遲"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay: float = 0.15, message_delay: float = 0.02):
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.connections = 0
+        self.messages = []
+        super().__init__(('127.0.0.1', 0), LocalSMTPHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class LocalSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        time.sleep(server.connect_delay)
+        self.wfile.write(b"220 localhost stand-in\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif command == b"DATA":
+                self.wfile.write(b"354 end with .\r\n")
+                data = []
+                for line in self.rfile:
+                    if line == b".\r\n":
+                        break
+                    data.append(line)
+                time.sleep(server.message_delay)
+                server.messages.append(b"".join(data))
+                self.wfile.write(b"250 OK\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+def bench_alerts(bursts: int = 10, burst_size: int = 4, gap: float = 0.5):
+    """bursts 次同時觸發 burst_size 種警報: 舊寫法 vs AlertDispatcher"""
+    server = LocalSMTPServer()
+    config = {'sender_email': 'monitor@localhost', 'sender_password': '', 'recipients': ['risk@localhost']}
+    results = {}
+
+    legacy, latencies = [], []
+    for burst in range(bursts):
+        for i in range(burst_size):
+            started = time.perf_counter()
+            msg = MIMEText(f"alert {burst}-{i}")
+            msg['Subject'], msg['From'], msg['To'] = f"SOL Alert: TYPE_{i}", config['sender_email'], 'risk@localhost'
+            smtp = smtplib.SMTP('127.0.0.1', server.port)
+            smtp.send_message(msg)
+            smtp.quit()
+            legacy.append(time.perf_counter() - started)
+            latencies.append(time.perf_counter() - started)
+    results['legacy'] = (legacy, latencies, server.connections, len(server.messages))
+
+    server.connections, server.messages = 0, []
+    with tempfile.TemporaryDirectory() as workdir:
+        monitor = make_monitor(mon, workdir)
+        monitor.alerts.close()
+        dispatcher = AlertDispatcher(monitor.store, config, monitor.logger, digest_window=0.2, cooldown=0,
+                                     smtp_host='127.0.0.1', smtp_port=server.port, smtp_starttls=False)
+        blocked = []
+        for burst in range(bursts):
+            for i in range(burst_size):
+                started = time.perf_counter()
+                dispatcher.send(f"TYPE_{i}", f"alert {burst}-{i}", 1.0, 2.0, timestamp=burst)
+                blocked.append(time.perf_counter() - started)
+            time.sleep(gap)
+        dispatcher.flush()
+        stats = dispatcher.stats()
+        latencies = list(dispatcher.latencies)
+        dispatcher.close()
+        monitor.store.flush()
+        emailed = monitor.store.query("SELECT COUNT(*) FROM alerts WHERE email_sent = 1")[0][0]
+        assert emailed == bursts * burst_size and stats['failed'] == 0, (emailed, stats)
+        monitor.stop()
+    results['dispatcher'] = (blocked, latencies, server.connections, len(server.messages))
+    server.shutdown()
+    return results
+
+
+def generated_rules(mon, n: int, seed: int = 3):
+    """n 條規則, 輪流使用各種 op 與訂單簿指標"""
+    rng = np.random.default_rng(seed)
+    metrics = [f"{side}_depth_{b}bps" for side in ('bid', 'ask') for b in mon.Config.DEPTH_BANDS_BPS]
+    metrics += [f"imbalance_{b}bps" for b in mon.Config.DEPTH_BANDS_BPS]
+    metrics += [f"slippage_{side}_{size}" for side in ('buy', 'sell') for size in mon.Config.SLIPPAGE_SIZES_USD]
+    rules = []
+    for i in range(n):
+        metric = metrics[i % len(metrics)]
+        op = ('<', '>', 'cross_above', 'cross_below')[i % 4]
+        # 門檻落在指標分布的尾端, 大多數週期只有少數規則觸發
+        threshold = {'metric': 'depth_mean', 'offset': 'depth_std', 'k': -float(rng.uniform(3, 5))} \
+            if i % 5 == 0 else float(10 ** rng.uniform(1, 3) if op == '<' else 10 ** rng.uniform(6, 8))
+        rules.append({'name': f'RULE_{i}', 'metric': metric, 'op': op, 'threshold': threshold,
+                      'when': [('depth_samples', '>=', 10)], 'message': '{value} vs {threshold}'})
+    return rules
+
+
+def bench_rules(instruments: int, rules: int, cycles: int = 50):
+    engine = RuleEngine(generated_rules(mon, rules))
+    rng = np.random.default_rng(0)
+    names = [name for name in engine.columns if name]
+    keys = [f"venue{i % 4}:SYM{i}-USDT:perp" for i in range(instruments)]
+    update, evaluate, fired = [], [], 0
+    for _ in range(cycles):
+        values = rng.lognormal(10, 1, (instruments, len(names)))
+        started = time.perf_counter()
+        for key, row in zip(keys, values):
+            engine.update(key, dict(zip(names, row), depth_samples=100))
+        update.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        fired += len(engine.evaluate())
+        evaluate.append(time.perf_counter() - started)
+    return {'instruments': instruments, 'rules': rules, 'metrics': len(names),
+            'update_ms': float(np.median(update)) * 1000, 'evaluate_ms': float(np.median(evaluate)) * 1000,
+            'fired': fired / cycles}
+
+
+# ==================== suite ====================
+SUITE = {}
+DAY = 86400
+SUITE_END = 1767225600          # 2026-01-01 UTC, 合成歷史的最後一天
+
+
+def benchmark(name: str, ops: int = 1):
+    """註冊 suite 成員 (asv 風格): setup(workdir) 回傳被計時的 callable, 每次呼叫做 ops 次操作"""
+    def register(setup):
+        SUITE[name] = (setup, ops)
+        return setup
+    return register
+
+
+class MockHTTPAdapter(requests.adapters.BaseAdapter):
+    """requests 的 transport adapter 替身: 依 URL 路徑回傳合成 JSON, 不連網
+
+    routes 為 [(regex, handler(match, query) -> payload)]; 同一個 URL 的回應只產生一次,
+    之後直接重用編碼好的 bytes, 計時只包含客戶端的請求與解析。
+    """
+
+    def __init__(self, routes, latency: float = 0.0):
+        super().__init__()
+        self.routes = [(re.compile(pattern), handler) for pattern, handler in routes]
+        self.latency = latency
+        self.requests = 0
+        self._bodies = {}
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        body = self._bodies.get(request.url)
+        if body is None:
+            parts = urlsplit(request.url)
+            query = dict(parse_qsl(parts.query))
+            for pattern, handler in self.routes:
+                match = pattern.search(parts.path)
+                if match:
+                    body = self._bodies[request.url] = json.dumps(handler(match, query)).encode()
+                    break
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = 404 if body is None else 200
+        response._content = b'{}' if body is None else body
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def mock_session(adapter: MockHTTPAdapter) -> requests.Session:
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def seeded(*keys) -> np.random.Generator:
+    """同一組 key 永遠產生同樣的合成資料"""
+    return np.random.default_rng(zlib.crc32('/'.join(map(str, keys)).encode()))
+
+
+def synthetic_orderbook(rng: np.random.Generator, mid: float = 150.0, levels: int = 100, tick: float = 0.01):
+    """KuCoin level2 格式 (價格與數量為字串) 的合成訂單簿"""
+    half = tick * rng.integers(1, 5) / 2
+    steps = tick * np.cumsum(rng.integers(1, 3, levels))
+    bids, asks = mid - half - steps, mid + half + steps
+    sizes = rng.lognormal(3, 1, (2, levels))
+    return {'bids': [[f"{p:.2f}", f"{q:.4f}"] for p, q in zip(bids, sizes[0])],
+            'asks': [[f"{p:.2f}", f"{q:.4f}"] for p, q in zip(asks, sizes[1])]}
+
+
+def price_history(days: int, seed: int = 11, start: float = 100.0) -> pd.Series:
+    """日收盤價 (幾何隨機漫步, 日波動約 4%), 結束於 SUITE_END"""
+    rng = np.random.default_rng(seed)
+    index = pd.to_datetime(SUITE_END - DAY * np.arange(days)[::-1], unit='s', utc=True)
+    return pd.Series(start * np.exp(np.cumsum(rng.normal(0.001, 0.04, days))), index=index)
+
+
+def fake_yfinance(days: int = 730) -> types.ModuleType:
+    """yfinance 替身: Ticker(symbol).history() 回傳合成的日 K (只有用到的 Close 欄)"""
+    module = types.ModuleType('yfinance')
+
+    class Ticker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, period='2y', interval='1d'):
+            return price_history(days, seed=zlib.crc32(self.symbol.encode())).to_frame('Close')
+
+    module.Ticker = Ticker
+    return module
+
+
+def monitor_routes():
+    """訂單簿 (KuCoin / Gate.io / MEXC) 與 CoinGecko 價格"""
+    book = lambda match, query: synthetic_orderbook(seeded(match.group(0), *sorted(query.items())))
+    return [
+        (r'/api/v1/market/orderbook/level2_100$', lambda m, q: {'code': '200000', 'data': book(m, q)}),
+        (r'/api/v4/spot/order_book$', book),
+        (r'/api/v3/depth$', book),
+        (r'/api/v3/simple/price$', lambda m, q: {
+            coin: {'usd': 150.0, 'usd_24h_vol': 2.5e9, 'usd_24h_change': 1.5} for coin in q['ids'].split(',')}),
+    ]
+
+
+def defillama_routes(chains: int = 80, protocols: int = 600, days: int = 1500):
+    """/v2/chains, /v2/historicalChainTvl/{chain}, /protocols, /protocol/{slug}"""
+    dates = SUITE_END - DAY * np.arange(days, 0, -1)
+
+    def series(key, field):
+        values = np.exp(np.cumsum(seeded(key).normal(0, 0.03, days))) * 10 ** seeded(key, 'scale').uniform(6, 10)
+        return [{'date': int(d), field: float(v)} for d, v in zip(dates, values)]
+
+    def protocol_list(match, query):
+        rng = seeded('protocols')
+        return [{'name': f"Protocol {i}", 'slug': f"protocol-{i}",
+                 'category': ('Dexes', 'Lending', 'Liquid Staking', 'Yield', 'Derivatives', 'CDP')[i % 6],
+                 'chains': ['Solana', 'Ethereum'] if rng.random() < 0.6 else ['Ethereum']} for i in range(protocols)]
+
+    return [
+        (r'/v2/chains$', lambda m, q: [{'name': f"Chain{i}", 'tvl': 1e11 / (i + 1)} for i in range(chains)]),
+        (r'/v2/historicalChainTvl/([^/]+)$', lambda m, q: series(m.group(1), 'tvl')),
+        (r'/protocols$', protocol_list),
+        (r'/protocol/([^/]+)$', lambda m, q: {'chainTvls': {'Solana': {
+            'tvl': series(m.group(1), 'totalLiquidityUSD')[-int(seeded(m.group(1), 'age').integers(30, days)):]}}}),
+    ]
+
+
+def coingecko_routes(today: datetime.date):
+    """/coins/markets (依市值排序分頁) 與 /coins/{id}/market_chart, 結束於 today"""
+    coin = lambda rank: {1: 'bitcoin', 2: 'ethereum'}.get(rank, f"coin-{rank:04d}")
+    rank_of = lambda coin_id: {'bitcoin': 1, 'ethereum': 2}.get(coin_id) or int(coin_id.split('-')[1])
+    end_ms = int(datetime.datetime.combine(today, datetime.time(), datetime.timezone.utc).timestamp()) * 1000
+
+    def markets(match, query):
+        per_page, page = int(query['per_page']), int(query['page'])
+        return [{'id': coin(rank), 'market_cap': 1.2e12 / rank ** 1.3}
+                for rank in range((page - 1) * per_page + 1, page * per_page + 1)]
+
+    def market_chart(match, query):
+        days, rank = int(query['days']), rank_of(match.group(1))
+        caps = 1.2e12 / rank ** 1.3 * np.exp(np.cumsum(seeded(match.group(1)).normal(0, 0.05, days + 1)))
+        return {'market_caps': [[end_ms - (days - i) * DAY * 1000, float(c)] for i, c in enumerate(caps)]}
+
+    return [(r'/coins/markets$', markets), (r'/coins/([^/]+)/market_chart$', market_chart)]
+
+
+def suite_monitor(workdir: str, history: int = 10000):
+    """make_monitor + 一段 history 秒的 market_data 作為滾動統計的起始"""
+    mon.Config.STATS_WINDOW = history + 3600
+    build_database(os.path.join(workdir, "sol_risk.db"), history, int(time.time()))
+    return mon, make_monitor(mon, workdir)
+
+
+@benchmark('monitor.calculate_market_depth', ops=100)
+def suite_calculate_market_depth(workdir):
+    mon, monitor = suite_monitor(workdir, history=10)
+    rng = np.random.default_rng(1)
+    books = [{'source': 'KuCoin', 'data': synthetic_orderbook(rng, mid=rng.uniform(100, 200))} for _ in range(100)]
+    return lambda: [monitor.calculate_market_depth(book) for book in books]
+
+
+@benchmark('monitor.check_alerts', ops=100)
+def suite_check_alerts(workdir):
+    mon, monitor = suite_monitor(workdir)
+    rng = np.random.default_rng(2)
+    depth = [monitor.calculate_market_depth({'source': 'KuCoin', 'data': synthetic_orderbook(rng)})
+             for _ in range(100)]
+    return lambda: [monitor.check_alerts(depth_data) for depth_data in depth]
+
+
+@benchmark('monitor.run_cycle', ops=20)
+def suite_run_cycle(workdir):
+    """完整週期: 三個來源並行抓訂單簿 + CoinGecko 價格 (mock HTTP) -> 深度 -> 寫入 -> 警報"""
+    mon, monitor = suite_monitor(workdir)
+    adapter = MockHTTPAdapter(monitor_routes())
+    monitor.collector._create_session = lambda: mock_session(adapter)
+    monitor.collector.session = mock_session(adapter)
+    return lambda: [monitor.run_cycle() for _ in range(20)]
+
+
+@benchmark('var.fetch_and_calculate')
+def suite_var(workdir):
+    """Monte Carlo VaR (50k 模擬) 於 2 年合成日 K; yfinance 換成替身"""
+    sys.modules['yfinance'] = fake_yfinance()
+    var = load_script('sol_var', os.path.join(HERE, "SOL-USDT Risk Management.py"))
+    calculator = var.SOLVaRCalculator(portfolio_value=100000, num_simulations=50000,
+                                      save_dir=os.path.join(workdir, "var"))
+    return calculator.fetch_and_calculate
+
+
+def mock_defillama(adapter: MockHTTPAdapter):
+    """pull_defillama_chain_tvl (及 solana_tvl_by_use) 的請求改走 adapter, 不經磁碟快取"""
+    import pull_defillama_chain_tvl as llama
+    llama.CachedSession = None
+    llama.make_session = lambda pool_size=llama.MAX_WORKERS: mock_session(adapter)
+    return llama
+
+
+@benchmark('etl.defillama_chain_tvl')
+def suite_defillama_chain_tvl(workdir):
+    """前 30 條鏈 x 1500 天 TVL 寫入空的 CSV (每次都是完整回補)"""
+    llama = mock_defillama(MockHTTPAdapter(defillama_routes()))
+    runs = itertools.count()
+    today = datetime.datetime.fromtimestamp(SUITE_END, datetime.timezone.utc).date().isoformat()
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            llama.run(out=os.path.join(workdir, f"chain_tvl_{next(runs)}.csv"), rate=1e6, burst=1e6, today=today)
+    return run
+
+
+@benchmark('etl.solana_tvl_by_use')
+def suite_solana_tvl_by_use(workdir):
+    """約 360 個 Solana 協議的 TVL 序列 -> 依 category 分區的 Parquet dataset"""
+    mock_defillama(MockHTTPAdapter(defillama_routes()))
+    import solana_tvl_by_use as tvl
+    runs = itertools.count()
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            tvl.ingest(os.path.join(workdir, f"solana_tvl_{next(runs)}"), rate=1e6, burst=1e6)
+    return run
+
+
+@benchmark('etl.total3_update')
+def suite_total3(workdir):
+    """空資料庫上的 Total3 update: 180 天 market_chart 回補 (前 100 名 x 2 的候選池) + 今日快照"""
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    total3 = load_script('total3_etl', os.path.join(HERE, "Total3 Index ETL.py"))
+    total3.http = mock_session(MockHTTPAdapter(coingecko_routes(today)))
+    runs = itertools.count()
+
+    def run():
+        conn = total3.open_db(os.path.join(workdir, f"total3_{next(runs)}.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            total3.update(conn, top_n=100)
+        conn.close()
+    return run
+
+
+@benchmark('replay.market_data', ops=5000)
+def suite_replay(workdir):
+    """sol_monitor_replay 回放 5000 列 market_data (每列一次 update_statistics + check_alerts)"""
+    from sol_monitor_replay import Replay, synthetic_market_data as replay_data
+    db_path = os.path.join(workdir, "replay_source.db")
+    replay_data(db_path, 5000)
+    runs = itertools.count()
+
+    def run():
+        path = os.path.join(workdir, f"replay_{next(runs)}")
+        os.makedirs(path)
+        replay = Replay(path)
+        replay.run_market_data(db_path)
+        replay.close()
+    return run
+
+
+def run_suite(patterns, repeat: int, workdir: str) -> dict:
+    """每個成員: setup, 暖機一次, 再計時 repeat 次 (結果為每次操作的秒數)"""
+    results = {}
+    for name, (setup, ops) in SUITE.items():
+        if patterns and not any(fnmatch.fnmatch(name, p) or p in name for p in patterns):
+            continue
+        path = os.path.join(workdir, name)
+        os.makedirs(path)
+        run = setup(path)
+        run()
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            times.append((time.perf_counter() - started) / ops)
+        results[name] = {'median': float(np.median(times)), 'min': float(np.min(times)),
+                         'max': float(np.max(times)), 'repeat': repeat, 'ops': ops}
+        print(f"  {name:<32} {format_seconds(results[name]['median']):>10}", file=sys.stderr)
+    return results
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds * 1e9:.0f}ns"
+
+
+def print_suite(results: dict, baseline: dict = None, threshold: float = 0.2) -> list:
+    """結果表; 有 baseline 時加上比值, median 慢超過 threshold 的列為 regression"""
+    regressions = []
+    header = f"{'benchmark':<32} {'median':>10} {'min':>10} {'max':>10} {'ops':>6}"
+    print(header + (f" {'baseline':>10} {'ratio':>7}" if baseline else ""))
+    for name, r in results.items():
+        line = (f"{name:<32} {format_seconds(r['median']):>10} {format_seconds(r['min']):>10} "
+                f"{format_seconds(r['max']):>10} {r['ops']:>6}")
+        if baseline and name in baseline:
+            ratio = r['median'] / baseline[name]['median']
+            line += f" {format_seconds(baseline[name]['median']):>10} {ratio:>6.2f}x"
+            if ratio > 1 + threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--alerts', action='store_true', help='benchmark e-mail alert dispatch')
+    parser.add_argument('--rules', action='store_true', help='benchmark the alert rule engine')
+    parser.add_argument('--suite', nargs='*', metavar='PATTERN',
+                        help='run the benchmark suite (optionally only names matching PATTERN)')
+    parser.add_argument('--repeat', type=int, default=5, help='suite: timed runs per benchmark')
+    parser.add_argument('--save', help='suite: write results as JSON')
+    parser.add_argument('--compare', help='suite: JSON from --save to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='suite: slowdown reported as a regression')
+    args = parser.parse_args()
+
+    if args.suite is not None:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ['HTTP_CACHE_DIR'] = os.path.join(workdir, "http_cache")
+            results = run_suite(args.suite, args.repeat, workdir)
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)['results']
+        regressions = print_suite(results, baseline, args.threshold)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                           'python': platform.python_version(), 'machine': platform.machine(),
+                           'results': results}, f, indent=1)
+        if regressions:
+            sys.exit(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return
+
+    if args.rules:
+        print(f"{'instruments':>12} {'rules':>6} {'metrics':>8} {'update all':>12} {'evaluate':>10} {'fired':>8}")
+        for instruments, rules in ((1, 3), (1, 500), (200, 100), (200, 500), (1000, 1000)):
+            r = bench_rules(instruments, rules)
+            print(f"{r['instruments']:>12} {r['rules']:>6} {r['metrics']:>8} {r['update_ms']:>10.2f}ms "
+                  f"{r['evaluate_ms']:>8.2f}ms {r['fired']:>8.0f}")
+        return
+
+    if args.alerts:
+        results = bench_alerts()
+        print(f"{'alerts':>12} {'blocked p50':>12} {'blocked max':>12} {'latency p50':>12} {'latency p95':>12} "
+              f"{'connections':>12} {'emails':>8}")
+        for name, (blocked, latencies, connections, emails) in results.items():
+            blocked, latencies = np.array(blocked) * 1000, np.array(latencies) * 1000
+            print(f"{name:>12} {np.median(blocked):>10.3f}ms {blocked.max():>10.3f}ms "
+                  f"{np.median(latencies):>10.1f}ms {np.percentile(latencies, 95):>10.1f}ms "
+                  f"{connections:>12} {emails:>8}")
+        return
+
+    print(f"{'rows':>12} {'legacy/cycle':>14} {'rolling/cycle':>14} {'seed (once)':>12}")
+    for rows in args.rows:
+        r = bench_check_alerts(rows)
+        print(f"{r['rows']:>12,} {r['legacy_ms']:>12.1f}ms {r['rolling_us']:>12.1f}us {r['seed_s']:>11.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""Run the repo's DuneSQL (Trino) queries locally on DuckDB.
+
+    python dune_local.py --ingest-kucoin SOL-USDT --symbol SOL --days 120   # minute prices -> local store
+    python dune_local.py --ingest dex_solana.trades trades.parquet          # any exported table
+    python dune_local.py "RSI(14).sql"                                      # run a query file
+    python dune_local.py "SOL - Customized Hour K-Line.sql" --param k_hours=4 --as-of 2025-09-01
+    python dune_local.py --check                                            # dialect corpus: every .sql file
+
+The store is one DuckDB file (DUNE_LOCAL_DB, default ./dune_local.duckdb) with the Dune
+tables the queries read: prices.usd, dex.trades, dex_solana.trades, solana.transactions and
+the dune.abbysuyuyan.* uploads (stored as schema dune_abbysuyuyan). The OHLC rollups
+dune.abbysuyuyan.result_ohlc_1d / _1h are maintained by ohlc_rollup.py.
+
+Dialect shim (applied outside string literals, quoted identifiers and comments):
+- {{param}} templating, values from --param / DEFAULT_PARAMS
+- GREATEST / LEAST keep Trino semantics (NULL if any argument is NULL; DuckDB skips NULLs)
+- date_add(unit, n, ts) in Trino argument order, DATE(x), format() (printf-style), regexp_like
+- from_unixtime / to_unixtime / from_iso8601_timestamp / approx_percentile as macros
+- --as-of pins now() and current_date so results are reproducible on a fixed ingest
+- ORDER BY <expression> after a UNION is moved onto a wrapping SELECT
+- interval '90' day, min_by / max_by, ARRAY_AGG(...)[1], date_trunc and date_diff are
+  accepted by DuckDB as written
+"""
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+from datetime import datetime, timedelta, timezone, date
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STORE = os.environ.get("DUNE_LOCAL_DB", os.path.join(HERE, "dune_local.duckdb"))
+
+DEFAULT_PARAMS = {
+    'k_hours': 4,
+    'k_minutes': 15,
+    'lookback_hours': 72,
+    'project': 'uniswap',
+    'chain': 'ethereum',
+}
+
+TABLES = {
+    'prices.usd': """
+        minute TIMESTAMP NOT NULL, blockchain VARCHAR, contract_address VARCHAR, decimals INTEGER,
+        symbol VARCHAR NOT NULL, price DOUBLE, PRIMARY KEY (symbol, minute)
+    """,
+    'dex.trades': """
+        blockchain VARCHAR, project VARCHAR, version VARCHAR, block_month DATE, block_date DATE,
+        block_time TIMESTAMP, block_number BIGINT, token_bought_symbol VARCHAR, token_sold_symbol VARCHAR,
+        token_pair VARCHAR, token_bought_amount DOUBLE, token_sold_amount DOUBLE, amount_usd DOUBLE,
+        token_bought_address VARCHAR, token_sold_address VARCHAR, taker VARCHAR, maker VARCHAR,
+        project_contract_address VARCHAR, tx_hash VARCHAR, tx_from VARCHAR, tx_to VARCHAR, evt_index BIGINT
+    """,
+    'dex_solana.trades': """
+        blockchain VARCHAR, project VARCHAR, version INTEGER, version_name VARCHAR, block_month DATE,
+        block_date DATE, block_time TIMESTAMP, block_slot BIGINT, trade_source VARCHAR,
+        token_bought_symbol VARCHAR, token_sold_symbol VARCHAR, token_pair VARCHAR,
+        token_bought_amount DOUBLE, token_sold_amount DOUBLE, amount_usd DOUBLE, fee_tier DOUBLE, fee_usd DOUBLE,
+        token_bought_mint_address VARCHAR, token_sold_mint_address VARCHAR, token_bought_vault VARCHAR,
+        token_sold_vault VARCHAR, project_program_id VARCHAR, project_main_id VARCHAR, trader_id VARCHAR,
+        tx_id VARCHAR, outer_instruction_index INTEGER, inner_instruction_index INTEGER, tx_index INTEGER
+    """,
+    'solana.transactions': """
+        block_slot BIGINT, block_time TIMESTAMP, block_date DATE, "index" INTEGER, fee BIGINT,
+        block_hash VARCHAR, error VARCHAR, required_signers VARCHAR[], signatures VARCHAR[], signer VARCHAR,
+        id VARCHAR, success BOOLEAN
+    """,
+    'dune_abbysuyuyan.dataset_defillama_chain_tvl_top30': """
+        day TIMESTAMP, chain VARCHAR, tvl_usd DOUBLE
+    """,
+    'dune_abbysuyuyan.dataset_solana_defillama_protocol_tvl': """
+        day TIMESTAMP, protocol VARCHAR, category VARCHAR, tvl_usd DOUBLE
+    """,
+    # prices.usd 的 OHLC rollup (只含已收盤的 bucket), 由 ohlc_rollup.py 增量維護
+    'dune_abbysuyuyan.result_ohlc_1d': """
+        symbol VARCHAR NOT NULL, bucket TIMESTAMP NOT NULL, open DOUBLE, high DOUBLE, low DOUBLE,
+        close DOUBLE, samples BIGINT, PRIMARY KEY (symbol, bucket)
+    """,
+    'dune_abbysuyuyan.result_ohlc_1h': """
+        symbol VARCHAR NOT NULL, bucket TIMESTAMP NOT NULL, open DOUBLE, high DOUBLE, low DOUBLE,
+        close DOUBLE, samples BIGINT, PRIMARY KEY (symbol, bucket)
+    """,
+}
+
+MACROS = [
+    "trino_greatest(a, b) AS CASE WHEN a IS NULL OR b IS NULL THEN NULL ELSE greatest(a, b) END, "
+    "(a, b, c) AS CASE WHEN a IS NULL OR b IS NULL OR c IS NULL THEN NULL ELSE greatest(a, b, c) END, "
+    "(a, b, c, d) AS CASE WHEN a IS NULL OR b IS NULL OR c IS NULL OR d IS NULL THEN NULL ELSE greatest(a, b, c, d) END",
+    "trino_least(a, b) AS CASE WHEN a IS NULL OR b IS NULL THEN NULL ELSE least(a, b) END, "
+    "(a, b, c) AS CASE WHEN a IS NULL OR b IS NULL OR c IS NULL THEN NULL ELSE least(a, b, c) END, "
+    "(a, b, c, d) AS CASE WHEN a IS NULL OR b IS NULL OR c IS NULL OR d IS NULL THEN NULL ELSE least(a, b, c, d) END",
+    "trino_date_add(unit, n, ts) AS CASE lower(unit) "
+    "WHEN 'year' THEN ts + to_years(CAST(n AS INTEGER)) "
+    "WHEN 'quarter' THEN ts + to_months(CAST(n AS INTEGER) * 3) "
+    "WHEN 'month' THEN ts + to_months(CAST(n AS INTEGER)) "
+    "WHEN 'week' THEN ts + to_days(CAST(n AS INTEGER) * 7) "
+    "WHEN 'day' THEN ts + to_days(CAST(n AS INTEGER)) "
+    "WHEN 'hour' THEN ts + to_hours(CAST(n AS BIGINT)) "
+    "WHEN 'minute' THEN ts + to_minutes(CAST(n AS BIGINT)) "
+    "WHEN 'second' THEN ts + to_seconds(CAST(n AS DOUBLE)) END",
+    "trino_date(x) AS CAST(x AS DATE)",
+    "from_unixtime(x) AS CAST(to_timestamp(x) AS TIMESTAMP)",
+    "to_unixtime(ts) AS epoch(ts)",
+    "from_iso8601_timestamp(s) AS CAST(CAST(s AS TIMESTAMPTZ) AS TIMESTAMP)",
+    "approx_percentile(x, p) AS approx_quantile(x, p)",
+]
+
+# (pattern, replacement) 只作用在字串常值、帶引號的識別字與註解以外的程式碼
+REWRITES = [
+    (re.compile(r'\bdune\.(\w+)\.(\w+)', re.I), r'dune_\1.\2'),
+    (re.compile(r'\bGREATEST\s*\(', re.I), 'trino_greatest('),
+    (re.compile(r'\bLEAST\s*\(', re.I), 'trino_least('),
+    (re.compile(r'\bdate_add\s*\(', re.I), 'trino_date_add('),
+    (re.compile(r'\bDATE\s*\(', re.I), 'trino_date('),
+    (re.compile(r'\bformat\s*\(', re.I), 'printf('),
+    (re.compile(r'\bregexp_like\s*\(', re.I), 'regexp_matches('),
+]
+LITERALS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*)""")
+PARAM = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+def render(sql: str, params: dict = None) -> str:
+    """{{param}} 代入; 缺少的參數直接報錯"""
+    values = dict(DEFAULT_PARAMS, **(params or {}))
+
+    def sub(m):
+        if m.group(1) not in values:
+            raise KeyError(f"Missing query parameter: {m.group(1)}")
+        return str(values[m.group(1)])
+    return PARAM.sub(sub, sql)
+
+
+def _top_level(sql: str) -> str:
+    """遮掉字串、註解與括號內的內容 (等長), 方便找最外層的關鍵字"""
+    masked = LITERALS.sub(lambda m: ' ' * len(m.group(0)), sql)
+    out, depth = [], 0
+    for ch in masked:
+        if ch == '(':
+            depth += 1
+        out.append(ch if depth == 0 else ' ')
+        if ch == ')':
+            depth -= 1
+    return ''.join(out)
+
+
+def _wrap_union_order(sql: str) -> str:
+    """Trino 允許 UNION 後的 ORDER BY 使用任意運算式, DuckDB 只接受輸出欄位: 包成子查詢再排序"""
+    top = _top_level(sql)
+    unions = list(re.finditer(r'\bUNION\b', top, re.I))
+    orders = list(re.finditer(r'\bORDER\s+BY\b', top, re.I))
+    if not unions or not orders or orders[-1].start() < unions[-1].start():
+        return sql
+    order = orders[-1]
+    head, tail = sql[:order.start()].rstrip(), sql[order.end():].strip().rstrip(';')
+    return f"SELECT * FROM (\n{head}\n) AS _union\nORDER BY {tail}"
+
+
+def translate(sql: str, as_of=None) -> str:
+    """DuneSQL -> DuckDB; as_of (datetime) 固定 now() 與 current_date"""
+    rewrites = list(REWRITES)
+    if as_of is not None:
+        rewrites += [
+            (re.compile(r'\bnow\s*\(\s*\)', re.I), f"CAST('{as_of:%Y-%m-%d %H:%M:%S}' AS TIMESTAMP)"),
+            (re.compile(r'\bcurrent_date\b', re.I), f"CAST('{as_of:%Y-%m-%d}' AS DATE)"),
+        ]
+    parts = LITERALS.split(sql)
+    for i in range(0, len(parts), 2):
+        for pattern, repl in rewrites:
+            parts[i] = pattern.sub(repl, parts[i])
+    return _wrap_union_order(''.join(parts))
+
+
+def connect(path: str = STORE) -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect(path)
+    con.execute("SET TimeZone = 'UTC'")
+    for table, columns in TABLES.items():
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {table.split('.')[0]}")
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+    for macro in MACROS:
+        con.execute(f"CREATE OR REPLACE TEMP MACRO {macro}")
+    return con
+
+
+def run_query(con, query: str, params: dict = None, as_of=None) -> pd.DataFrame:
+    """query 可以是 .sql 檔名 (相對 repo) 或 SQL 字串"""
+    path = query if os.path.exists(query) else os.path.join(HERE, query)
+    if query.endswith('.sql') and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            query = f.read()
+    return con.execute(translate(render(query, params), as_of)).df()
+
+
+# ---------------------------------------------------------------------------
+# Ingest
+# ---------------------------------------------------------------------------
+
+def ingest(con, table: str, source) -> int:
+    """DataFrame 或 Parquet/CSV 檔 (可用 glob) 依欄位名稱寫入; prices.usd 以 (symbol, minute) 去重"""
+    table = translate(table)
+    before = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if isinstance(source, pd.DataFrame):
+        con.register('_ingest_df', source)
+        relation = "_ingest_df"
+    elif str(source).endswith('.csv'):
+        relation = f"read_csv_auto('{source}')"
+    else:
+        relation = f"read_parquet('{source}')"
+    verb = "INSERT OR REPLACE" if table == 'prices.usd' else "INSERT"
+    con.execute(f"{verb} INTO {table} BY NAME SELECT * FROM {relation}")
+    if isinstance(source, pd.DataFrame):
+        con.unregister('_ingest_df')
+    return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - before
+
+
+def fetch_kucoin_minutes(pair: str = 'SOL-USDT', start: datetime = None, end: datetime = None,
+                         workers: int = 4) -> pd.DataFrame:
+    """KuCoin 1 分鐘 K 線收盤價 (minute, price); 每次最多 1500 根, 各段平行抓取"""
+    import requests
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=1)
+    t0, t1, step = int(start.timestamp()), int(end.timestamp()), 1500 * 60
+    windows = [(a, min(a + step, t1)) for a in range(t0, t1, step)]
+
+    def fetch(window):
+        for attempt in range(3):
+            r = requests.get("https://api.kucoin.com/api/v1/market/candles",
+                             params={'type': '1min', 'symbol': pair, 'startAt': window[0], 'endAt': window[1]},
+                             timeout=30)
+            if r.status_code == 429:
+                time.sleep(2 * (attempt + 1))
+                continue
+            r.raise_for_status()
+            return r.json().get('data') or []
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = [row for chunk in pool.map(fetch, windows) for row in chunk]
+    if not rows:
+        return pd.DataFrame(columns=['minute', 'price'])
+    arr = np.array([(int(r[0]), float(r[2])) for r in rows])
+    df = pd.DataFrame({'minute': pd.to_datetime(arr[:, 0].astype(np.int64), unit='s'), 'price': arr[:, 1]})
+    return df.drop_duplicates('minute').sort_values('minute', ignore_index=True)
+
+
+def ingest_prices(con, df: pd.DataFrame, symbol: str, blockchain: str = None) -> int:
+    df = df[['minute', 'price']].assign(symbol=symbol, blockchain=blockchain)
+    return ingest(con, 'prices.usd', df)
+
+
+# ---------------------------------------------------------------------------
+# Dialect corpus (--check)
+# ---------------------------------------------------------------------------
+
+AS_OF = datetime(2025, 9, 1, 12, 0)
+WSOL_MINT = 'So11111111111111111111111111111111111111112'
+
+# (DuneSQL 片段, Trino 的結果)
+CASES = [
+    ("GREATEST(1, NULL)", None),
+    ("GREATEST(1, 5, 3)", 5),
+    ("LEAST(2, NULL, 1)", None),
+    ("COALESCE(GREATEST(2.0, NULL), 7.0)", 7.0),
+    ("date_add('week', 1, TIMESTAMP '2025-01-01 00:00:00')", datetime(2025, 1, 8)),
+    ("date_add('year', -1, TIMESTAMP '2025-03-01 00:00:00')", datetime(2024, 3, 1)),
+    ("date_add('hour', 5, TIMESTAMP '2025-01-01 00:00:00')", datetime(2025, 1, 1, 5)),
+    ("date_diff('week', TIMESTAMP '2025-01-06', TIMESTAMP '2025-02-03')", 4),
+    ("from_unixtime(86400)", datetime(1970, 1, 2)),
+    ("to_unixtime(TIMESTAMP '1970-01-02 00:00:00')", 86400.0),
+    ("from_unixtime(floor(to_unixtime(TIMESTAMP '2025-01-01 05:59:00') / (3600 * 4)) * 3600 * 4)", datetime(2025, 1, 1, 4)),
+    ("from_iso8601_timestamp('2025-09-01T00:00:00Z')", datetime(2025, 9, 1)),
+    ("DATE(TIMESTAMP '2025-01-01 23:59:00')", date(2025, 1, 1)),
+    ("CAST(date_trunc('day', TIMESTAMP '2025-01-01 23:59:00') AS date)", date(2025, 1, 1)),
+    ("date_trunc('week', TIMESTAMP '2025-09-03 10:00:00')", datetime(2025, 9, 1)),
+    ("format('%.1f%%', 12.345)", '12.3%'),
+    ("regexp_like('wsol', '^(sol|wsol|wrapped sol)$')", True),
+    ("regexp_like('solana', '^(sol|wsol)$')", False),
+    ("(ARRAY_AGG(x ORDER BY x DESC))[1] FROM (VALUES (1), (3), (2)) t(x)", 3),
+    ("min_by(x, k) FROM (VALUES (10, 3), (20, 1), (30, 2)) t(x, k)", 20),
+    ("approx_percentile(x, 0.5) FROM range(101) t(x)", 50),
+    ("now() - INTERVAL '1' HOUR * 3", AS_OF - timedelta(hours=3)),
+    ("current_date - interval '90' day", datetime(2025, 6, 3)),
+    ("'GREATEST(keep, literal)'", 'GREATEST(keep, literal)'),
+    ("DATE '2025-01-02'", date(2025, 1, 2)),
+]
+
+
+def synthetic_prices(end: datetime = AS_OF, days: int = 130, symbol: str = 'SOL', seed: int = 3) -> pd.DataFrame:
+    minutes = days * 1440
+    rng = np.random.default_rng(seed)
+    price = 150 * np.exp(np.cumsum(rng.normal(0, 0.0008, minutes)))
+    index = pd.date_range(end=end, periods=minutes, freq='min')
+    return pd.DataFrame({'minute': index, 'price': price, 'symbol': symbol, 'blockchain': 'solana'})
+
+
+def synthetic_trades(end: datetime = AS_OF, days: int = 400, n: int = 20000, seed: int = 5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    block_time = pd.Timestamp(end) - pd.to_timedelta(rng.uniform(0, days * 86400, n), unit='s')
+    symbols = np.array(['SOL', 'WSOL', 'USDC', 'JUP', 'BONK', ''])
+    projects = np.array(['raydium', 'orca', 'meteora', 'raydium_launchlab', 'pumpswap', 'uniswap'])
+    chains = np.array(['solana', 'ethereum', 'base', 'arbitrum'])
+    return pd.DataFrame({
+        'blockchain': chains[rng.integers(0, len(chains), n)],
+        'project': projects[rng.integers(0, len(projects), n)],
+        'block_time': block_time,
+        'block_date': block_time.normalize(),
+        'token_bought_symbol': symbols[rng.integers(0, len(symbols), n)],
+        'token_sold_symbol': symbols[rng.integers(0, len(symbols), n)],
+        'amount_usd': rng.lognormal(6, 2.5, n),
+        'tx_from': np.char.add('w', rng.integers(0, 3000, n).astype(str)),
+        'trader_id': np.char.add('w', rng.integers(0, 3000, n).astype(str)),
+        'tx_hash': np.char.add('t', np.arange(n).astype(str)),
+        'tx_id': np.char.add('t', np.arange(n).astype(str)),
+        'token_bought_mint_address': np.where(rng.random(n) < 0.3, WSOL_MINT, 'EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v'),
+        'token_sold_mint_address': np.where(rng.random(n) < 0.3, WSOL_MINT, 'Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB'),
+    })
+
+
+def synthetic_transactions(end: datetime = AS_OF, days: int = 120, n: int = 20000, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    block_time = pd.Timestamp(end) - pd.to_timedelta(rng.uniform(0, days * 86400, n), unit='s')
+    return pd.DataFrame({
+        'block_time': block_time,
+        'block_date': block_time.normalize(),
+        'fee': rng.integers(5000, 50000, n),
+        'signer': np.char.add('w', rng.integers(0, 3000, n).astype(str)),
+        'success': rng.random(n) < 0.95,
+        'id': np.char.add('s', np.arange(n).astype(str)),
+    })
+
+
+def check_corpus(sql_dir: str = HERE, verbose: bool = True) -> bool:
+    """每個 .sql: 代入參數 -> 轉譯 -> DuckDB 解析 -> 在合成資料上執行; 另驗證 CASES 的語意"""
+    con = connect(':memory:')
+    ingest(con, 'prices.usd', synthetic_prices())
+    from ohlc_rollup import refresh
+    # rollup 停在 AS_OF 前兩天, 查詢需自行由分鐘價格補上之後的 bucket
+    for unit in ('day', 'hour'):
+        refresh(con, unit, now=AS_OF - timedelta(days=2))
+    trades = synthetic_trades()
+    ingest(con, 'dex.trades', trades.drop(columns=['trader_id', 'tx_id', 'token_bought_mint_address', 'token_sold_mint_address']))
+    ingest(con, 'dex_solana.trades', trades[trades['blockchain'] == 'solana'].drop(columns=['tx_from', 'tx_hash']))
+    ingest(con, 'solana.transactions', synthetic_transactions())
+    days = pd.date_range(end=AS_OF.date(), periods=400, freq='D')
+    ingest(con, 'dune.abbysuyuyan.dataset_defillama_chain_tvl_top30',
+           pd.DataFrame({'day': np.repeat(days, 3), 'chain': np.tile(['ethereum', 'solana', 'tron'], len(days)),
+                         'tvl_usd': np.linspace(1e9, 2e9, 3 * len(days))}))
+    ingest(con, 'dune.abbysuyuyan.dataset_solana_defillama_protocol_tvl',
+           pd.DataFrame({'day': np.repeat(days, 2), 'protocol': np.tile(['Jito', 'ALL_PROTOCOLS'], len(days)),
+                         'category': 'Liquid Staking', 'tvl_usd': np.linspace(1e8, 2e8, 2 * len(days))}))
+
+    ok = True
+    for sql, expected in CASES:
+        query = translate(f"SELECT {sql}", AS_OF)
+        try:
+            got = con.execute(query).fetchone()[0]
+            if isinstance(got, pd.Timestamp):
+                got = got.to_pydatetime()
+            passed = got == expected or (isinstance(expected, float) and got is not None and abs(got - expected) < 1e-9)
+        except Exception as e:
+            got, passed = f"{type(e).__name__}: {e}", False
+        ok &= passed
+        if verbose or not passed:
+            print(f"{'ok ' if passed else 'FAIL'} {sql} -> {got!r}" + ("" if passed else f" (expected {expected!r})"))
+
+    files = sorted(glob.glob(os.path.join(sql_dir, '*.sql')))
+    for path in files:
+        name = os.path.basename(path)
+        with open(path, encoding='utf-8') as f:
+            raw = f.read()
+        started = time.perf_counter()
+        try:
+            sql = translate(render(raw), AS_OF)
+            parsed = con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0]
+            if '"error":true' in parsed:
+                raise ValueError(parsed)
+            df = con.execute(sql).df()
+            uses_prices = 'prices.usd' in raw
+            status = 'ok ' if (len(df) or not uses_prices) else 'EMPTY'
+        except Exception as e:
+            df, status = None, f"FAIL {type(e).__name__}: {str(e).splitlines()[0]}"
+        ok &= status == 'ok '
+        if verbose or status != 'ok ':
+            rows = len(df) if df is not None else '-'
+            print(f"{status:<4} {name:<55} rows={rows:<6} {(time.perf_counter() - started) * 1000:7.1f}ms")
+    print(f"{len(CASES)} dialect cases, {len(files)} query files: {'all passed' if ok else 'FAILURES'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('query', nargs='?', help='.sql file (relative to the repo) or SQL text')
+    parser.add_argument('--db', default=STORE)
+    parser.add_argument('--param', action='append', default=[], help='name=value for {{name}}')
+    parser.add_argument('--as-of', help='pin now()/current_date, e.g. 2025-09-01T12:00')
+    parser.add_argument('--check', action='store_true', help='run the dialect corpus over every .sql file')
+    parser.add_argument('--ingest', nargs=2, metavar=('TABLE', 'FILE'), help='load a Parquet/CSV export into TABLE')
+    parser.add_argument('--ingest-kucoin', metavar='PAIR', help='load KuCoin 1m closes into prices.usd')
+    parser.add_argument('--symbol', default='SOL')
+    parser.add_argument('--days', type=float, default=120)
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_corpus() else 1)
+
+    con = connect(args.db)
+    if args.ingest:
+        print(f"{ingest(con, args.ingest[0], args.ingest[1])} rows -> {args.ingest[0]}")
+    if args.ingest_kucoin:
+        end = datetime.now(timezone.utc)
+        df = fetch_kucoin_minutes(args.ingest_kucoin, end - timedelta(days=args.days), end)
+        print(f"{ingest_prices(con, df, args.symbol, 'solana')} rows -> prices.usd ({args.symbol})")
+    if args.query:
+        params = dict(p.split('=', 1) for p in args.param)
+        as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+        started = time.perf_counter()
+        df = run_query(con, args.query, params, as_of)
+        with pd.option_context('display.max_rows', 50, 'display.width', 200):
+            print(df)
+        print(f"{len(df)} rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Shared on-disk HTTP cache for the ETL scripts and the risk monitor.
+
+    from http_cache import CachedSession
+    http = CachedSession(ttls={'/market_chart': 6 * 3600}, min_interval={'api.coingecko.com': 2.5})
+    data = http.get(url, params=params).json()
+
+- responses are stored content-addressed (blobs/<sha256 of body>), identical bodies share one file
+- a SQLite index maps request URL -> blob, validators and expiry
+- per-endpoint TTLs: the first pattern contained in the URL wins, otherwise default_ttl
+- fresh entries are served without touching the network, rate limiters or min_interval
+- stale entries with an ETag / Last-Modified are revalidated with a conditional GET (304 -> reuse)
+- LRU eviction (by last access) once the blobs exceed max_bytes
+- network errors fall back to a stale copy when one exists (stale_if_error)
+
+Only GET is cached and only 200 responses are stored. APIs that report errors inside a 200
+body (KuCoin `code != "200000"`, MEXC `success: false`) need `get(..., validate=...)`: a
+response the validator rejects is neither stored nor served from the cache. Rate limiting is applied per host
+and only to requests that actually go out: `limiters` takes objects with acquire()
+(e.g. a TokenBucket), `min_interval` a minimum spacing in seconds, and `get(..., limiter=...)`
+adds a per-call one (e.g. the monitor's per-venue budget) on top of the host's.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_DIR = os.environ.get("HTTP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "abby_crypto_http"))
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Date')
+
+
+class MinInterval:
+    """同一 host 兩次請求之間至少間隔 seconds 秒"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.seconds
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CachedSession:
+    def __init__(self, cache_dir: str = DEFAULT_DIR, ttls=None, default_ttl: float = 0,
+                 max_bytes: int = 256 * 2 ** 20, min_interval: dict = None, limiters: dict = None,
+                 session_factory=requests.Session, stale_if_error: bool = True):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.ttls = list(ttls.items()) if isinstance(ttls, dict) else list(ttls or [])
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.stale_if_error = stale_if_error
+        self.session_factory = session_factory
+        # host -> 具 acquire() 的限速器; '*' 為所有 host 的預設
+        self.limiters = dict(limiters or {})
+        for host, seconds in (min_interval or {}).items():
+            self.limiters[host] = MinInterval(seconds)
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stale': 0}
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            url TEXT,
+            blob TEXT,
+            size INTEGER,
+            status INTEGER,
+            headers TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL,
+            expires_at REAL,
+            accessed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+        CREATE INDEX IF NOT EXISTS idx_entries_blob ON entries(blob);
+        """)
+        self.total_bytes = self._blob_bytes()
+
+    # ------------------------------------------------------------------
+    def _session(self) -> requests.Session:
+        """每個執行緒各自的 session (requests.Session 非執行緒安全)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self.session_factory()
+            self._local.session = session
+        return session
+
+    def ttl_for(self, url: str) -> float:
+        for pattern, ttl in self.ttls:
+            if pattern in url:
+                return ttl
+        return self.default_ttl
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _blob_bytes(self) -> int:
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT blob, MAX(size) AS size FROM entries GROUP BY blob)"
+        ).fetchone()
+        return int(row[0])
+
+    def _lookup(self, key: str):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT url, blob, status, headers, etag, last_modified, expires_at FROM entries WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(('url', 'blob', 'status', 'headers', 'etag', 'last_modified', 'expires_at'), row))
+        return entry if os.path.exists(self._blob_path(entry['blob'])) else None
+
+    def _delete(self, key: str):
+        with self._lock:
+            row = self.conn.execute("SELECT blob FROM entries WHERE key = ?", (key,)).fetchone()
+            with self.conn:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if row:
+                self._release_blob(row[0])
+
+    def _touch(self, key: str, expires_at: float = None):
+        now = time.time()
+        with self._lock, self.conn:
+            if expires_at is None:
+                self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            else:
+                self.conn.execute("UPDATE entries SET accessed_at = ?, stored_at = ?, expires_at = ? WHERE key = ?",
+                                  (now, now, expires_at, key))
+
+    def _cached_response(self, entry: dict) -> requests.Response:
+        response = requests.Response()
+        with open(self._blob_path(entry['blob']), 'rb') as f:
+            response._content = f.read()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(json.loads(entry['headers']))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = entry['url']
+        response.reason = 'OK'
+        response.from_cache = True
+        return response
+
+    def _store(self, key: str, url: str, response: requests.Response, ttl: float):
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+        headers = {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers}
+        now = time.time()
+        with self._lock:
+            old = self.conn.execute("SELECT blob FROM entries WHERE key = ?", (key,)).fetchone()
+            shared = self.conn.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone()
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, url, digest, len(content), response.status_code, json.dumps(headers),
+                     response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now + ttl, now)
+                )
+            if not shared:
+                self.total_bytes += len(content)
+            if old and old[0] != digest:
+                self._release_blob(old[0])
+            self._evict()
+
+    def _release_blob(self, digest: str):
+        """沒有任何 entry 再指向此 blob 時刪除檔案 (呼叫端需持有 _lock)"""
+        if self.conn.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone():
+            return
+        path = self._blob_path(digest)
+        try:
+            self.total_bytes -= os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """超過 max_bytes 時依最後存取時間 (LRU) 刪除 (呼叫端需持有 _lock)"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute("SELECT key, blob FROM entries ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, digest in rows:
+                with self.conn:
+                    self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._release_blob(digest)
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def _throttle(self, url: str, extra=None):
+        host = urlsplit(url).netloc
+        limiter = self.limiters.get(host, self.limiters.get('*'))
+        if limiter is not None:
+            limiter.acquire()
+        if extra is not None:
+            extra.acquire()
+
+    # ------------------------------------------------------------------
+    def get(self, url: str, params: dict = None, ttl: float = None, headers: dict = None,
+            validate=None, limiter=None, **kwargs) -> requests.Response:
+        """與 requests.get 相同介面; 回傳的 Response 另有 from_cache 屬性
+
+        validate(response) -> bool: 只有通過的 200 回應才寫入快取; 快取中不通過的舊條目直接刪除。
+        limiter: 這次請求額外的限速器 (具 acquire()), 與 host 的一樣只在實際送出請求時取用。
+        """
+        url = requests.Request('GET', url, params=params).prepare().url
+        key = hashlib.sha256(url.encode()).hexdigest()
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        entry = self._lookup(key)
+        if entry is not None and validate is not None and not self._valid(validate, self._cached_response(entry)):
+            self._delete(key)
+            entry = None
+
+        if entry is not None and time.time() < entry['expires_at']:
+            self._touch(key)
+            self.stats['hits'] += 1
+            return self._cached_response(entry)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        self._throttle(url, limiter)
+        try:
+            response = self._session().get(url, headers=headers, **kwargs)
+        except requests.RequestException:
+            if entry is not None and self.stale_if_error:
+                self.stats['stale'] += 1
+                return self._cached_response(entry)
+            raise
+
+        if response.status_code == 304 and entry is not None:
+            self._touch(key, time.time() + ttl)
+            self.stats['revalidated'] += 1
+            return self._cached_response(entry)
+
+        self.stats['misses'] += 1
+        response.from_cache = False
+        cacheable = ttl > 0 or 'ETag' in response.headers or 'Last-Modified' in response.headers
+        if response.status_code == 200 and cacheable and (validate is None or self._valid(validate, response)):
+            self._store(key, url, response, ttl)
+        elif entry is not None and response.status_code >= 500 and self.stale_if_error:
+            self.stats['stale'] += 1
+            return self._cached_response(entry)
+        return response
+
+    @staticmethod
+    def _valid(validate, response: requests.Response) -> bool:
+        try:
+            return bool(validate(response))
+        except Exception:
+            return False
+
+    def invalidate(self, url: str, params: dict = None):
+        """刪除單一 URL 的快取條目"""
+        url = requests.Request('GET', url, params=params).prepare().url
+        self._delete(hashlib.sha256(url.encode()).hexdigest())
+
+    def clear(self):
+        with self._lock:
+            digests = [row[0] for row in self.conn.execute("SELECT DISTINCT blob FROM entries")]
+            with self.conn:
+                self.conn.execute("DELETE FROM entries")
+            for digest in digests:
+                self._release_blob(digest)
+            self.total_bytes = 0
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,339 @@
+"""Any-timeframe K-lines from cached one-minute OHLC buckets.
+
+    from kline_resampler import MinuteBars, Resampler
+    base = MinuteBars.from_store(con, 'SOL')          # one-minute OHLC, loaded once (dune_local store)
+    rs = Resampler(base)
+    rs.candles(15, start, end)                        # 15-minute candles for minutes in [start, end)
+    rs.candles(4 * 60, start, end)                    # 4-hour candles
+    rs.append(ts, price)                              # new ticks / minutes; cached sets only redo the open candle
+
+    python kline_resampler.py --verify                # vs "SOL - Customized Minutes/Hour K-Line.sql"
+    python kline_resampler.py --benchmark
+
+Buckets are aligned to the epoch like the SQL (floor(unix / (60 * k))). Each derived timeframe
+is a full-history candle set kept in an LRU cache; it is built by merging the cached set of the
+largest cached divisor of k (or the one-minute base), and when minutes arrive only the open candle
+and any new candles are recomputed. A request for [start, end) takes whole candles from the set and
+re-merges just the partial first / last bucket from the base, so the result is identical to
+aggregating the raw minutes in that range.
+"""
+import time
+import threading
+import argparse
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+CACHE_SIZE = 8       # 快取的時間框架數 (LRU)
+
+
+class MinuteBars:
+    """一分鐘 OHLC 的連續 numpy 陣列 (依分鐘遞增, 可有缺口); 容量不足時加倍"""
+    __slots__ = ('minute', 'open', 'high', 'low', 'close', 'size', 'version')
+
+    def __init__(self, capacity: int = 1024):
+        self.minute = np.empty(capacity, dtype=np.int64)     # unix 秒 // 60
+        self.open = np.empty(capacity, dtype=np.float64)
+        self.high = np.empty(capacity, dtype=np.float64)
+        self.low = np.empty(capacity, dtype=np.float64)
+        self.close = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self.version = 0     # 最後一分鐘被修改或新增時遞增
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, n: int):
+        capacity = self.minute.size
+        if self.size + n <= capacity:
+            return
+        while capacity < self.size + n:
+            capacity *= 2
+        for name in ('minute', 'open', 'high', 'low', 'close'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, ts: float, price: float):
+        """逐筆價格: 同一分鐘內更新最後一根, 新的一分鐘新增一根; 早於最後一分鐘的資料忽略"""
+        minute = int(ts) // 60
+        last = self.minute[self.size - 1] if self.size else -1
+        if minute < last:
+            return
+        if minute == last:
+            i = self.size - 1
+            self.high[i] = max(self.high[i], price)
+            self.low[i] = min(self.low[i], price)
+            self.close[i] = price
+        else:
+            self._reserve(1)
+            i = self.size
+            self.minute[i] = minute
+            self.open[i] = self.high[i] = self.low[i] = self.close[i] = price
+            self.size += 1
+        self.version += 1
+
+    def extend(self, minute: np.ndarray, open_, high, low, close):
+        """批次加入整分鐘的 OHLC (minute 為 unix 秒 // 60, 遞增); 與既有資料重疊的部分以新資料取代
+
+        回傳第一個被改寫的列 (沒有重疊時為原本的長度)。
+        """
+        minute = np.asarray(minute, dtype=np.int64)
+        if self.size and minute.size:
+            self.size = int(np.searchsorted(self.minute[:self.size], minute[0]))
+        first = self.size
+        n = minute.size
+        self._reserve(n)
+        sl = slice(self.size, self.size + n)
+        self.minute[sl], self.open[sl], self.high[sl], self.low[sl], self.close[sl] = minute, open_, high, low, close
+        self.size += n
+        self.version += 1
+        return first
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'MinuteBars':
+        """minute + price (prices.usd) 或 minute + open/high/low/close"""
+        df = df.sort_values('minute')
+        minute = df['minute'].to_numpy('datetime64[m]').astype(np.int64)
+        cols = ('open', 'high', 'low', 'close') if 'open' in df else ('price',) * 4
+        bars = cls(max(1024, len(df)))
+        bars.extend(minute, *(df[c].to_numpy(np.float64) for c in cols))
+        return bars
+
+    @classmethod
+    def from_store(cls, con, symbol: str = 'SOL', since: datetime = None) -> 'MinuteBars':
+        """從 dune_local 的 prices.usd 載入一次"""
+        sql = "SELECT minute, price FROM prices.usd WHERE symbol = ?" + (" AND minute >= ?" if since else "")
+        params = [symbol] + ([since] if since else [])
+        return cls.from_frame(con.execute(sql + " ORDER BY minute", params).df())
+
+
+def merge(minute, open_, high, low, close, k: int) -> tuple:
+    """依 minute // k 分組合併 (輸入已依時間排序): 回傳 (bucket, open, high, low, close)"""
+    if not len(minute):
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty, empty, empty
+    group = minute // k
+    starts = np.flatnonzero(np.diff(group, prepend=group[0] - 1))
+    ends = np.append(starts[1:], len(group)) - 1
+    return (group[starts] * k, open_[starts], np.maximum.reduceat(high, starts),
+            np.minimum.reduceat(low, starts), close[ends])
+
+
+class CandleSet:
+    """單一時間框架的全歷史 K 線; base_end 為已合併到的 base 列數, open_start 為最後一根的第一列"""
+    __slots__ = ('k', 'bucket', 'open', 'high', 'low', 'close', 'base_end', 'open_start', 'version')
+
+    def __init__(self, k: int, arrays: tuple, base_end: int, open_start: int, version: int):
+        self.k = k
+        self.bucket, self.open, self.high, self.low, self.close = arrays
+        self.base_end = base_end
+        self.open_start = open_start
+        self.version = version
+
+
+class Resampler:
+    """從 MinuteBars 導出任意 k 分鐘 K 線, 常用的時間框架存在 LRU 快取"""
+
+    def __init__(self, base: MinuteBars, cache_size: int = CACHE_SIZE):
+        self.base = base
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'builds': 0, 'updates': 0}
+
+    def append(self, ts: float, price: float):
+        with self.lock:
+            self.base.append(ts, price)
+
+    def extend(self, minute, open_, high, low, close):
+        """批次加入分鐘 K; 改寫到已收盤 K 棒的時間框架直接從快取移除"""
+        with self.lock:
+            first = self.base.extend(minute, open_, high, low, close)
+            for k in [k for k, s in self.cache.items() if first < s.open_start]:
+                del self.cache[k]
+
+    def _base_arrays(self, lo: int, hi: int) -> tuple:
+        b = self.base
+        return b.minute[lo:hi], b.open[lo:hi], b.high[lo:hi], b.low[lo:hi], b.close[lo:hi]
+
+    def _build(self, k: int) -> CandleSet:
+        """由可整除 k 的最大已快取時間框架 (或一分鐘 base) 合併"""
+        self._catch_up_all()
+        divisors = [s for kk, s in self.cache.items() if k % kk == 0]
+        source = max(divisors, key=lambda s: s.k) if divisors else None
+        if source is not None and len(source.bucket):
+            arrays = merge(source.bucket, source.open, source.high, source.low, source.close, k)
+        else:
+            arrays = merge(*self._base_arrays(0, self.base.size), k)
+        open_start = self._group_start(k, self.base.size)
+        self.stats['builds'] += 1
+        return CandleSet(k, arrays, self.base.size, open_start, self.base.version)
+
+    def _group_start(self, k: int, end: int) -> int:
+        """base 前 end 列中, 最後一個 k 分鐘 bucket 的第一列"""
+        if not end:
+            return 0
+        minute = self.base.minute[:end]
+        return int(np.searchsorted(minute, minute[end - 1] // k * k))
+
+    def _catch_up(self, s: CandleSet):
+        """新分鐘進來後只重算未收盤的最後一根, 並補上新的 K 棒"""
+        if s.version == self.base.version:
+            return
+        lo, hi = s.open_start, self.base.size
+        bucket, o, h, l, c = merge(*self._base_arrays(lo, hi), s.k)
+        keep = len(s.bucket) - (1 if len(s.bucket) and lo < s.base_end else 0)
+        s.bucket = np.concatenate((s.bucket[:keep], bucket))
+        s.open = np.concatenate((s.open[:keep], o))
+        s.high = np.concatenate((s.high[:keep], h))
+        s.low = np.concatenate((s.low[:keep], l))
+        s.close = np.concatenate((s.close[:keep], c))
+        s.base_end, s.open_start, s.version = hi, self._group_start(s.k, hi), self.base.version
+        self.stats['updates'] += 1
+
+    def _catch_up_all(self):
+        for s in self.cache.values():
+            self._catch_up(s)
+
+    def candle_set(self, k: int) -> CandleSet:
+        with self.lock:
+            s = self.cache.get(k)
+            if s is None:
+                s = self._build(k)
+                self.cache[k] = s
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            else:
+                self._catch_up(s)
+                self.cache.move_to_end(k)
+                self.stats['hits'] += 1
+            return s
+
+    def candles(self, k: int, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        """k 分鐘 K 線, 只含 start <= minute < end 的分鐘 (與 SQL 的 WHERE 相同); 頭尾不完整的 bucket 由 base 重算"""
+        s = self.candle_set(k)
+        with self.lock:
+            minute = self.base.minute[:s.base_end]
+            lo = 0 if start is None else int(np.searchsorted(minute, _to_minute(start, ceil=True)))
+            hi = s.base_end if end is None else int(np.searchsorted(minute, _to_minute(end, ceil=True)))
+            if lo >= hi:
+                arrays = merge(*self._base_arrays(0, 0), k)
+            else:
+                first, last = minute[lo] // k * k, minute[hi - 1] // k * k
+                # 完整的 bucket 直接取自快取, 頭尾 bucket 若被 start/end 截斷則由 base 重算
+                head_full = lo == 0 or minute[lo - 1] < first
+                tail_full = hi == s.base_end or minute[hi] >= last + k
+                i0, i1 = np.searchsorted(s.bucket, [first, last])
+                i0, i1 = int(i0) + (not head_full), int(i1) + tail_full
+                parts = []
+                if not head_full:
+                    parts.append(merge(*self._base_arrays(lo, min(hi, self._end_of(first + k, lo, hi))), k))
+                if i0 < i1:
+                    parts.append((s.bucket[i0:i1], s.open[i0:i1], s.high[i0:i1], s.low[i0:i1], s.close[i0:i1]))
+                if not tail_full and (head_full or last != first):
+                    parts.append(merge(*self._base_arrays(max(lo, self._end_of(last, lo, hi)), hi), k))
+                arrays = tuple(np.concatenate(cols) for cols in zip(*parts)) if parts else merge(
+                    *self._base_arrays(0, 0), k)
+        bucket, o, h, l, c = arrays
+        return pd.DataFrame({'bucket': pd.to_datetime(bucket * 60, unit='s'), 'open': o, 'high': h, 'low': l,
+                             'close': c})
+
+    def _end_of(self, minute: int, lo: int, hi: int) -> int:
+        return lo + int(np.searchsorted(self.base.minute[lo:hi], minute))
+
+
+def _to_minute(value, ceil: bool = False) -> int:
+    """datetime / unix 秒 -> 分鐘序號; ceil 時無條件進位 (minute >= start 的第一分鐘)"""
+    seconds = value.timestamp() if isinstance(value, datetime) else float(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        seconds = (value - datetime(1970, 1, 1)).total_seconds()
+    return int(-(-seconds // 60)) if ceil else int(seconds // 60)
+
+
+# ==================== 驗證 / 效能 ====================
+def _sql_candles(con, k_minutes: int, lookback_hours: int, as_of: datetime) -> pd.DataFrame:
+    import dune_local
+    return dune_local.run_query(con, 'SOL - Customized Minutes K-Line.sql',
+                                {'k_minutes': k_minutes, 'lookback_hours': lookback_hours}, as_of)
+
+
+def verify(days: int = 30) -> bool:
+    import dune_local
+    con = dune_local.connect(':memory:')
+    dune_local.ingest(con, 'prices.usd', dune_local.synthetic_prices(dune_local.AS_OF, days))
+    rs = Resampler(MinuteBars.from_store(con, 'SOL'))
+    ok = True
+    for as_of in (dune_local.AS_OF - timedelta(days=2, minutes=7, seconds=30), dune_local.AS_OF):
+        for k, hours in ((1, 6), (5, 24), (15, 72), (60, 72), (240, 168), (7, 50), (1440, 24 * 20)):
+            start, end = as_of - timedelta(hours=hours), as_of
+            expected = _sql_candles(con, k, hours, as_of)
+            got = rs.candles(k, start, end)
+            same = len(expected) == len(got) and all(
+                np.array_equal(expected[c].to_numpy(), got[c].to_numpy()) for c in ('open', 'high', 'low', 'close')
+            ) and (pd.to_datetime(expected['bucket']).to_numpy() == got['bucket'].to_numpy()).all()
+            ok &= same
+            print(f"{'ok ' if same else 'FAIL'} k={k:<5} lookback={hours:>4}h as_of={as_of} {len(got)} candles")
+    hour_sql = dune_local.run_query(con, 'SOL - Customized Hour K-Line.sql',
+                                    {'k_hours': 4, 'lookback_hours': 72}, dune_local.AS_OF)
+    hour = rs.candles(240, dune_local.AS_OF - timedelta(hours=72), dune_local.AS_OF)
+    same = np.array_equal(hour_sql[['open', 'high', 'low', 'close']].to_numpy(),
+                          hour[['open', 'high', 'low', 'close']].to_numpy())
+    ok &= same
+    print(f"{'ok ' if same else 'FAIL'} Customized Hour K-Line.sql k_hours=4")
+    return ok
+
+
+def benchmark(days: int = 120, repeat: int = 5):
+    import dune_local
+    as_of = dune_local.AS_OF
+    con = dune_local.connect(':memory:')
+    dune_local.ingest(con, 'prices.usd', dune_local.synthetic_prices(as_of, days))
+
+    def ms(fn, *args):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(*args)
+            times.append((time.perf_counter() - started) * 1000)
+        return sorted(times)[len(times) // 2]
+
+    started = time.perf_counter()
+    rs = Resampler(MinuteBars.from_store(con, 'SOL'))
+    print(f"load {len(rs.base):,} minutes: {(time.perf_counter() - started) * 1000:.1f} ms")
+    frames = [1, 5, 15, 30, 60, 240, 1440]
+    lookback = 24 * 30
+    start = as_of - timedelta(hours=lookback)
+    print(f"{'k (min)':>8} {'SQL rescan':>12} {'cold':>10} {'cached':>10} {'+1 minute':>10}")
+    for k in frames:
+        sql = ms(_sql_candles, con, k, lookback, as_of)
+        rs.cache.pop(k, None)
+        started = time.perf_counter()
+        rs.candles(k, start, as_of)
+        cold = (time.perf_counter() - started) * 1000
+        warm = ms(rs.candles, k, start, as_of)
+        tick = [as_of.timestamp()]
+
+        def after_tick():
+            tick[0] += 60
+            rs.append(tick[0], 150.0)
+            rs.candles(k, start, datetime(1970, 1, 1) + timedelta(seconds=tick[0] + 60))
+        update = ms(after_tick)
+        print(f"{k:>8} {sql:10.2f}ms {cold:8.2f}ms {warm:8.2f}ms {update:8.2f}ms")
+    print(f"cache: {rs.stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verify', action='store_true')
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.verify:
+        raise SystemExit(0 if verify() else 1)
+    if args.benchmark:
+        benchmark()
+    else:
+        parser.print_help()
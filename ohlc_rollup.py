@@ -0,0 +1,157 @@
+"""Daily / hourly OHLC rollup of prices.usd, shared by the SOL indicator queries.
+
+    python ohlc_rollup.py                          # refresh closed buckets in the local store
+    python ohlc_rollup.py --since 2025-08-01       # late minute data: rebuild buckets from a date
+    python ohlc_rollup.py --benchmark              # refresh cost and indicator query times
+
+Tables (schema in dune_local.TABLES, on Dune the materialized views of
+"OHLC Rollup - Day.sql" / "OHLC Rollup - Hour.sql"):
+
+    dune.abbysuyuyan.result_ohlc_1d / result_ohlc_1h
+    symbol, bucket, open, high, low, close, samples (minute rows in the bucket)
+
+Only closed buckets (bucket end <= now) are stored, so a stored row never changes and
+a refresh aggregates just the minutes after each symbol's last bucket. The indicator
+queries read the rollup and aggregate the remaining minutes (the open bucket, plus
+anything a stale rollup has not caught up with yet) straight from prices.usd, so their
+results do not depend on when the rollup was last refreshed.
+"""
+import time
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import dune_local
+
+ROLLUPS = {
+    'day': 'dune.abbysuyuyan.result_ohlc_1d',
+    'hour': 'dune.abbysuyuyan.result_ohlc_1h',
+}
+# 讀取 rollup 的指標查詢 (benchmark 用)
+INDICATORS = [
+    'ATR(14).sql',
+    'RSI(14).sql',
+    'SOL - Keltner Channel.sql',
+    'TTM Squeeze Flag.sql',
+    'SOL - Bollinger Band (90D View).sql',
+    'SOL - Bollinger %B (20D).sql',
+    'SOL - Bollinger Bandwidth (20D).sql',
+    'SOL - Donchian breakout (20D).sql',
+    'SOL - Customized Hour K-Line.sql',
+]
+
+
+def refresh(con, unit: str = 'day', symbols=None, now: datetime = None) -> int:
+    """把各 symbol 最後一個 bucket 之後、已收盤的 bucket 寫入 rollup; 回傳寫入的 bucket 數
+
+    以常數時間範圍逐 symbol 查詢, 只掃描新的分鐘資料。
+    """
+    table = dune_local.translate(ROLLUPS[unit])
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    if symbols is None:
+        symbols = [row[0] for row in con.execute("SELECT DISTINCT symbol FROM prices.usd").fetchall()]
+    last = dict(con.execute(f"SELECT symbol, MAX(bucket) FROM {table} GROUP BY 1").fetchall())
+    written = 0
+    for symbol in symbols:
+        lower = last.get(symbol)
+        bounds = f"AND minute >= ? + INTERVAL 1 {unit}" if lower is not None else ""
+        params = [symbol, now] + ([lower] if lower is not None else [])
+        written += con.execute(f"""
+            INSERT OR REPLACE INTO {table}
+            SELECT symbol, date_trunc('{unit}', minute) AS bucket,
+                   arg_min(price, minute), MAX(price), MIN(price), arg_max(price, minute), COUNT(*)
+            FROM prices.usd
+            WHERE symbol = ? AND minute < date_trunc('{unit}', ?::TIMESTAMP) {bounds}
+            GROUP BY 1, 2
+        """, params).fetchone()[0]
+    return written
+
+
+def rebuild(con, unit: str = 'day', since: datetime = None, symbols=None, now: datetime = None) -> int:
+    """刪除 since 之後的 bucket 再重新彙總 (補進較舊的分鐘資料後使用); since=None 為全部重建"""
+    table = dune_local.translate(ROLLUPS[unit])
+    where, params = [], []
+    if since is not None:
+        where.append(f"bucket >= date_trunc('{unit}', ?::TIMESTAMP)")
+        params.append(since)
+    if symbols is not None:
+        where.append(f"symbol IN ({', '.join('?' * len(symbols))})")
+        params.extend(symbols)
+    con.execute(f"DELETE FROM {table}" + (f" WHERE {' AND '.join(where)}" if where else ""), params)
+    return refresh(con, unit, symbols, now)
+
+
+def benchmark(days: int = 120, symbols=('SOL', 'BTC', 'ETH'), repeat: int = 5):
+    """合成 days 天的分鐘價格: 冷建置 / 新增一天後的增量更新 / 無新資料的更新, 以及指標查詢
+    在 rollup 上與沒有 rollup (全部由分鐘資料彙總, 等同舊寫法) 的耗時"""
+    as_of = dune_local.AS_OF
+    con = dune_local.connect(':memory:')
+    for i, symbol in enumerate(symbols):
+        prices = dune_local.synthetic_prices(as_of - timedelta(days=1), days, symbol, seed=i)
+        dune_local.ingest(con, 'prices.usd', prices)
+    minutes = con.execute("SELECT COUNT(*) FROM prices.usd").fetchone()[0]
+    print(f"prices.usd: {minutes:,} minute rows ({len(symbols)} symbols x {days} days)")
+
+    def timed(fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        return result, (time.perf_counter() - started) * 1000
+
+    rows = []
+    for unit in ROLLUPS:
+        n, cold = timed(refresh, con, unit, now=as_of - timedelta(days=1))
+        rows.append((f"refresh {unit}: cold build", n, cold))
+    for i, symbol in enumerate(symbols):
+        day = dune_local.synthetic_prices(as_of, 1, symbol, seed=100 + i)
+        dune_local.ingest(con, 'prices.usd', day)
+    for unit in ROLLUPS:
+        n, warm = timed(refresh, con, unit, now=as_of)
+        rows.append((f"refresh {unit}: +1 day", n, warm))
+        n, noop = timed(refresh, con, unit, now=as_of)
+        rows.append((f"refresh {unit}: no new data", n, noop))
+    for label, n, ms in rows:
+        print(f"{label:<34} {n:>7,} buckets {ms:9.1f} ms")
+
+    def query_ms(name):
+        times = []
+        for _ in range(repeat):
+            _, ms = timed(dune_local.run_query, con, name, as_of=as_of)
+            times.append(ms)
+        return sorted(times)[len(times) // 2]
+
+    with_rollup = {name: query_ms(name) for name in INDICATORS}
+    # 清空 rollup: 同一份查詢退回全部由分鐘資料彙總
+    for table in ROLLUPS.values():
+        con.execute(f"DELETE FROM {dune_local.translate(table)}")
+    without = {name: query_ms(name) for name in INDICATORS}
+    print(f"\n{'query (median of %d)' % repeat:<42} {'minutes':>10} {'rollup':>10}")
+    for name in INDICATORS:
+        print(f"{name:<42} {without[name]:8.1f}ms {with_rollup[name]:8.1f}ms")
+    con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=dune_local.STORE)
+    parser.add_argument('--unit', choices=list(ROLLUPS), action='append', help='default: all rollups')
+    parser.add_argument('--symbol', action='append', help='default: every symbol in prices.usd')
+    parser.add_argument('--since', help='rebuild buckets from this date (after back-filling older minutes)')
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+
+    con = dune_local.connect(args.db)
+    for unit in args.unit or list(ROLLUPS):
+        started = time.perf_counter()
+        if args.since:
+            n = rebuild(con, unit, datetime.fromisoformat(args.since), args.symbol)
+        else:
+            n = refresh(con, unit, args.symbol)
+        print(f"{ROLLUPS[unit]}: {n} buckets in {(time.perf_counter() - started) * 1000:.1f} ms")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
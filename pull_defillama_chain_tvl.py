@@ -1,18 +1,58 @@
-!pip install requests -q
-
-import requests, csv, datetime, time
+import requests, csv, datetime, time, os, json, shutil, threading, argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from google.colab import drive
 
-drive.mount('/content/drive')
+try:
+    from http_cache import CachedSession
+except ImportError:
+    CachedSession = None
 
-URL_CHAINS = "https://api.llama.fi/v2/chains"
-BASE = "https://api.llama.fi/v2/historicalChainTvl/{}"
-OUT = "/content/defillama_chain_tvl_top30.csv"
+# DEFILLAMA_BASE_URL 可指向本機的 HTTP 替身做測試, 例如 http://127.0.0.1:8000
+API = os.environ.get("DEFILLAMA_BASE_URL", "https://api.llama.fi").rstrip("/")
+URL_CHAINS = API + "/v2/chains"
+BASE = API + "/v2/historicalChainTvl/{}"
+# 本機工作檔 (/content 在 Colab runtime 重啟後會清空); CSV 與 .state.json 的正本在 OUT_DRIVE,
+# 啟動時由 restore_from_drive() 取回, 結束時由 copy_to_drive() 寫回, watermark 才能跨 runtime 保留
+OUT = os.environ.get("DEFILLAMA_OUT", "/content/defillama_chain_tvl_top30.csv")
 OUT_DRIVE = "/content/drive/MyDrive/crypto_analysis/defillama_chain_tvl_top30.csv"
+TOP_N = 30
+MAX_WORKERS = 8
+RATE = 5.0       # 每秒請求數
+BURST = 5
+# http_cache 的各端點 TTL (秒); 快取命中不發請求也不消耗 token
+CACHE_TTLS = {
+    "/v2/chains": 3600,
+    "/v2/historicalChainTvl/": 6 * 3600,
+    "/protocols": 3600,
+    "/protocol/": 6 * 3600,
+}
+
+
+class TokenBucket:
+    """執行緒安全的 token bucket: 平均 rate 次/秒, 最多連發 burst 次"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 
-def make_session():
+def make_session(pool_size=MAX_WORKERS):
     s = requests.Session()
     s.headers.update({"User-Agent": "abby-dune-tvl-fetcher/1.0"})
     retry_kwargs = dict(total=3, connect=3, read=3, backoff_factor=1.0,
@@ -22,39 +62,194 @@ def make_session():
         retry = Retry(**retry_kwargs, allowed_methods=frozenset(["GET"]))
     except TypeError:
         retry = Retry(**retry_kwargs, method_whitelist=frozenset(["GET"]))
-    s.mount("https://", HTTPAdapter(max_retries=retry))
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     return s
 
-chains_data = requests.get(URL_CHAINS).json()
-top_chains = sorted(chains_data, key=lambda x: x.get("tvl", 0), reverse=True)[:30]
-CHAIN_NAMES = [c["name"].lower() for c in top_chains]
-print("Top 30 chains by TVL:", CHAIN_NAMES)
 
-session = make_session()
-all_rows = []
-for chain in CHAIN_NAMES:
-    print(f"Fetching {chain} ...")
+class RateLimitedSession:
+    """沒有 http_cache 時的替代: 每個請求先取得 token"""
+
+    def __init__(self, session, bucket):
+        self.session = session
+        self.bucket = bucket
+
+    def get(self, url, **kwargs):
+        self.bucket.acquire()
+        return self.session.get(url, **kwargs)
+
+
+def make_client(workers=MAX_WORKERS, rate=RATE, burst=BURST):
+    """限速的 HTTP client; 有 http_cache 時在前面加上磁碟快取"""
+    bucket = TokenBucket(rate, burst)
+    if CachedSession is None:
+        return RateLimitedSession(make_session(workers), bucket)
+    return CachedSession(ttls=CACHE_TTLS, limiters={"*": bucket}, session_factory=lambda: make_session(1))
+
+
+def state_path(out):
+    return out + ".state.json"
+
+
+def scan_watermarks(out):
+    """由 CSV 重建各鏈最後一天 (state 與 CSV 不一致時, 例如寫入 CSV 後、更新 state 前當機)"""
+    marks = {}
+    if not os.path.exists(out):
+        return marks
+    with open(out, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["day"] > marks.get(row["chain"], ""):
+                marks[row["chain"]] = row["day"]
+    return marks
+
+
+def load_watermarks(out):
+    """{chain: 已儲存的最後一天}; state 記錄的 CSV 大小不符時改由 CSV 重建"""
+    size = os.path.getsize(out) if os.path.exists(out) else 0
     try:
-        data = session.get(BASE.format(chain), timeout=60).json()
-        for p in data:
-            ts, tvl = p.get("date"), p.get("tvl")
-            if ts is None or tvl is None: continue
-            day = datetime.datetime.utcfromtimestamp(int(ts)).date().isoformat()
-            all_rows.append((day, chain, float(tvl)))
-    except Exception as e:
-        print(f"[WARN] {chain} failed: {e}")
-    time.sleep(0.5)
-
-dedup = {}
-for d,c,v in all_rows:
-    dedup[(d,c)] = v
-rows = [(d,c,v) for (d,c),v in sorted(dedup.items())]
-
-with open(OUT, "w", newline="", encoding="utf-8") as f:
-    w = csv.writer(f)
-    w.writerow(["day","chain","tvl_usd"])
-    w.writerows(rows)
-print(f"Saved {OUT} with {len(rows)} rows.")
-
-!cp $OUT $OUT_DRIVE
-print(f"Also copied to Google Drive: {OUT_DRIVE}")
+        with open(state_path(out)) as f:
+            state = json.load(f)
+        if state.get("csv_bytes") == size:
+            return state["chains"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return scan_watermarks(out)
+
+
+def save_watermarks(out, marks):
+    tmp = state_path(out) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"csv_bytes": os.path.getsize(out), "chains": marks}, f, indent=1, sort_keys=True)
+    os.replace(tmp, state_path(out))
+
+
+def sort_csv(out):
+    """依 (day, chain) 重寫整個 CSV (與一次抓完的舊版輸出相同順序); 同一 (day, chain) 保留最後一列"""
+    with open(out, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = {(row[0], row[1]): row[2] for row in reader}
+    tmp = out + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows((d, c, v) for (d, c), v in sorted(rows.items()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out)
+
+
+def fetch_chain(session, chain, after, before):
+    """回傳 after < day < before 的 (day, chain, tvl); before 為今天 (UTC), 只存已收盤的日資料"""
+    resp = session.get(BASE.format(chain), timeout=60)
+    resp.raise_for_status()
+    rows = {}
+    for p in resp.json():
+        ts, tvl = p.get("date"), p.get("tvl")
+        if ts is None or tvl is None: continue
+        day = datetime.datetime.fromtimestamp(int(ts), datetime.timezone.utc).date().isoformat()
+        if after < day < before:
+            rows[day] = float(tvl)
+    return [(d, chain, v) for d, v in sorted(rows.items())]
+
+
+def top_chains(session, n=TOP_N):
+    chains_data = session.get(URL_CHAINS, timeout=60).json()
+    top = sorted(chains_data, key=lambda x: x.get("tvl") or 0, reverse=True)[:n]
+    return [c["name"].lower() for c in top]
+
+
+def run(out=OUT, top_n=TOP_N, workers=MAX_WORKERS, rate=RATE, burst=BURST, today=None):
+    """增量更新: 每條鏈只追加 watermark 之後的日資料; 已是最新的鏈不再請求
+
+    各鏈依完成順序追加 (當機時已寫入的鏈不用重抓), 結束前整個檔案再依 (day, chain) 排序。
+    """
+    today = today or datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    yesterday = (datetime.date.fromisoformat(today) - datetime.timedelta(days=1)).isoformat()
+    session = make_client(workers, rate, burst)
+
+    chain_names = top_chains(session, top_n)
+    print(f"Top {top_n} chains by TVL:", chain_names)
+
+    marks = load_watermarks(out)
+    pending = [c for c in chain_names if marks.get(c, "") < yesterday]
+    print(f"{len(chain_names) - len(pending)} chains up to date, fetching {len(pending)}")
+
+    new_file = not os.path.exists(out) or os.path.getsize(out) == 0
+    appended = 0
+    with open(out, "a", newline="", encoding="utf-8") as f, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        w = csv.writer(f)
+        if new_file:
+            w.writerow(["day", "chain", "tvl_usd"])
+        futures = {pool.submit(fetch_chain, session, c, marks.get(c, ""), today): c for c in pending}
+        for fut in as_completed(futures):
+            chain = futures[fut]
+            try:
+                rows = fut.result()
+            except Exception as e:
+                print(f"[WARN] {chain} failed: {e}")
+                continue
+            if rows:
+                w.writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+                marks[chain] = rows[-1][0]
+                appended += len(rows)
+            # 每條鏈完成即更新 watermark, 當機後重跑不會重抓已完成的鏈
+            save_watermarks(out, marks)
+    if appended:
+        sort_csv(out)
+        save_watermarks(out, marks)
+    print(f"Appended {appended} rows to {out}.")
+    return appended
+
+
+def mount_drive():
+    """Colab 時掛載 Google Drive; 不在 Colab 回傳 False"""
+    try:
+        from google.colab import drive
+    except ImportError:
+        return False
+    if not os.path.ismount("/content/drive"):
+        drive.mount('/content/drive')
+    return True
+
+
+def _copy(src, dst):
+    """先複製到暫存檔再 rename, 中途失敗不會留下半個檔案"""
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    shutil.copyfile(src, dst + ".tmp")
+    os.replace(dst + ".tmp", dst)
+
+
+def restore_from_drive(out=OUT, out_drive=OUT_DRIVE):
+    """本機沒有 CSV (新的 runtime) 時由 Drive 取回 CSV 與 watermark, 只抓之後的日資料"""
+    if os.path.exists(out) or not mount_drive() or not os.path.exists(out_drive):
+        return
+    _copy(out_drive, out)
+    if os.path.exists(state_path(out_drive)):
+        _copy(state_path(out_drive), state_path(out))
+    print(f"Restored {out} from Google Drive: {out_drive}")
+
+
+def copy_to_drive(out=OUT, out_drive=OUT_DRIVE):
+    if not mount_drive():
+        return
+    _copy(out, out_drive)
+    if os.path.exists(state_path(out)):
+        _copy(state_path(out), state_path(out_drive))
+    print(f"Also copied to Google Drive: {out_drive}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental DefiLlama chain TVL fetcher")
+    parser.add_argument("--out", default=OUT)
+    parser.add_argument("--top", type=int, default=TOP_N)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE)
+    args, _ = parser.parse_known_args()
+    restore_from_drive(args.out)
+    run(args.out, args.top, args.workers, args.rate)
+    copy_to_drive(args.out)
@@ -0,0 +1,315 @@
+"""Incremental weekly retention cohorts over dense address IDs and compressed bitmaps.
+
+    python retention_cohorts.py --ingest          # new dex_solana.trades from the dune_local store
+    python retention_cohorts.py --report          # same table as "Solana Retention Cohort Analysis - Week.sql"
+    python retention_cohorts.py --verify          # result vs the SQL on synthetic trades, and timings
+
+State (cohorts.db):
+    addresses   trader_id -> dense integer ID, cohort (first-seen) week
+    weeks       one compressed bitmap of active IDs per week
+
+IDs are handed out in first-seen order, so each cohort is a contiguous ID range and first-seen
+never has to be recomputed: a new batch only assigns IDs to addresses not seen before and ORs
+its IDs into the bitmaps of the weeks it touches. Retention week_n is |cohort & active(week + n)|,
+a bitmap intersection count instead of a COUNT(DISTINCT) join over a year of trades.
+
+Trades must arrive in block_time order (a watermark is kept); back-filled history needs --rebuild.
+"""
+import os
+import time
+import struct
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+DB_PATH = os.environ.get("COHORT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cohorts.db"))
+HORIZON = 10            # week_0 .. week_9
+ARRAY_MAX = 4096        # 超過此數量的 container 改用 65536-bit bitset
+
+
+class Bitmap:
+    """Roaring 風格的 uint32 集合: 依高 16 bit 分塊, 稀疏塊存排序的 uint16, 稠密塊存 1024 個 uint64"""
+    __slots__ = ('keys', 'containers', 'cardinality')
+
+    def __init__(self, keys=None, containers=None):
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.uint16)
+        self.containers = containers or []
+        self.cardinality = sum(self._count(c) for c in self.containers)
+
+    @staticmethod
+    def _count(container) -> int:
+        return int(np.bitwise_count(container).sum()) if container.dtype == np.uint64 else len(container)
+
+    @classmethod
+    def from_ids(cls, ids) -> 'Bitmap':
+        ids = np.unique(np.asarray(ids, dtype=np.uint32))
+        keys, starts = np.unique(ids >> 16, return_index=True)
+        containers = []
+        for low in np.split((ids & 0xFFFF).astype(np.uint16), starts[1:]):
+            if len(low) > ARRAY_MAX:
+                bits = np.zeros(1 << 16, dtype=bool)
+                bits[low] = True
+                containers.append(np.packbits(bits, bitorder='little').view(np.uint64))
+            else:
+                containers.append(low)
+        return cls(keys.astype(np.uint16), containers)
+
+    def to_ids(self) -> np.ndarray:
+        parts = []
+        for key, container in zip(self.keys, self.containers):
+            if container.dtype == np.uint64:
+                container = np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder='little'))
+            parts.append((np.uint32(key) << 16) | container.astype(np.uint32))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+
+    def __len__(self) -> int:
+        return self.cardinality
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap.from_ids(np.concatenate((self.to_ids(), other.to_ids())))
+
+    def and_cardinality(self, other: 'Bitmap') -> int:
+        """交集大小, 逐個共同的 container 計算, 不展開成 ID"""
+        _, mine, theirs = np.intersect1d(self.keys, other.keys, assume_unique=True, return_indices=True)
+        total = 0
+        for i, j in zip(mine, theirs):
+            a, b = self.containers[i], other.containers[j]
+            if a.dtype == np.uint64 and b.dtype == np.uint64:
+                total += int(np.bitwise_count(a & b).sum())
+            elif a.dtype == np.uint64 or b.dtype == np.uint64:
+                words, low = (a, b) if a.dtype == np.uint64 else (b, a)
+                total += int(((words[low >> 6] >> (low & 63).astype(np.uint64)) & np.uint64(1)).sum())
+            else:
+                total += len(np.intersect1d(a, b, assume_unique=True))
+        return total
+
+    def to_bytes(self) -> bytes:
+        counts = np.array([self._count(c) for c in self.containers], dtype=np.uint32)
+        return struct.pack('<I', len(self.keys)) + self.keys.tobytes() + counts.tobytes() + \
+            b''.join(c.tobytes() for c in self.containers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Bitmap':
+        n, = struct.unpack_from('<I', data)
+        offset = 4
+        keys = np.frombuffer(data, dtype=np.uint16, count=n, offset=offset)
+        offset += 2 * n
+        counts = np.frombuffer(data, dtype=np.uint32, count=n, offset=offset)
+        offset += 4 * n
+        containers = []
+        for count in counts:
+            if count > ARRAY_MAX:
+                containers.append(np.frombuffer(data, dtype=np.uint64, count=1024, offset=offset))
+                offset += 8192
+            else:
+                containers.append(np.frombuffer(data, dtype=np.uint16, count=count, offset=offset))
+                offset += 2 * int(count)
+        return cls(keys, containers)
+
+
+def week_start(ts) -> np.ndarray:
+    """datetime -> 該週週一 (與 date_trunc('week', ...) 相同, 以 1970-01-01 起算的日數表示)"""
+    days = np.asarray(pd.to_datetime(ts).values.astype('datetime64[D]').astype(np.int64))
+    return days - (days + 3) % 7
+
+
+def _day(days: int) -> str:
+    return str(np.datetime64(int(days), 'D'))
+
+
+class CohortEngine:
+    """地址字典 + 每週活躍 bitmap; add() 增量寫入, retention() 以 bitmap 交集計算留存"""
+
+    def __init__(self, path: str = DB_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS addresses (
+            address TEXT PRIMARY KEY, id INTEGER NOT NULL, cohort_week INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS weeks (
+            week INTEGER PRIMARY KEY, actives INTEGER, bitmap BLOB
+        );
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY, value TEXT
+        );
+        """)
+        rows = self.conn.execute("SELECT address, id, cohort_week FROM addresses ORDER BY id").fetchall()
+        self.ids = {address: i for address, i, _ in rows}
+        self.cohort = np.array([week for _, _, week in rows], dtype=np.int64)   # 依 ID 排序, 非遞減
+        self.weeks = {week: Bitmap.from_bytes(blob) for week, blob in
+                      self.conn.execute("SELECT week, bitmap FROM weeks")}
+        row = self.conn.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+        self.watermark = pd.Timestamp(row[0]) if row else None
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, trades: pd.DataFrame) -> int:
+        """加入 watermark 之後的交易 (block_time, trader_id); 回傳新地址數"""
+        trades = trades.dropna(subset=['trader_id'])
+        if trades.empty:
+            return 0
+        block_time = pd.to_datetime(trades['block_time'])
+        if self.watermark is not None and block_time.min() <= self.watermark:
+            raise ValueError(f"Trades at or before the watermark {self.watermark}; run with --rebuild")
+        weeks = week_start(block_time)
+        codes, addresses = pd.factorize(trades['trader_id'].to_numpy(dtype=object))
+        first = np.full(len(addresses), np.iinfo(np.int64).max)
+        np.minimum.at(first, codes, weeks)
+
+        # 新地址依首次出現的週排序後給 ID, 維持每個 cohort 是連續的 ID 區間
+        ids = np.array([self.ids.get(address, -1) for address in addresses], dtype=np.int64)
+        new = np.flatnonzero(ids < 0)
+        new = new[np.argsort(first[new], kind='stable')]
+        start = len(self.cohort)
+        ids[new] = np.arange(start, start + len(new))
+        self.ids.update(zip(addresses[new], range(start, start + len(new))))
+        self.cohort = np.concatenate((self.cohort, first[new]))
+        active = pd.DataFrame({'week': weeks, 'id': ids[codes]})
+        rows = []
+        for week, members in active.groupby('week')['id']:
+            bitmap = Bitmap.from_ids(members.to_numpy())
+            if week in self.weeks:
+                bitmap = bitmap | self.weeks[week]
+            self.weeks[week] = bitmap
+            rows.append((int(week), len(bitmap), bitmap.to_bytes()))
+        self.watermark = block_time.max()
+        with self.conn:
+            self.conn.executemany("INSERT INTO addresses VALUES (?, ?, ?)",
+                                  zip(addresses[new], range(start, start + len(new)), first[new].tolist()))
+            self.conn.executemany("INSERT OR REPLACE INTO weeks VALUES (?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO state VALUES ('watermark', ?)", (self.watermark.isoformat(),))
+        return len(new)
+
+    def ingest_store(self, con) -> int:
+        """dune_local 的 dex_solana.trades 中 watermark 之後的交易, 一次讀一週"""
+        lower = self.watermark if self.watermark is not None else pd.Timestamp('1970-01-01')
+        last = con.execute("SELECT MAX(block_time) FROM dex_solana.trades").fetchone()[0]
+        added = 0
+        while last is not None and lower < pd.Timestamp(last):
+            upper = con.execute("SELECT MIN(block_time) FROM dex_solana.trades WHERE block_time > ?",
+                                [lower.to_pydatetime()]).fetchone()[0]
+            upper = pd.Timestamp(upper) + timedelta(days=7)
+            trades = con.execute("""
+                SELECT block_time, trader_id FROM dex_solana.trades
+                WHERE block_time > ? AND block_time <= ?
+            """, [lower.to_pydatetime(), upper.to_pydatetime()]).df()
+            added += self.add(trades)
+            lower = upper
+        return added
+
+    def rebuild(self):
+        """清空所有狀態 (補進較舊的歷史後, 再由 ingest 全部重建)"""
+        with self.conn:
+            self.conn.executescript("DELETE FROM addresses; DELETE FROM weeks; DELETE FROM state;")
+        self.ids, self.cohort, self.weeks, self.watermark = {}, np.empty(0, dtype=np.int64), {}, None
+
+    def retention(self, now: datetime = None) -> pd.DataFrame:
+        """與 SQL 相同: 一年內的 cohort, cohort_size 與 week_0..week_9 (無留存者為 NULL)"""
+        now = pd.Timestamp(now or datetime.now(timezone.utc).replace(tzinfo=None))
+        this_week = int(week_start([now])[0])
+        start_week = int(week_start([now - pd.DateOffset(years=1)])[0])
+        columns = ['cohort_week', 'cohort_size'] + [f"week_{n}" for n in range(HORIZON)]
+        rows = []
+        for week in range(start_week, this_week + 1, 7):
+            lo, hi = np.searchsorted(self.cohort, [week, week + 1])
+            if lo == hi:
+                continue
+            cohort = Bitmap.from_ids(np.arange(lo, hi))
+            size = hi - lo
+            row = [pd.Timestamp(_day(week)), size]
+            for n in range(HORIZON):
+                active = self.weeks.get(week + 7 * n) if week + 7 * n <= this_week else None
+                retained = cohort.and_cardinality(active) if active is not None else 0
+                row.append(f"{100.0 * retained / size:.1f}%" if retained else None)
+            rows.append(row)
+        return pd.DataFrame(rows, columns=columns)
+
+
+def verify(n_trades: int = 1_000_000, n_addresses: int = 200_000, days: int = 420, seed: int = 13):
+    """合成交易: 與 dune_local 上的 SQL 逐格比對, 並比較整年重算與增量一週的耗時"""
+    import tempfile
+    import dune_local
+    rng = np.random.default_rng(seed)
+    as_of = dune_local.AS_OF
+    # 地址的首次出現時間均勻分布, 之後的活躍次數呈長尾
+    born = rng.uniform(0, days * 86400, n_addresses)
+    owner = np.minimum((rng.pareto(1.2, n_trades) * n_addresses / 50).astype(np.int64), n_addresses - 1)
+    owner = rng.permutation(n_addresses)[owner]
+    offset = born[owner] + rng.exponential(30 * 86400, n_trades)
+    keep = offset < days * 86400
+    trades = pd.DataFrame({
+        'block_time': pd.Timestamp(as_of) - pd.Timedelta(days=days) + pd.to_timedelta(offset[keep], unit='s'),
+        'trader_id': np.char.add('w', owner[keep].astype(str)),
+    }).sort_values('block_time', ignore_index=True)
+    con = dune_local.connect(':memory:')
+    dune_local.ingest(con, 'dex_solana.trades', trades)
+
+    started = time.perf_counter()
+    expected = dune_local.run_query(con, 'Solana Retention Cohort Analysis - Week.sql', as_of=as_of)
+    sql_ms = (time.perf_counter() - started) * 1000
+
+    path = os.path.join(tempfile.mkdtemp(), "cohorts.db")
+    engine = CohortEngine(path)
+    last_week = pd.Timestamp(_day(int(week_start([as_of])[0])))
+    started = time.perf_counter()
+    engine.add(trades[trades['block_time'] < last_week])
+    cold_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    engine.add(trades[trades['block_time'] >= last_week])
+    week_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    result = engine.retention(as_of)
+    report_ms = (time.perf_counter() - started) * 1000
+    engine.close()
+
+    reopened = CohortEngine(path)
+    pd.testing.assert_frame_equal(reopened.retention(as_of), result)
+    expected['cohort_week'] = pd.to_datetime(expected['cohort_week'])
+    result['cohort_week'] = result['cohort_week'].astype(expected['cohort_week'].dtype)
+    weeks = [c for c in expected.columns if c.startswith('week_')]
+    pd.testing.assert_frame_equal(result.drop(columns=weeks), expected.drop(columns=weeks), check_dtype=False)
+    assert (result[weeks].fillna('') == expected[weeks].fillna('')).all().all(), "retention differs from the SQL"
+    sizes = [len(b) for b in reopened.conn.execute("SELECT bitmap FROM weeks").fetchall() for b in b]
+    reopened.close()
+    print(f"{len(trades):,} trades, {len(reopened.ids):,} addresses, {len(result)} cohorts: identical to the SQL")
+    print(f"SQL full recompute       {sql_ms:9.1f} ms")
+    print(f"engine cold build        {cold_ms:9.1f} ms")
+    print(f"engine add last week     {week_ms:9.1f} ms")
+    print(f"engine retention report  {report_ms:9.1f} ms")
+    print(f"week bitmaps: {sum(sizes) / 2 ** 10:.0f} KB total, db {os.path.getsize(path) / 2 ** 20:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--ingest', action='store_true', help='add new trades from the dune_local store')
+    parser.add_argument('--rebuild', action='store_true', help='drop all state before ingesting')
+    parser.add_argument('--report', action='store_true')
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+
+    if args.verify:
+        verify()
+        return
+    engine = CohortEngine(args.db)
+    if args.rebuild:
+        engine.rebuild()
+    if args.ingest or args.rebuild:
+        import dune_local
+        con = dune_local.connect()
+        started = time.perf_counter()
+        added = engine.ingest_store(con)
+        print(f"{added:,} new addresses in {(time.perf_counter() - started) * 1000:.1f} ms")
+        con.close()
+    if args.report:
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(engine.retention())
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
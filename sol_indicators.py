@@ -0,0 +1,503 @@
+"""Streaming and batch technical indicators with the same definitions as the repo's .sql files.
+
+    from sol_indicators import IndicatorEngine
+    engine = IndicatorEngine()
+    engine.seed(daily_bars)                   # DataFrame day, open, high, low, close
+    values = engine.update(ts, price)         # O(1) per tick, values for the current (open) day
+
+    python sol_indicators.py --verify         # batch and streaming vs the SQL, bit for bit
+
+Definitions (daily UTC bars, windows are `ROWS BETWEEN n-1 PRECEDING AND CURRENT ROW`, so the
+first n-1 rows use partial windows; NULL inputs are skipped by AVG / STDDEV like in SQL):
+
+    RSI(14).sql                  gain/loss = GREATEST(+-(close - prev close), 0), simple 14-row averages,
+                                 rsi = 100 when avg_loss is NULL or 0
+    ATR(14).sql                  true range = GREATEST(h - l, |h - prev c|, |l - prev c|) (NULL on the first row)
+    SOL - Keltner Channel.sql    mid = 20-row AVG((h + l + c) / 3), +-2 x 10-row ATR, TR COALESCEd to h - l
+    SOL - Bollinger *.sql        20-row AVG / sample STDDEV of close, %B, bandwidth (30-row bands for 90D view)
+    SOL - Donchian breakout      20-row MAX(high) / MIN(low) including the current row
+    TTM Squeeze Flag.sql         4 x std20 < 4 x AVG(h - l) over 10 rows
+
+Window sums are accumulated in row order and the standard deviation with Welford updates, which is
+how Trino evaluates each frame (DuckDB does the same with debug_window_mode = 'separate'; its default
+segment tree reorders the additions and can differ in the last bit).
+"""
+import math
+import time
+import argparse
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+NAN = float('nan')
+
+
+# ==================== 串流 (逐筆 O(1)) ====================
+class RollingWindow:
+    """最近 n 列 (含目前未收盤的一列) 的 AVG / STDDEV_SAMP / MAX / MIN
+
+    已收盤的前 n-1 列在 push() 時依時間順序重新累加一次 (n 為常數), 查詢時才加上目前這列,
+    運算順序與 SQL 逐窗計算相同, 因此結果逐位元一致, 也沒有加減造成的誤差累積。
+    NaN 代表 NULL, 不計入。
+    """
+    __slots__ = ('n', 'values', 'total', 'count', 'mean_', 'm2', 'high', 'low')
+
+    def __init__(self, n: int):
+        self.n = n
+        self.values = deque(maxlen=n - 1)
+        self._recompute()
+
+    def _recompute(self):
+        total, count, mean, m2 = 0.0, 0, 0.0, 0.0
+        high = low = NAN
+        for v in self.values:
+            if v != v:
+                continue
+            total += v
+            count += 1
+            delta = v - mean
+            mean += delta / count
+            m2 += delta * (v - mean)
+            high = v if not high >= v else high
+            low = v if not low <= v else low
+        self.total, self.count, self.mean_, self.m2, self.high, self.low = total, count, mean, m2, high, low
+
+    def push(self, value: float):
+        """目前這列收盤, 成為之後各列窗口中的一筆"""
+        self.values.append(value)
+        self._recompute()
+
+    def mean(self, value: float) -> float:
+        if value != value:
+            return self.total / self.count if self.count else NAN
+        return (self.total + value) / (self.count + 1)
+
+    def std(self, value: float) -> float:
+        count, mean, m2 = self.count, self.mean_, self.m2
+        if value == value:
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+        return math.sqrt(m2 / (count - 1)) if count > 1 else NAN
+
+    def max(self, value: float) -> float:
+        return value if not self.high >= value else self.high
+
+    def min(self, value: float) -> float:
+        return value if not self.low <= value else self.low
+
+
+def _greatest(*values) -> float:
+    """Trino GREATEST: 任一參數為 NULL 時回傳 NULL"""
+    return NAN if any(v != v for v in values) else max(values)
+
+
+class RSI:
+    __slots__ = ('gain', 'loss', 'prev_close')
+
+    def __init__(self, n: int = 14):
+        self.gain = RollingWindow(n)
+        self.loss = RollingWindow(n)
+        self.prev_close = NAN
+
+    def _changes(self, close: float) -> tuple:
+        return _greatest(close - self.prev_close, 0.0), _greatest(self.prev_close - close, 0.0)
+
+    def value(self, close: float) -> float:
+        gain, loss = self._changes(close)
+        avg_gain, avg_loss = self.gain.mean(gain), self.loss.mean(loss)
+        if avg_loss != avg_loss or avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + (avg_gain / avg_loss))
+
+    def push(self, close: float):
+        gain, loss = self._changes(close)
+        self.gain.push(gain)
+        self.loss.push(loss)
+        self.prev_close = close
+
+
+class ATR:
+    """coalesce=True 時第一列的 true range 退回 high - low (Keltner 的寫法)"""
+    __slots__ = ('window', 'coalesce', 'prev_close')
+
+    def __init__(self, n: int = 14, coalesce: bool = False):
+        self.window = RollingWindow(n)
+        self.coalesce = coalesce
+        self.prev_close = NAN
+
+    def true_range(self, high: float, low: float) -> float:
+        tr = _greatest(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        return high - low if self.coalesce and tr != tr else tr
+
+    def value(self, high: float, low: float) -> float:
+        return self.window.mean(self.true_range(high, low))
+
+    def push(self, high: float, low: float, close: float):
+        self.window.push(self.true_range(high, low))
+        self.prev_close = close
+
+
+class Bollinger:
+    __slots__ = ('window', 'k')
+
+    def __init__(self, n: int = 20, k: float = 2):
+        self.window = RollingWindow(n)
+        self.k = k
+
+    def value(self, close: float) -> dict:
+        sma, std = self.window.mean(close), self.window.std(close)
+        return {
+            'bb_mid': sma,
+            'bb_upper': sma + self.k * std,
+            'bb_lower': sma - self.k * std,
+            'pct_b': (close - sma + self.k * std) / (2 * self.k * std) if std > 0 else NAN,
+            'bandwidth': (2 * self.k * std) / sma if sma > 0 else NAN,
+        }
+
+    def push(self, close: float):
+        self.window.push(close)
+
+
+class Keltner:
+    __slots__ = ('typical', 'atr', 'k')
+
+    def __init__(self, n: int = 20, atr_n: int = 10, k: float = 2):
+        self.typical = RollingWindow(n)
+        self.atr = ATR(atr_n, coalesce=True)
+        self.k = k
+
+    def value(self, high: float, low: float, close: float) -> dict:
+        mid = self.typical.mean((high + low + close) / 3.0)
+        atr = self.atr.value(high, low)
+        return {'kc_mid': mid, 'kc_upper': mid + self.k * atr, 'kc_lower': mid - self.k * atr}
+
+    def push(self, high: float, low: float, close: float):
+        self.typical.push((high + low + close) / 3.0)
+        self.atr.push(high, low, close)
+
+
+class Donchian:
+    __slots__ = ('highs', 'lows')
+
+    def __init__(self, n: int = 20):
+        self.highs = RollingWindow(n)
+        self.lows = RollingWindow(n)
+
+    def value(self, high: float, low: float, close: float) -> dict:
+        upper, lower = self.highs.max(high), self.lows.min(low)
+        return {'donchian_high': upper, 'donchian_low': lower,
+                'breakout_up': int(close > upper), 'breakout_down': int(close < lower)}
+
+    def push(self, high: float, low: float):
+        self.highs.push(high)
+        self.lows.push(low)
+
+
+class TTMSqueeze:
+    __slots__ = ('close', 'range')
+
+    def __init__(self, n: int = 20, atr_n: int = 10):
+        self.close = RollingWindow(n)
+        self.range = RollingWindow(atr_n)
+
+    def value(self, high: float, low: float, close: float) -> int:
+        return int(4 * self.close.std(close) < 4 * self.range.mean(high - low))
+
+    def push(self, high: float, low: float, close: float):
+        self.close.push(close)
+        self.range.push(high - low)
+
+
+class IndicatorEngine:
+    """逐筆價格 -> UTC 日 K (與 SQL 的 date_trunc('day', minute) 相同) -> 各指標
+
+    update() 只更新目前這根日 K 的 OHLC 並以 O(1) 算出各指標; 跨日時前一根日 K 收盤並 push 進各窗口。
+    """
+    __slots__ = ('day', 'open', 'high', 'low', 'close', 'bars',
+                 'rsi', 'atr', 'bollinger', 'keltner', 'donchian', 'squeeze')
+
+    def __init__(self):
+        self.day = None
+        self.open = self.high = self.low = self.close = NAN
+        self.bars = 0
+        self.rsi = RSI(14)
+        self.atr = ATR(14)
+        self.bollinger = Bollinger(20, 2)
+        self.keltner = Keltner(20, 10, 2)
+        self.donchian = Donchian(20)
+        self.squeeze = TTMSqueeze(20, 10)
+
+    def _push_bar(self):
+        h, l, c = self.high, self.low, self.close
+        self.rsi.push(c)
+        self.atr.push(h, l, c)
+        self.bollinger.push(c)
+        self.keltner.push(h, l, c)
+        self.donchian.push(h, l)
+        self.squeeze.push(h, l, c)
+        self.bars += 1
+
+    def seed(self, bars: pd.DataFrame):
+        """歷史日 K (day, open, high, low, close, 依 day 排序); 最後一根若是今天 (UTC) 則作為未收盤的 K 棒"""
+        today = int(time.time()) // 86400
+        for row in bars.itertuples(index=False):
+            day = int(pd.Timestamp(row.day).value // 86400_000_000_000)
+            if self.day is not None and day <= self.day:
+                continue
+            if self.day is not None:
+                self._push_bar()
+            self.day, self.open, self.high, self.low, self.close = day, row.open, row.high, row.low, row.close
+        if self.day is not None and self.day < today:
+            self._push_bar()
+            self.day = None
+
+    def update(self, ts: float, price: float) -> dict:
+        day = int(ts) // 86400
+        if self.day is None or day > self.day:
+            if self.day is not None:
+                self._push_bar()
+            self.day, self.open, self.high, self.low = day, price, price, price
+        elif day < self.day:
+            return self.values()    # 亂序的舊資料不影響已收盤的 K 棒
+        self.high = price if price > self.high else self.high
+        self.low = price if price < self.low else self.low
+        self.close = price
+        return self.values()
+
+    def values(self) -> dict:
+        h, l, c = self.high, self.low, self.close
+        out = {'day': self.day, 'bars': self.bars + (self.day is not None),
+               'open': self.open, 'high': h, 'low': l, 'close': c,
+               'rsi14': self.rsi.value(c), 'atr14': self.atr.value(h, l), 'squeeze': self.squeeze.value(h, l, c)}
+        out.update(self.bollinger.value(c))
+        out.update(self.keltner.value(h, l, c))
+        out.update(self.donchian.value(h, l, c))
+        return out
+
+
+# ==================== 批次 (向量化) ====================
+def _windows(values, n: int) -> np.ndarray:
+    """(len, n) 的視窗矩陣, 前 n-1 列左側補 NaN (部分窗口)"""
+    values = np.asarray(values, dtype=np.float64)
+    return sliding_window_view(np.concatenate((np.full(n - 1, np.nan), values)), n)
+
+
+def rolling_mean(values, n: int) -> np.ndarray:
+    """SQL AVG(x) OVER (ROWS n-1 PRECEDING): 逐列依序加總 (跨列向量化), NULL 不計"""
+    w = _windows(values, n)
+    valid = ~np.isnan(w)
+    total = np.zeros(len(w))
+    for k in range(n):
+        total += np.where(valid[:, k], w[:, k], 0.0)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def rolling_std(values, n: int) -> np.ndarray:
+    """SQL STDDEV (樣本標準差): 逐列 Welford 更新, 少於 2 筆為 NULL"""
+    w = _windows(values, n)
+    count = np.zeros(len(w))
+    mean = np.zeros(len(w))
+    m2 = np.zeros(len(w))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for k in range(n):
+            v = w[:, k]
+            ok = ~np.isnan(v)
+            c = count + ok
+            delta = v - mean
+            new_mean = mean + delta / c
+            m2 = np.where(ok, m2 + delta * (v - new_mean), m2)
+            mean = np.where(ok, new_mean, mean)
+            count = c
+        return np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+
+
+def rolling_max(values, n: int) -> np.ndarray:
+    return np.fmax.reduce(_windows(values, n), axis=1)
+
+
+def rolling_min(values, n: int) -> np.ndarray:
+    return np.fmin.reduce(_windows(values, n), axis=1)
+
+
+def lag(values) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return np.concatenate(([np.nan], values[:-1]))
+
+
+def greatest(*arrays) -> np.ndarray:
+    """Trino GREATEST (np.maximum 遇到 NaN 即回傳 NaN)"""
+    out = np.asarray(arrays[0], dtype=np.float64)
+    for a in arrays[1:]:
+        out = np.maximum(out, a)
+    return out
+
+
+def true_range(high, low, close, coalesce: bool = False) -> np.ndarray:
+    high, low = np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64)
+    prev = lag(close)
+    tr = greatest(high - low, np.abs(high - prev), np.abs(low - prev))
+    return np.where(np.isnan(tr), high - low, tr) if coalesce else tr
+
+
+def rsi(close, n: int = 14) -> np.ndarray:
+    close = np.asarray(close, dtype=np.float64)
+    prev = lag(close)
+    avg_gain = rolling_mean(greatest(close - prev, 0.0), n)
+    avg_loss = rolling_mean(greatest(prev - close, 0.0), n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = 100.0 - 100.0 / (1.0 + (avg_gain / avg_loss))
+    return np.where(np.isnan(avg_loss) | (avg_loss == 0), 100.0, value)
+
+
+def atr(high, low, close, n: int = 14, coalesce: bool = False) -> np.ndarray:
+    return rolling_mean(true_range(high, low, close, coalesce), n)
+
+
+def bollinger(close, n: int = 20, k: float = 2) -> dict:
+    close = np.asarray(close, dtype=np.float64)
+    sma, std = rolling_mean(close, n), rolling_std(close, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'bb_mid': sma,
+            'bb_upper': sma + k * std,
+            'bb_lower': sma - k * std,
+            'pct_b': np.where(std > 0, (close - sma + k * std) / (2 * k * std), np.nan),
+            'bandwidth': np.where(sma > 0, (2 * k * std) / sma, np.nan),
+        }
+
+
+def keltner(high, low, close, n: int = 20, atr_n: int = 10, k: float = 2) -> dict:
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+    mid = rolling_mean((high + low + close) / 3.0, n)
+    width = atr(high, low, close, atr_n, coalesce=True)
+    return {'kc_mid': mid, 'kc_upper': mid + k * width, 'kc_lower': mid - k * width}
+
+
+def donchian(high, low, close, n: int = 20) -> dict:
+    upper, lower = rolling_max(high, n), rolling_min(low, n)
+    close = np.asarray(close, dtype=np.float64)
+    return {'donchian_high': upper, 'donchian_low': lower,
+            'breakout_up': (close > upper).astype(int), 'breakout_down': (close < lower).astype(int)}
+
+
+def ttm_squeeze(high, low, close, n: int = 20, atr_n: int = 10) -> np.ndarray:
+    high, low = np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return (4 * rolling_std(close, n) < 4 * rolling_mean(high - low, atr_n)).astype(int)
+
+
+def batch(bars: pd.DataFrame) -> pd.DataFrame:
+    """日 K (day, open, high, low, close) -> 與 IndicatorEngine.values() 相同欄位的整段序列"""
+    h, l, c = (bars[col].to_numpy(np.float64) for col in ('high', 'low', 'close'))
+    out = bars[['day', 'open', 'high', 'low', 'close']].reset_index(drop=True)
+    out['rsi14'] = rsi(c)
+    out['atr14'] = atr(h, l, c)
+    out['squeeze'] = ttm_squeeze(h, l, c)
+    for columns in (bollinger(c), keltner(h, l, c), donchian(h, l, c)):
+        for name, values in columns.items():
+            out[name] = values
+    return out
+
+
+# 每個 .sql 的輸出: (日 K 回看天數, 起點, 由日 K 算出與查詢相同欄位的函式); since 為輸出的起始日
+QUERIES = {
+    'RSI(14).sql': (90, 'now', lambda b, since: pd.DataFrame({
+        'day': b.day, 'close': b.close, 'rsi14': rsi(b.close)})),
+    'ATR(14).sql': (110, 'today', lambda b, since: pd.DataFrame({
+        'day': b.day.dt.date, 'close': b.close, 'atr14': atr(b.high, b.low, b.close)})[b.day >= since]),
+    'SOL - Keltner Channel.sql': (120, 'today', lambda b, since: pd.DataFrame({
+        'day': b.day.dt.date, 'close': b.close,
+        **dict(zip(('mid', 'kc_upper', 'kc_lower'), keltner(b.high, b.low, b.close).values()))})[b.day >= since]),
+    'TTM Squeeze Flag.sql': (120, 'today', lambda b, since: pd.DataFrame({
+        'day': b.day.dt.date, 'squeeze_flag': ttm_squeeze(b.high, b.low, b.close)})[b.day >= since]),
+    'SOL - Donchian breakout (20D).sql': (120, 'today', lambda b, since: pd.DataFrame({
+        'day': b.day.dt.date, 'close': b.close,
+        **dict(zip(('donchian_high_20', 'donchian_low_20', 'breakout_up', 'breakout_down'),
+                   donchian(b.high, b.low, b.close).values()))})[b.day >= since]),
+    'SOL - Bollinger Band (90D View).sql': (90, 'today', lambda b, since: pd.DataFrame({
+        'day': b.day, 'open': b.open, 'close': b.close,
+        'ma20': rolling_mean(b.close, 20), 'ma40': rolling_mean(b.close, 40), 'sma30': rolling_mean(b.close, 30),
+        'upper_band': bollinger(b.close, 30)['bb_upper'], 'lower_band': bollinger(b.close, 30)['bb_lower']})),
+    'SOL - Bollinger %B (20D).sql': (90, 'today', lambda b, since: pd.DataFrame({
+        'Date (UTC)': b.day, 'Bollinger %B (20D)': bollinger(b.close)['pct_b']})),
+    'SOL - Bollinger Bandwidth (20D).sql': (90, 'today', lambda b, since: pd.DataFrame({
+        'Date (UTC)': b.day, 'Bollinger Bandwidth (20D)': bollinger(b.close)['bandwidth']})),
+}
+
+
+def _same_bits(a, b) -> bool:
+    """逐位元比較 (NaN 與 NULL 視為相同)"""
+    a = pd.Series(a).to_numpy()
+    b = pd.Series(b).to_numpy()
+    if a.dtype.kind == 'f' or b.dtype.kind == 'f':
+        a, b = a.astype(np.float64), b.astype(np.float64)
+        both_nan = np.isnan(a) & np.isnan(b)
+        return bool(np.all(both_nan | (a.view(np.int64) == b.view(np.int64))))
+    return bool(np.all(a == b))
+
+
+def verify(days: int = 130) -> bool:
+    """合成分鐘價格: 各 .sql (DuckDB 逐窗計算) vs 批次 vs 逐筆串流, 全部逐位元比較"""
+    import dune_local
+    as_of = dune_local.AS_OF
+    con = dune_local.connect(':memory:')
+    con.execute("PRAGMA debug_window_mode = 'separate'")
+    prices = dune_local.synthetic_prices(as_of, days)
+    dune_local.ingest(con, 'prices.usd', prices)
+    today = pd.Timestamp(as_of).normalize()
+
+    def daily(start):
+        return con.execute("""
+            SELECT date_trunc('day', minute) AS day, arg_min(price, minute) AS open, MAX(price) AS high,
+                   MIN(price) AS low, arg_max(price, minute) AS close
+            FROM prices.usd WHERE symbol = 'SOL' AND minute >= ? GROUP BY 1 ORDER BY 1
+        """, [start.to_pydatetime()]).df()
+
+    ok = True
+    for name, (lookback, anchor, fn) in QUERIES.items():
+        start = (pd.Timestamp(as_of) if anchor == 'now' else today) - pd.Timedelta(days=lookback)
+        expected = dune_local.run_query(con, name, as_of=as_of).reset_index(drop=True)
+        got = fn(daily(start), today - pd.Timedelta(days=90)).reset_index(drop=True)
+        same = list(expected.columns) == list(got.columns) and len(expected) == len(got) and all(
+            _same_bits(expected[c], got[c]) if c not in ('day', 'Date (UTC)')
+            else (pd.to_datetime(expected[c]) == pd.to_datetime(got[c])).all()
+            for c in expected.columns)
+        ok &= same
+        print(f"{'ok ' if same else 'FAIL'} batch     {name:<40} {len(expected)} rows")
+
+    # 串流: 逐分鐘餵入, 每天最後一筆的數值 = 該日收盤後的批次結果 (最後一天為未收盤的 K 棒)
+    bars = daily(pd.Timestamp(prices.minute.iloc[0]))
+    reference = batch(bars)
+    engine = IndicatorEngine()
+    ts = prices.minute.to_numpy('datetime64[s]').astype(np.int64)
+    px = prices.price.to_numpy()
+    last_of_day = np.flatnonzero(np.diff(ts // 86400, append=-1) != 0)
+    snapshots = []
+    started = time.perf_counter()
+    for i in range(len(ts)):
+        values = engine.update(ts[i], px[i])
+        if i == last_of_day[len(snapshots)]:
+            snapshots.append(values)
+    elapsed = time.perf_counter() - started
+    streamed = pd.DataFrame(snapshots)
+    columns = [c for c in reference.columns if c != 'day']
+    mismatched = [c for c in columns if not _same_bits(reference[c], streamed[c])]
+    ok &= not mismatched
+    print(f"{'ok ' if not mismatched else 'FAIL'} streaming {len(ts):,} ticks, {len(snapshots)} days, "
+          f"{len(ts) / elapsed:,.0f} ticks/s" + (f" mismatched: {mismatched}" if mismatched else ""))
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+    if args.verify:
+        raise SystemExit(0 if verify() else 1)
+    parser.print_help()
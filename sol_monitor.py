@@ -0,0 +1,1272 @@
+"""SOL-USDT spot / futures / perpetual risk monitor.
+
+    from sol_monitor import Config, SOLMonitor
+    Config.DB_PATH = "sol_risk.db"
+    monitor = SOLMonitor({'sender_email': ..., 'sender_password': ..., 'recipients': [...]})
+    monitor.start()               # REST polling every MONITOR_INTERVAL
+    monitor.start_streaming()     # WebSocket books (sol_orderbook_stream), sub-second evaluation
+    monitor.start_scheduler()     # Config.INSTRUMENTS across venues (sol_monitor_scheduler)
+
+Config holds every setting; SOLMonitor passes them to the storage
+(sol_monitor_store), alerting (sol_monitor_alerts), metrics (sol_monitor_metrics)
+and scheduling (sol_monitor_scheduler) modules. The Colab notebook script
+"SOL-USDT Spot, Future, Perpetual Future Risk Management.py" is the entry point:
+it mounts Drive, loads the e-mail settings and starts the monitor.
+"""
+import os
+import time
+import json
+import requests
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+import numpy as np
+from typing import Callable, Dict, List, Optional
+
+from sol_monitor_alerts import AlertDispatcher, RuleEngine
+from sol_monitor_metrics import Metrics
+from sol_monitor_scheduler import MonitorScheduler, instrument_key
+from sol_monitor_store import MarketStore, MarketTiers
+
+try:
+    from http_cache import CachedSession
+except ImportError:
+    CachedSession = None
+
+try:
+    from sol_indicators import IndicatorEngine
+except ImportError:
+    IndicatorEngine = None
+
+
+class Config:
+    """系統配置"""
+    MONITOR_INTERVAL = 300  # 5分鐘
+    DEPTH_STD_THRESHOLD = 1.0
+    VRP_MIN_THRESHOLD = 0.01
+    SPREAD_MAX_BPS = 20
+    EMAIL_COOLDOWN = 1800  # 30分鐘
+
+    # 警報寄送 (AlertDispatcher 背景執行緒, 不阻塞監控迴圈)
+    SMTP_HOST = "smtp.gmail.com"
+    SMTP_PORT = 587
+    SMTP_STARTTLS = True
+    SMTP_TIMEOUT = 20                # 連線/寄送逾時(秒)
+    SMTP_IDLE_TIMEOUT = 240          # 連線閒置超過此秒數就關閉 (Gmail 約 5 分鐘會自行斷線)
+    ALERT_DIGEST_WINDOW = 2.0        # 第一則警報後等待合併的秒數, 同時觸發的警報寄成一封
+    ALERT_QUEUE_MAX = 1000
+    STATS_WINDOW = 30 * 24 * 3600  # 深度/波動率統計窗口(秒)
+    MIN_DEPTH_SAMPLES = 10
+
+    # 訂單簿抓取
+    FETCH_MODE = "concurrent"  # "concurrent" 或 "sequential"
+    FETCH_QUORUM = 1           # 需要幾個來源回應才返回 (> 1 時交叉比對各來源的 mid)
+    FETCH_QUORUM_TOLERANCE_BPS = 50  # quorum 比對: mid 偏離中位數超過此值的來源剔除
+    FETCH_TIMEOUT = 10         # 單次請求逾時(秒)
+    FETCH_DEADLINE = 30        # 整體等待上限(秒)
+    HEDGE_DELAY = 0.0          # 每個後備來源延遲啟動(秒), 0 = 全部同時發送
+
+    # WebSocket 串流模式
+    STREAMING = False
+    STREAM_EVAL_INTERVAL = 0.5       # 即時訂單簿評估間隔(秒)
+    STREAM_PERSIST_INTERVAL = 300    # 串流模式寫入 market_data 的間隔(秒); cooldown 中持續觸發的警報也最多每隔此秒數寫一列 alerts
+    PRICE_REFRESH_INTERVAL = 60      # CoinGecko 價格快取(秒)
+
+    # 多商品排程 (INSTRUMENTS 非空時 main() 改用 MonitorScheduler)
+    # 例: {'venue': 'KuCoin', 'symbol': 'SOL-USDT', 'market': 'perp', 'coingecko_id': 'solana'}
+    INSTRUMENTS: List[Dict] = []
+    SCHEDULER_WORKERS = 16
+    SCHEDULER_JITTER = 0.1           # 排程抖動 (佔 interval 的比例)
+    VENUE_LIMITS = {                 # 每秒請求數, 突發量, 同時進行上限
+        'KuCoin': (5, 10, 4),
+        'Gate.io': (10, 20, 4),
+        'MEXC': (10, 20, 4),
+    }
+    DEFAULT_VENUE_LIMIT = (2, 5, 2)
+    VENUE_SLOW_LATENCY = 2.0         # venue 平均延遲超過此值(秒)時拉長該 venue 的間隔
+    CONTRACT_SPEC_RETRY = 300        # 合約規格抓取失敗後隔多久再試(秒); 期間該合約的 cycle 直接失敗
+
+    # 深度指標
+    DEPTH_LEVELS = 50                                    # 每邊使用的檔位數
+    DEPTH_BANDS_BPS = (10, 25, 50, 100, 200)             # 深度區間 (距 mid 的 bps)
+    SLIPPAGE_SIZES_USD = (10000, 50000, 100000, 250000)  # 滑價試算的下單金額
+
+    DB_PATH = "/content/drive/MyDrive/crypto_analysis/sol_risk.db"
+    DB_BATCH_SIZE = 5000        # 每次 group commit 最多筆數
+    DB_FLUSH_INTERVAL = 1.0     # 寫入最長延遲(秒)
+    DB_QUEUE_MAX = 200000       # 寫入佇列上限 (滿了才會阻塞)
+    # 分層儲存 (MarketTiers): 原始樣本依 UTC 日分表, 收盤的 bucket 彙總為 1m / 1h rollup
+    RAW_RETENTION_DAYS = 7      # 原始分區保留天數 (None = 永久), 過期後封存到 ARCHIVE_DIR 或刪除
+    ARCHIVE_DIR = "/content/drive/MyDrive/crypto_analysis/market_archive"   # 冷分區 Parquet (zstd), None = 直接刪除
+    ROLLUP_RETENTION = {'1m': 90 * 86400, '1h': None}   # rollup 保留秒數 (None = 永久)
+    ROLLUP_LAG = 60             # bucket 收盤後再等幾秒才 rollup (晚到的寫入)
+    MAINTENANCE_INTERVAL = 3600 # 背景 rollup / retention / compaction 間隔(秒), 0 = 只手動執行
+    STATS_RESOLUTION = 60       # 滾動統計的 bucket 秒數 (0 = 逐筆, 且需 RAW_RETENTION_DAYS 涵蓋 STATS_WINDOW)
+    HTTP_CACHE_DIR = "/content/drive/MyDrive/crypto_analysis/http_cache"
+    HTTP_CACHE_TTLS = {         # 共用 HTTP 快取的各端點 TTL(秒), 只用於變動慢的端點
+        '/simple/price': 30,    # CoinGecko 價格本身約每分鐘更新
+        '/contracts/': 24 * 3600,
+        '/contract/detail': 24 * 3600,
+    }
+    # 技術指標 (sol_indicators, 與 .sql 相同定義, UTC 日 K); 穿越時發出警報
+    INDICATORS = True
+    INDICATOR_SEED_DAYS = 120        # 啟動時載入的日 K 數
+    INDICATOR_MIN_BARS = 20          # 日 K 不足時不發指標警報 (部分窗口)
+    INDICATOR_CROSSINGS = [          # (警報, 指標, 門檻: 數值或另一個指標, 'up' / 'down')
+        ('RSI_OVERBOUGHT', 'rsi14', 70, 'up'),
+        ('RSI_OVERSOLD', 'rsi14', 30, 'down'),
+        ('BB_UPPER_BREAK', 'pct_b', 1.0, 'up'),
+        ('BB_LOWER_BREAK', 'pct_b', 0.0, 'down'),
+        ('KC_UPPER_BREAK', 'close', 'kc_upper', 'up'),
+        ('KC_LOWER_BREAK', 'close', 'kc_lower', 'down'),
+        ('SQUEEZE_RELEASE', 'squeeze', 0.5, 'down'),
+    ]
+    # 警報規則 (RuleEngine): 規則是資料, 啟動時編譯成一次向量化評估 (格式見 RuleEngine)
+    # INDICATOR_CROSSINGS 會轉成 cross_above / cross_below 規則附加在後
+    ALERT_RULES = [
+        {'name': 'DEPTH_DECLINE', 'metric': 'total_depth', 'op': '<',
+         'threshold': {'metric': 'depth_mean', 'offset': 'depth_std', 'k': '-Config.DEPTH_STD_THRESHOLD'},
+         'when': [('depth_samples', '>=', 'Config.MIN_DEPTH_SAMPLES')],
+         'message': 'Market depth ${value:,.0f} below threshold ${threshold:,.0f}'},
+        {'name': 'WIDE_SPREAD', 'metric': 'spread_bps', 'op': '>', 'threshold': 'Config.SPREAD_MAX_BPS',
+         'message': 'Spread {value:.2f} bps exceeds {threshold:g} bps'},
+        {'name': 'LOW_VRP', 'metric': 'vrp', 'op': '<', 'threshold': 'Config.VRP_MIN_THRESHOLD',
+         'message': 'VRP {value:.2%} below {threshold:.1%} threshold'},
+    ]
+    ALERT_RULES_PATH = None          # 額外的規則檔 (YAML 或 JSON 的 list), 例: ".../alert_rules.yaml"
+    # 效能指標 (Metrics): fetch / parse / compute / persist / alert 各階段耗時與計數
+    METRICS_PATH = None              # Prometheus text 檔 (node_exporter textfile collector), 例: ".../sol_monitor.prom"
+    METRICS_INTERVAL = 60            # 每隔幾秒寫一次 METRICS_PATH 並輸出一行 JSON 指標 log (0 = 不輸出)
+    LOG_PATH = "/content/drive/MyDrive/crypto_analysis/sol_risk.log"
+    CONFIG_PATH = "/content/drive/MyDrive/crypto_analysis/config.json"
+    REPORT_PATH = "/content/drive/MyDrive/crypto_analysis/"
+
+
+class DataCollector:
+    def __init__(self, logger):
+        self.logger = logger
+        self.session = self._create_session()
+        self._local = threading.local()
+        self._executor = None
+        self.last_latency = {}
+        self._price_cache = {}
+        self._contract_sizes = {}
+        self._contract_size_failed = {}     # instrument key -> 上次抓取合約規格失敗的時間
+        self.budgets = {}                   # venue -> VenueBudget (MonitorScheduler 設定), 每個請求取一個 token
+        self.http_cache = None
+        if CachedSession is not None:
+            try:
+                self.http_cache = CachedSession(Config.HTTP_CACHE_DIR, ttls=Config.HTTP_CACHE_TTLS,
+                                                session_factory=self._create_session)
+            except Exception as e:
+                self.logger.warning(f"HTTP cache unavailable: {e}")
+
+    def _create_session(self):
+        """創建session"""
+        session = requests.Session()
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'application/json'
+        })
+        return session
+
+    def _thread_session(self):
+        """每個執行緒各自的session (requests.Session 非執行緒安全)"""
+        if threading.current_thread() is threading.main_thread():
+            return self.session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._create_session()
+            self._local.session = session
+        return session
+
+    def fetch_with_retry(self, url: str, params: Dict = None, name: str = "API", retries: int = 3,
+                         cancel_event: Optional[threading.Event] = None, cached: bool = False,
+                         ttl: Optional[float] = None, deadline: Optional[float] = None,
+                         validate: Optional[Callable[[Dict], bool]] = None, budget=None) -> Optional[Dict]:
+        """重試請求 (cached=True 時經過共用 HTTP 快取, ttl 預設依 Config.HTTP_CACHE_TTLS)
+
+        deadline (time.perf_counter()) 限制整體時間: 每次請求的逾時不超過剩餘時間, 過了就不再重試。
+        validate(payload) 為 False 時視為失敗並重試 (HTTP 200 但內容是錯誤的 API), 也不會寫入快取。
+        失敗後等 2, 4, ... 秒再試, 有 Retry-After 時依其秒數。budget (VenueBudget) 在每次實際送出
+        請求前取一個 token (快取命中不算); 429 / 5xx 時改為讓整個 venue 退避並放棄這次請求,
+        由排程器在退避結束後再排。
+        """
+        cache = self.http_cache if cached else None
+        session = cache if cache is not None else self._thread_session()
+        options = {'ttl': ttl} if cache is not None else {}
+        if cache is not None and validate is not None:
+            options['validate'] = lambda response: validate(response.json())
+        if cache is not None and budget is not None:
+            options['limiter'] = budget
+        for attempt in range(retries):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            timeout = Config.FETCH_TIMEOUT
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.perf_counter())
+                if timeout <= 0:
+                    return None
+            if budget is not None and cache is None and not budget.acquire(timeout):
+                self.logger.warning(f"{name} skipped: venue budget exhausted")
+                return None
+            delay = 2 * (attempt + 1)
+            try:
+                response = session.get(url, params=params, timeout=timeout, **options)
+                if response.status_code == 200:
+                    data = response.json()
+                    if validate is None or validate(data):
+                        return data
+                    self.logger.warning(f"{name} returned an error payload: {str(data)[:200]}")
+                else:
+                    retry_after = response.headers.get('Retry-After', '')
+                    delay = int(retry_after) if retry_after.isdigit() else delay
+                    self.logger.warning(f"{name} returned status {response.status_code}")
+                    if budget is not None and (response.status_code == 429 or response.status_code >= 500):
+                        budget.throttled(delay)
+                        return None
+            except Exception as e:
+                if attempt == retries - 1:
+                    self.logger.error(f"{name} failed: {e}")
+            if attempt < retries - 1:
+                if deadline is not None:
+                    delay = max(0.0, min(delay, deadline - time.perf_counter()))
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        return None
+                else:
+                    time.sleep(delay)
+        return None
+
+    def _orderbook_sources(self) -> List[Dict]:
+        """訂單簿來源 (依優先順序)"""
+        return [
+            {
+                'name': 'KuCoin',
+                'url': 'https://api.kucoin.com/api/v1/market/orderbook/level2_100',
+                'params': {'symbol': 'SOL-USDT'},
+                'parser': lambda d: d.get('data') if d.get('code') == '200000' else None
+            },
+            {
+                'name': 'Gate.io',
+                'url': 'https://api.gateio.ws/api/v4/spot/order_book',
+                'params': {'currency_pair': 'SOL_USDT', 'limit': 100},
+                'parser': lambda d: d if 'bids' in d and 'asks' in d else None
+            },
+            {
+                'name': 'MEXC',
+                'url': 'https://api.mexc.com/api/v3/depth',
+                'params': {'symbol': 'SOLUSDT', 'limit': 100},
+                'parser': lambda d: d if 'bids' in d and 'asks' in d else None
+            }
+        ]
+
+    @staticmethod
+    def _venue_symbol(instrument: Dict) -> str:
+        if instrument.get('venue_symbol'):
+            return instrument['venue_symbol']
+        base, quote = instrument['symbol'].upper().split('-')
+        venue, market = instrument['venue'], instrument.get('market', 'spot')
+        if venue == 'KuCoin':
+            return f"{base}-{quote}" if market == 'spot' else f"{'XBT' if base == 'BTC' else base}{quote}M"
+        if venue == 'Gate.io':
+            return f"{base}_{quote}"
+        if venue == 'MEXC':
+            return f"{base}{quote}" if market == 'spot' else f"{base}_{quote}"
+        raise ValueError(f"Unsupported venue: {venue}")
+
+    def contract_size(self, instrument: Dict) -> Optional[float]:
+        """合約乘數 (每張合約的幣數), 從交易所合約規格讀取一次後快取
+
+        取不到時回傳 None (不能假設為 1: KuCoin SOLUSDTM 每張 0.1 SOL, 深度會高估 10 倍),
+        CONTRACT_SPEC_RETRY 秒內不再請求; 可在 instrument 設定 'contract_size' 免去這次請求。
+        """
+        if instrument.get('market', 'spot') == 'spot':
+            return 1.0
+        if 'contract_size' in instrument:
+            return float(instrument['contract_size'])
+        key = instrument_key(instrument)
+        if key not in self._contract_sizes:
+            if time.time() - self._contract_size_failed.get(key, float('-inf')) < Config.CONTRACT_SPEC_RETRY:
+                return None
+            venue, symbol = instrument['venue'], self._venue_symbol(instrument)
+            specs = {
+                'KuCoin': (f'https://api-futures.kucoin.com/api/v1/contracts/{symbol}', None,
+                           lambda d: d['data']['multiplier']),
+                'Gate.io': (f'https://api.gateio.ws/api/v4/futures/usdt/contracts/{symbol}', None,
+                            lambda d: d['quanto_multiplier']),
+                'MEXC': ('https://contract.mexc.com/api/v1/contract/detail', {'symbol': symbol},
+                         lambda d: d['data']['contractSize']),
+            }
+            url, params, parser = specs[venue]
+            data = self.fetch_with_retry(url, params, f"{venue} contract spec", cached=True,
+                                         validate=lambda d: float(parser(d)) > 0, budget=self.budgets.get(venue))
+            try:
+                self._contract_sizes[key] = float(parser(data))
+            except Exception:
+                self._contract_size_failed[key] = time.time()
+                self.logger.warning(f"Contract size unavailable for {key}, skipping its cycles for "
+                                    f"{Config.CONTRACT_SPEC_RETRY}s")
+                return None
+        return self._contract_sizes[key]
+
+    def _instrument_source(self, instrument: Dict) -> Optional[Dict]:
+        """單一 venue/市場的訂單簿來源, 解析後統一為 [[price, base_size], ...] (合約乘數未知時為 None)"""
+        venue, market = instrument['venue'], instrument.get('market', 'spot')
+        symbol = self._venue_symbol(instrument)
+
+        if market == 'spot':
+            for source in self._orderbook_sources():
+                if source['name'] == venue:
+                    params = {k: (symbol if k in ('symbol', 'currency_pair') else v)
+                              for k, v in source['params'].items()}
+                    return dict(source, params=params)
+            raise ValueError(f"Unsupported venue: {venue}")
+
+        size = self.contract_size(instrument)
+        if size is None:
+            return None
+        scale = lambda levels: [[float(l[0]), float(l[1]) * size] for l in levels]
+        if venue == 'KuCoin':
+            return {
+                'name': venue,
+                'url': 'https://api-futures.kucoin.com/api/v1/level2/depth100',
+                'params': {'symbol': symbol},
+                'parser': lambda d: ({'bids': scale(d['data']['bids']), 'asks': scale(d['data']['asks'])}
+                                     if d.get('code') == '200000' else None)
+            }
+        if venue == 'Gate.io':
+            to_levels = lambda side: scale([[l['p'], l['s']] for l in side])
+            return {
+                'name': venue,
+                'url': 'https://api.gateio.ws/api/v4/futures/usdt/order_book',
+                'params': {'contract': symbol, 'limit': 100},
+                'parser': lambda d: ({'bids': to_levels(d['bids']), 'asks': to_levels(d['asks'])}
+                                     if 'bids' in d and 'asks' in d else None)
+            }
+        if venue == 'MEXC':
+            return {
+                'name': venue,
+                'url': f'https://contract.mexc.com/api/v1/contract/depth/{symbol}',
+                'params': {},
+                'parser': lambda d: ({'bids': scale(d['data']['bids']), 'asks': scale(d['data']['asks'])}
+                                     if d.get('success') else None)
+            }
+        raise ValueError(f"Unsupported venue: {venue}")
+
+    def fetch_orderbook(self, instrument: Dict) -> Optional[Dict]:
+        """指定 venue 的訂單簿 (多商品排程使用, 不做跨 venue 備援)"""
+        source = self._instrument_source(instrument)
+        if source is None:
+            return None
+        started = time.perf_counter()
+        data = self.fetch_with_retry(source['url'], source['params'], f"{source['name']} {source['params']}",
+                                     budget=self.budgets.get(instrument['venue']))
+        parsed = source['parser'](data) if data else None
+        latency = time.perf_counter() - started
+        if not parsed:
+            return None
+        return {'source': source['name'], 'data': parsed, 'latency': {source['name']: latency}}
+
+    def fetch_orderbook_any_source(self) -> Optional[Dict]:
+        """從任何可用源獲取訂單簿"""
+        sources = self._orderbook_sources()
+        if Config.FETCH_MODE == "concurrent":
+            return self.fetch_orderbook_concurrent(sources)
+
+        latency = {}
+        for source in sources:
+            self.logger.info(f"Trying {source['name']}...")
+            started = time.perf_counter()
+            data = self.fetch_with_retry(source['url'], source['params'], source['name'])
+            parsed = source['parser'](data) if data else None
+            latency[source['name']] = time.perf_counter() - started
+
+            if parsed:
+                self.last_latency = latency
+                self.logger.info(f"✅ Successfully fetched from {source['name']}")
+                return {'source': source['name'], 'data': parsed, 'latency': latency}
+
+        self.last_latency = latency
+        self.logger.error("❌ All orderbook sources failed")
+        return None
+
+    def _fetch_source(self, source: Dict, delay: float, cancel_event: threading.Event, deadline: float):
+        """單一來源抓取 (在執行緒池中執行, 最晚在 deadline 結束)"""
+        if delay > 0 and cancel_event.wait(delay):
+            return source['name'], None, None
+        started = time.perf_counter()
+        data = self.fetch_with_retry(source['url'], source['params'], source['name'],
+                                     cancel_event=cancel_event, deadline=deadline)
+        parsed = None
+        if data:
+            try:
+                parsed = source['parser'](data)
+            except Exception as e:
+                self.logger.warning(f"{source['name']} parse error: {e}")
+        return source['name'], parsed, time.perf_counter() - started
+
+    def fetch_orderbook_concurrent(self, sources: List[Dict], quorum: Optional[int] = None) -> Optional[Dict]:
+        """同時向所有來源請求, 最先解析成功者勝出 (或等待 quorum 個來源)
+
+        HEDGE_DELAY > 0 時為 hedged request: 第 i 個來源延遲 i*HEDGE_DELAY 秒才發送,
+        若已有結果則直接放棄。其餘較慢的請求在返回後取消 (不再重試/等待)。
+        quorum > 1 時各來源的 mid 與其中位數比較 (見 _agreeing_books), 偏離的來源不採用。
+        每個請求的逾時都受 FETCH_DEADLINE 限制; 執行緒池保留一倍餘裕, 上一輪仍在收尾的
+        請求不會佔住這一輪需要的 worker。
+        """
+        quorum = max(1, min(quorum or Config.FETCH_QUORUM, len(sources)))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2 * len(sources),
+                                                thread_name_prefix="orderbook")
+
+        cancel_event = threading.Event()
+        deadline = time.perf_counter() + Config.FETCH_DEADLINE
+        futures = {
+            self._executor.submit(self._fetch_source, source, i * Config.HEDGE_DELAY, cancel_event,
+                                  deadline): source['name']
+            for i, source in enumerate(sources)
+        }
+        latency = {name: None for name in futures.values()}
+        books = []
+        pending = set(futures)
+
+        while pending and len(books) < quorum:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    name, parsed, elapsed = future.result()
+                except Exception as e:
+                    self.logger.warning(f"{futures[future]} fetch error: {e}")
+                    continue
+                latency[name] = elapsed
+                if parsed:
+                    books.append({'source': name, 'data': parsed})
+
+        # 取消其餘請求: 未開始的直接取消, 進行中的不再重試
+        cancel_event.set()
+        for future in pending:
+            future.cancel()
+
+        self.last_latency = latency
+        self.logger.info("Source latency: " + ", ".join(
+            f"{name}={t*1000:.0f}ms" if t is not None else f"{name}=cancelled"
+            for name, t in latency.items()
+        ))
+
+        if not books:
+            self.logger.error("❌ All orderbook sources failed")
+            return None
+        rejected = []
+        if quorum > 1:
+            books, rejected = self._agreeing_books(books)
+            if not books:
+                self.logger.error(f"❌ Orderbook sources disagree ({', '.join(rejected)}), skipping cycle")
+                return None
+        if len(books) < quorum:
+            self.logger.warning(f"Quorum not reached ({len(books)}/{quorum}), using {books[0]['source']}")
+
+        self.logger.info(f"✅ Successfully fetched from {books[0]['source']}")
+        return {
+            'source': books[0]['source'],
+            'data': books[0]['data'],
+            'latency': latency,
+            'sources': [b['source'] for b in books],
+            'rejected': rejected
+        }
+
+    def _agreeing_books(self, books: List[Dict]) -> tuple:
+        """quorum 的交叉檢查: mid 偏離所有來源 mid 中位數超過 FETCH_QUORUM_TOLERANCE_BPS,
+        或買賣價交叉 (spread <= 0) 的來源剔除; 回傳 (一致的來源 (保持抵達順序), 剔除的來源名稱)"""
+        tops = []
+        for book in books:
+            try:
+                bid = max(float(level[0]) for level in book['data']['bids'])
+                ask = min(float(level[0]) for level in book['data']['asks'])
+            except (KeyError, TypeError, ValueError, IndexError):
+                bid = ask = float('nan')
+            tops.append((bid, ask))
+        mids = np.array([(bid + ask) / 2 if ask > bid else np.nan for bid, ask in tops])
+        if np.isnan(mids).all():
+            return [], [b['source'] for b in books]
+        median = np.nanmedian(mids)
+        with np.errstate(invalid='ignore'):
+            ok = np.abs(mids / median - 1) * 10000 <= Config.FETCH_QUORUM_TOLERANCE_BPS
+        for book, mid, good in zip(books, mids, ok):
+            if not good:
+                self.logger.warning(f"{book['source']} rejected: mid {mid:.4f} vs median {median:.4f}")
+        return ([b for b, good in zip(books, ok) if good], [b['source'] for b, good in zip(books, ok) if not good])
+
+    def fetch_prices(self, coin_ids: List[str], max_age: float = 0) -> Dict[str, Dict]:
+        """一次請求取得多個幣的價格數據 (max_age > 0 時重用快取)"""
+        now = time.time()
+        stale = [c for c in coin_ids
+                 if max_age <= 0 or c not in self._price_cache or now - self._price_cache[c][0] >= max_age]
+        if stale:
+            try:
+                url = "https://api.coingecko.com/api/v3/simple/price"
+                params = {
+                    'ids': ','.join(sorted(set(stale))),
+                    'vs_currencies': 'usd',
+                    'include_24hr_vol': 'true',
+                    'include_24hr_change': 'true'
+                }
+
+                # 只有允許舊資料的呼叫 (max_age > 0) 才走快取, 且快取年齡不超過 max_age
+                ttl = min(max_age, self.http_cache.ttl_for(url)) if self.http_cache is not None else None
+                data = self.fetch_with_retry(url, params, "CoinGecko", cached=max_age > 0, ttl=ttl) or {}
+                for coin_id, quote in data.items():
+                    self._price_cache[coin_id] = (time.time(), {
+                        'price': quote['usd'],
+                        'volume_24h': quote.get('usd_24h_vol', 0),
+                        'change_24h': quote.get('usd_24h_change', 0)
+                    })
+            except Exception as e:
+                self.logger.error(f"Price data error: {e}")
+        return {c: self._price_cache[c][1] for c in coin_ids if c in self._price_cache}
+
+    def fetch_price_data(self, max_age: float = 0, coin_id: str = 'solana') -> Optional[Dict]:
+        """獲取價格數據 (max_age > 0 時重用快取)"""
+        return self.fetch_prices([coin_id], max_age).get(coin_id)
+
+    def fetch_daily_bars(self, symbol: str = 'SOL-USDT', days: int = 120) -> Optional[pd.DataFrame]:
+        """KuCoin 現貨日 K (UTC), 指標啟動時的歷史; 最後一根為今天未收盤的 K 棒"""
+        end = int(time.time())
+        data = self.fetch_with_retry("https://api.kucoin.com/api/v1/market/candles",
+                                     {'type': '1day', 'symbol': symbol, 'startAt': end - days * 86400, 'endAt': end},
+                                     "KuCoin candles")
+        if not data or data.get('code') != '200000' or not data.get('data'):
+            return None
+        # [time, open, close, high, low, volume, turnover], 新到舊
+        rows = np.array(data['data'], dtype=np.float64)[::-1]
+        return pd.DataFrame({'day': pd.to_datetime(rows[:, 0].astype(np.int64), unit='s'),
+                             'open': rows[:, 1], 'high': rows[:, 3], 'low': rows[:, 4], 'close': rows[:, 2]})
+
+
+# ==================== 訂單簿 ====================
+class ArrayOrderBook:
+    """以連續 numpy 陣列保存的訂單簿 (bids 由高到低, asks 由低到高)"""
+    __slots__ = ('bid_px', 'bid_sz', 'ask_px', 'ask_sz',
+                 'bid_cum', 'ask_cum', 'bid_cum_sz', 'ask_cum_sz')
+
+    def __init__(self, bid_px: np.ndarray, bid_sz: np.ndarray, ask_px: np.ndarray, ask_sz: np.ndarray):
+        if bid_px.size > 1 and np.any(np.diff(bid_px) > 0):
+            order = np.argsort(-bid_px, kind='stable')
+            bid_px, bid_sz = bid_px[order], bid_sz[order]
+        if ask_px.size > 1 and np.any(np.diff(ask_px) < 0):
+            order = np.argsort(ask_px, kind='stable')
+            ask_px, ask_sz = ask_px[order], ask_sz[order]
+        self.bid_px, self.bid_sz = bid_px, bid_sz
+        self.ask_px, self.ask_sz = ask_px, ask_sz
+        # 累積名目金額 / 數量
+        self.bid_cum = np.cumsum(bid_px * bid_sz)
+        self.ask_cum = np.cumsum(ask_px * ask_sz)
+        self.bid_cum_sz = np.cumsum(bid_sz)
+        self.ask_cum_sz = np.cumsum(ask_sz)
+
+    @staticmethod
+    def _parse_side(levels: List, limit: Optional[int]) -> np.ndarray:
+        levels = levels[:limit] if limit else levels
+        if not levels:
+            return np.empty((0, 2))
+        return np.array([level[:2] for level in levels], dtype=np.float64)
+
+    @classmethod
+    def from_raw(cls, data: Dict, levels: Optional[int] = None) -> 'ArrayOrderBook':
+        """從交易所原始 JSON ([price, size] 字串或數字) 解析一次"""
+        bids = cls._parse_side(data.get('bids', []), levels)
+        asks = cls._parse_side(data.get('asks', []), levels)
+        return cls(bids[:, 0].copy(), bids[:, 1].copy(), asks[:, 0].copy(), asks[:, 1].copy())
+
+    @property
+    def empty(self) -> bool:
+        return self.bid_px.size == 0 or self.ask_px.size == 0
+
+    @property
+    def best_bid(self) -> float:
+        return float(self.bid_px[0])
+
+    @property
+    def best_ask(self) -> float:
+        return float(self.ask_px[0])
+
+    @property
+    def mid(self) -> float:
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def spread_bps(self) -> float:
+        return ((self.best_ask - self.best_bid) / self.mid) * 10000
+
+    def depth_bands(self, bands_bps) -> tuple:
+        """一次計算多個區間的 (bid 深度, ask 深度), 單位 USD"""
+        bps = np.asarray(bands_bps, dtype=np.float64) / 10000
+        mid = self.mid
+        n_bid = np.searchsorted(-self.bid_px, -(mid * (1 - bps)), side='right')
+        n_ask = np.searchsorted(self.ask_px, mid * (1 + bps), side='right')
+        bid_depth = np.where(n_bid > 0, self.bid_cum[np.maximum(n_bid - 1, 0)], 0.0)
+        ask_depth = np.where(n_ask > 0, self.ask_cum[np.maximum(n_ask - 1, 0)], 0.0)
+        return bid_depth, ask_depth
+
+    @staticmethod
+    def imbalance(bid_depth: np.ndarray, ask_depth: np.ndarray) -> np.ndarray:
+        """(bid - ask) / (bid + ask), 範圍 -1 ~ 1"""
+        total = bid_depth + ask_depth
+        out = np.full(total.shape, np.nan)
+        np.divide(bid_depth - ask_depth, total, out=out, where=total > 0)
+        return out
+
+    @staticmethod
+    def _vwap(px: np.ndarray, cum: np.ndarray, cum_sz: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        k = np.searchsorted(cum, sizes, side='left')
+        filled = k < px.size
+        k = np.minimum(k, px.size - 1)
+        prev = k - 1
+        prev_cum = np.where(prev >= 0, cum[np.maximum(prev, 0)], 0.0)
+        prev_sz = np.where(prev >= 0, cum_sz[np.maximum(prev, 0)], 0.0)
+        qty = prev_sz + (sizes - prev_cum) / px[k]
+        return np.where(filled, sizes / qty, np.nan)
+
+    def slippage_bps(self, sizes_usd) -> tuple:
+        """市價單吃單的 VWAP 相對 mid 的滑價 (bps); 深度不足時為 NaN"""
+        sizes = np.asarray(sizes_usd, dtype=np.float64)
+        mid = self.mid
+        buy = (self._vwap(self.ask_px, self.ask_cum, self.ask_cum_sz, sizes) - mid) / mid * 10000
+        sell = (mid - self._vwap(self.bid_px, self.bid_cum, self.bid_cum_sz, sizes)) / mid * 10000
+        return buy, sell
+
+
+# ==================== 滾動統計 ====================
+class RollingWindowStats:
+    """時間窗內的 Welford 均值/變異數, 過期條目以反向合併移除 (每筆 O(1))
+
+    每個條目是 (時間戳, n, 均值, M2): 逐筆加入時 n = 1; resolution > 0 時同一個 bucket
+    (ts // resolution) 的樣本併入同一個條目, 記憶體與 window / resolution 成正比而非樣本數,
+    也可以直接載入 rollup 的 bucket。條目以其第一筆樣本的時間戳過期。條目存於 numpy
+    環形緩衝區, 每移除 len(window) 個條目後重新精確計算一次, 避免長時間加減造成的
+    浮點誤差累積 (攤銷後仍為 O(1))。
+    """
+    __slots__ = ('window', 'resolution', '_ts', '_n', '_mean', '_m2', '_head', '_size',
+                 'count', 'mean', 'm2', '_removed')
+
+    def __init__(self, window: float, capacity: int = 1024, resolution: int = 0):
+        self.window = window
+        self.resolution = resolution
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._n = np.empty(capacity, dtype=np.int64)
+        self._mean = np.empty(capacity, dtype=np.float64)
+        self._m2 = np.empty(capacity, dtype=np.float64)
+        self._head = 0
+        self._size = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._removed = 0
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        capacity = self._ts.size
+        order = (self._head + np.arange(self._size)) % capacity
+        for name in ('_ts', '_n', '_mean', '_m2'):
+            old = getattr(self, name)
+            new = np.empty(capacity * 2, dtype=old.dtype)
+            new[:self._size] = old[order]
+            setattr(self, name, new)
+        self._head = 0
+
+    def add(self, ts: int, value: float):
+        if value is None or not np.isfinite(value):
+            return
+        tail = (self._head + self._size - 1) % self._ts.size
+        if self.resolution and self._size and ts // self.resolution == self._ts[tail] // self.resolution:
+            n = self._n[tail] + 1
+            delta = value - self._mean[tail]
+            self._mean[tail] += delta / n
+            self._m2[tail] += delta * (value - self._mean[tail])
+            self._n[tail] = n
+        else:
+            if self._size == self._ts.size:
+                self._grow()
+            i = (self._head + self._size) % self._ts.size
+            self._ts[i] = ts
+            self._n[i] = 1
+            self._mean[i] = value
+            self._m2[i] = 0.0
+            self._size += 1
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def extend(self, ts: np.ndarray, values: np.ndarray):
+        """批次加入 (用於啟動時從資料庫載入)"""
+        values = np.asarray(values, dtype=np.float64)
+        self.extend_buckets(ts, np.ones(values.size, dtype=np.int64), values, np.zeros(values.size))
+
+    def extend_buckets(self, ts: np.ndarray, n: np.ndarray, mean: np.ndarray, m2: np.ndarray):
+        """批次加入已彙總的條目 (各含 n 個樣本的均值與 M2, 例如 rollup 的 1m / 1h bucket), ts 需遞增"""
+        n = np.asarray(n, dtype=np.int64)
+        mean = np.asarray(mean, dtype=np.float64)
+        mask = (n > 0) & np.isfinite(mean)
+        ts, n, mean = np.asarray(ts, dtype=np.int64)[mask], n[mask], mean[mask]
+        m2 = np.nan_to_num(np.asarray(m2, dtype=np.float64)[mask])
+        if self.resolution and ts.size:
+            # 同一個 bucket 的條目合併 (含緩衝區最後一個條目)
+            if self._size:
+                tail = (self._head + self._size - 1) % self._ts.size
+                ts = np.concatenate(([self._ts[tail]], ts))
+                n = np.concatenate(([self._n[tail]], n))
+                mean = np.concatenate(([self._mean[tail]], mean))
+                m2 = np.concatenate(([self._m2[tail]], m2))
+                self._size -= 1
+            starts = np.flatnonzero(np.r_[True, np.diff(ts // self.resolution) != 0])
+            total = np.add.reduceat(n, starts)
+            merged = np.add.reduceat(n * mean, starts) / total
+            spread = mean - np.repeat(merged, np.diff(np.r_[starts, ts.size]))
+            ts, n, mean, m2 = ts[starts], total, merged, np.add.reduceat(m2 + n * spread ** 2, starts)
+        while self._size + ts.size > self._ts.size:
+            self._grow()
+        idx = (self._head + self._size + np.arange(ts.size)) % self._ts.size
+        self._ts[idx] = ts
+        self._n[idx] = n
+        self._mean[idx] = mean
+        self._m2[idx] = m2
+        self._size += ts.size
+        self._recompute()
+
+    def expire(self, now: int):
+        """移除 timestamp <= now - window 的條目"""
+        cutoff = now - self.window
+        capacity = self._ts.size
+        while self._size and self._ts[self._head] <= cutoff:
+            h = self._head
+            n, mean, m2 = int(self._n[h]), float(self._mean[h]), float(self._m2[h])
+            self._head = (h + 1) % capacity
+            self._size -= 1
+            self._removed += 1
+            if self.count <= n:
+                self.count, self.mean, self.m2 = 0, 0.0, 0.0
+                continue
+            count = self.count - n
+            rest = (self.count * self.mean - n * mean) / count
+            self.m2 -= m2 + (mean - rest) ** 2 * count * n / self.count
+            self.count, self.mean = count, rest
+        if self._removed >= max(self._size, 1024):
+            self._recompute()
+
+    def _recompute(self):
+        self._removed = 0
+        if not self._size:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        order = (self._head + np.arange(self._size)) % self._ts.size
+        n, mean = self._n[order], self._mean[order]
+        self.count = int(n.sum())
+        self.mean = float((n * mean).sum() / self.count)
+        self.m2 = float(self._m2[order].sum() + (n * (mean - self.mean) ** 2).sum())
+
+    def variance(self, ddof: int = 1) -> float:
+        if self.count - ddof <= 0:
+            return float('nan')
+        return max(self.m2, 0.0) / (self.count - ddof)
+
+    def std(self, ddof: int = 1) -> float:
+        return float(np.sqrt(self.variance(ddof)))
+
+
+class RollingReturnStats:
+    """時間窗內相鄰價格的對數報酬變異數
+
+    報酬 log(p_i / p_{i-1}) 以前一筆價格的時間戳記錄, 與「窗內價格序列做 np.diff」一致:
+    當 p_{i-1} 過期時該筆報酬也一併過期。由 rollup 載入時報酬記在 p_i 所在的 bucket,
+    窗口邊界最多差一筆報酬。
+    """
+    __slots__ = ('returns', 'prices', '_last_price')
+
+    def __init__(self, window: float, resolution: int = 0):
+        self.returns = RollingWindowStats(window, resolution=resolution)
+        self.prices = RollingWindowStats(window, resolution=resolution)
+        self._last_price = None
+
+    def add(self, ts: int, price: float):
+        if price is None or not price > 0:
+            return
+        if self._last_price is not None:
+            self.returns.add(self._last_price[0], np.log(price / self._last_price[1]))
+        self.prices.add(ts, price)
+        self._last_price = (ts, price)
+
+    def extend(self, ts: np.ndarray, prices: np.ndarray):
+        ts = np.asarray(ts, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        mask = prices > 0
+        ts, prices = ts[mask], prices[mask]
+        if not prices.size:
+            return
+        if self._last_price is not None:
+            ts = np.concatenate(([self._last_price[0]], ts))
+            prices = np.concatenate(([self._last_price[1]], prices))
+            self.prices.extend(ts[1:], prices[1:])
+        else:
+            self.prices.extend(ts, prices)
+        self.returns.extend(ts[:-1], np.diff(np.log(prices)))
+        self._last_price = (int(ts[-1]), float(prices[-1]))
+
+    def extend_buckets(self, entries: pd.DataFrame):
+        """由 MarketTiers.history() 的條目載入 (價格與對數報酬各自的 n / 均值 / M2)"""
+        if not len(entries):
+            return
+        ts = entries['bucket'].to_numpy()
+        self.prices.extend_buckets(ts, entries['n'], entries['price_mean'], entries['price_m2'])
+        self.returns.extend_buckets(ts, entries['ret_n'], entries['ret_mean'], entries['ret_m2'])
+        self._last_price = (int(entries['last_ts'].iloc[-1]), float(entries['price_last'].iloc[-1]))
+
+    def expire(self, now: int):
+        self.returns.expire(now)
+        self.prices.expire(now)
+
+
+# ==================== 警報規則 ====================
+def load_alert_rules(path: Optional[str] = None) -> List[Dict]:
+    """Config.ALERT_RULES + INDICATOR_CROSSINGS, 再加上規則檔 (YAML 或 JSON) 的規則"""
+    rules = list(Config.ALERT_RULES)
+    if Config.INDICATORS:
+        for alert_type, field, level, direction in Config.INDICATOR_CROSSINGS:
+            rules.append({
+                'name': alert_type, 'metric': field, 'threshold': level,
+                'op': 'cross_above' if direction == 'up' else 'cross_below',
+                'when': [('bars', '>=', 'Config.INDICATOR_MIN_BARS')],
+                'message': f'{field} {{value:,.4f}} crossed {direction} {level} ({{threshold:,.4f}})',
+            })
+    path = path or Config.ALERT_RULES_PATH
+    if path and os.path.exists(path):
+        with open(path, 'r') as f:
+            if path.endswith(('.yaml', '.yml')):
+                import yaml
+                rules.extend(yaml.safe_load(f) or [])
+            else:
+                rules.extend(json.load(f))
+    return rules
+
+
+# ==================== 監控系統 ====================
+class SOLMonitor:
+    def __init__(self, email_config):
+        self.setup_logging()
+        self.email_config = email_config
+        self.collector = DataCollector(self.logger)
+        self.stream = None
+        self.running = False
+        self.statistics = {}
+        self.scheduler = None
+        self.indicators = {}
+        self.indicator_values = {}
+        self.clock = time.time          # 回放時換成虛擬時鐘
+        self.metrics = Metrics()
+        self._metrics_exported = time.time()
+        self._maintained = time.time()
+        self._maintenance = None
+        self.rules = RuleEngine(load_alert_rules(), constants=Config)
+        self.init_database()
+        self.alerts = AlertDispatcher(self.store, email_config, self.logger,
+                                      digest_window=Config.ALERT_DIGEST_WINDOW, cooldown=Config.EMAIL_COOLDOWN,
+                                      queue_max=Config.ALERT_QUEUE_MAX, smtp_host=Config.SMTP_HOST,
+                                      smtp_port=Config.SMTP_PORT, smtp_starttls=Config.SMTP_STARTTLS,
+                                      smtp_timeout=Config.SMTP_TIMEOUT, idle_timeout=Config.SMTP_IDLE_TIMEOUT)
+        self.depth_stats, self.return_stats = self.seed_statistics()
+
+    def setup_logging(self):
+        """設置日誌"""
+        os.makedirs(os.path.dirname(Config.LOG_PATH), exist_ok=True)
+
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler(Config.LOG_PATH),
+                logging.StreamHandler()
+            ]
+        )
+        self.logger = logging.getLogger(__name__)
+
+    def init_database(self):
+        """初始化數據庫"""
+        os.makedirs(os.path.dirname(Config.DB_PATH), exist_ok=True)
+
+        self.store = MarketStore(Config.DB_PATH, self.logger, batch_size=Config.DB_BATCH_SIZE,
+                                 flush_interval=Config.DB_FLUSH_INTERVAL, queue_max=Config.DB_QUEUE_MAX)
+        self.store.executescript("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER,
+            alert_type TEXT,
+            message TEXT,
+            value REAL,
+            threshold REAL,
+            email_sent INTEGER DEFAULT 0
+        );
+
+        -- 創建索引
+        CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts(timestamp DESC);
+        """)
+        # 市場資料寫入日分區; market_data / instrument_data 為分區上的 view
+        self.store.migrate_legacy()
+        self.store.create_views()
+        self.tiers = MarketTiers(self.store, self.logger, archive_dir=Config.ARCHIVE_DIR,
+                                 raw_retention_days=Config.RAW_RETENTION_DAYS,
+                                 rollup_retention=Config.ROLLUP_RETENTION, rollup_lag=Config.ROLLUP_LAG)
+        self.logger.info("Database initialized")
+
+    def seed_statistics(self, instrument: Optional[Dict] = None) -> tuple:
+        """啟動時從資料庫載入一次統計窗口 (STATS_RESOLUTION 的 rollup 加上原始尾段), 之後每筆樣本 O(1) 更新"""
+        key = instrument_key(instrument)
+        depth_stats = RollingWindowStats(Config.STATS_WINDOW, resolution=Config.STATS_RESOLUTION)
+        return_stats = RollingReturnStats(Config.STATS_WINDOW, resolution=Config.STATS_RESOLUTION)
+
+        cutoff = int(self.clock()) - Config.STATS_WINDOW
+        entries = self.tiers.history(key, cutoff, resolution=Config.STATS_RESOLUTION)
+        if len(entries):
+            depth_stats.extend_buckets(entries['bucket'], entries['n'], entries['depth_mean'], entries['depth_m2'])
+            return_stats.extend_buckets(entries)
+        self.statistics[key] = (depth_stats, return_stats)
+        self.logger.info(f"Statistics seeded with {depth_stats.count} samples ({len(entries)} entries)"
+                         + (f" for {key}" if key else ""))
+        return depth_stats, return_stats
+
+    def get_statistics(self, instrument: Optional[Dict] = None) -> tuple:
+        key = instrument_key(instrument)
+        if key not in self.statistics:
+            return self.seed_statistics(instrument)
+        return self.statistics[key]
+
+    def update_statistics(self, timestamp: int, depth_data: Dict, instrument: Optional[Dict] = None):
+        depth_stats, return_stats = self.get_statistics(instrument)
+        depth_stats.add(timestamp, depth_data['total_depth'])
+        return_stats.add(timestamp, depth_data['price'])
+
+    def seed_indicators(self, instrument: Optional[Dict] = None):
+        """日 K 歷史: KuCoin 現貨日 K, 取不到時改由資料庫內的價格彙總"""
+        key = instrument_key(instrument)
+        engine = IndicatorEngine()
+        bars = None
+        if instrument is None or instrument.get('market', 'spot') == 'spot':
+            symbol = instrument['symbol'].upper() if instrument else 'SOL-USDT'
+            bars = self.collector.fetch_daily_bars(symbol, Config.INDICATOR_SEED_DAYS)
+        if bars is None:
+            # 日 K 只需要 1h rollup (open / high / low / close 由 bucket 的 first / max / min / last 合併)
+            since = int(self.clock()) - Config.INDICATOR_SEED_DAYS * 86400
+            entries = self.tiers.history(key, since, resolution=86400)
+            if len(entries):
+                entries['day'] = pd.to_datetime(entries['bucket'] // 86400 * 86400, unit='s')
+                bars = entries.groupby('day', sort=True).agg(
+                    open=('price_first', 'first'), high=('price_max', 'max'),
+                    low=('price_min', 'min'), close=('price_last', 'last')).reset_index()
+        if bars is not None:
+            engine.seed(bars)
+        self.indicators[key] = engine
+        self.logger.info(f"Indicators seeded with {engine.bars} daily bars" + (f" for {key}" if key else ""))
+        return engine
+
+    def update_indicators(self, timestamp: float, depth_data: Dict, instrument: Optional[Dict] = None) -> Dict:
+        """以最新價格 O(1) 更新指標 (穿越警報由 Config.INDICATOR_CROSSINGS 轉成的規則判斷)"""
+        if not Config.INDICATORS or IndicatorEngine is None:
+            return {}
+        try:
+            key = instrument_key(instrument)
+            engine = self.indicators.get(key) or self.seed_indicators(instrument)
+            values = engine.update(timestamp, depth_data['price'])
+            self.indicator_values[key] = values
+            return values
+        except Exception as e:
+            self.logger.error(f"Indicator update error: {e}")
+            return {}
+
+    def calculate_market_depth(self, orderbook_data: Dict) -> Optional[Dict]:
+        """計算市場深度"""
+        try:
+            source = orderbook_data['source']
+            with self.metrics.stage('parse'):
+                book = ArrayOrderBook.from_raw(orderbook_data['data'], Config.DEPTH_LEVELS)
+
+            if book.empty:
+                return None
+
+            bands = Config.DEPTH_BANDS_BPS
+            with self.metrics.stage('compute'):
+                bid_bands, ask_bands = book.depth_bands(bands + (100,))  # 最後一欄為 1% 深度
+                imbalance = book.imbalance(bid_bands[:-1], ask_bands[:-1])
+                slip_buy, slip_sell = book.slippage_bps(Config.SLIPPAGE_SIZES_USD)
+
+            bid_depth = float(bid_bands[-1])
+            ask_depth = float(ask_bands[-1])
+            result = {
+                'price': book.mid,
+                'bid_depth': bid_depth,
+                'ask_depth': ask_depth,
+                'total_depth': bid_depth + ask_depth,
+                'spread_bps': book.spread_bps,
+                'source': source
+            }
+            for i, b in enumerate(bands):
+                result[f'bid_depth_{b}bps'] = float(bid_bands[i])
+                result[f'ask_depth_{b}bps'] = float(ask_bands[i])
+                result[f'imbalance_{b}bps'] = float(imbalance[i])
+            for i, size in enumerate(Config.SLIPPAGE_SIZES_USD):
+                result[f'slippage_buy_{size}'] = float(slip_buy[i])
+                result[f'slippage_sell_{size}'] = float(slip_sell[i])
+            return result
+        except Exception as e:
+            self.logger.error(f"Depth calculation error: {e}")
+            return None
+
+    def alert_metrics(self, depth_data: Dict, instrument: Optional[Dict] = None,
+                      timestamp: Optional[float] = None) -> Dict:
+        """規則引擎的輸入: 訂單簿指標 + 滾動統計 + VRP + 技術指標"""
+        key = instrument_key(instrument)
+        prefix = f"{key} " if key else ""
+        depth_stats, return_stats = self.get_statistics(instrument)
+        now = int(self.clock())
+        depth_stats.expire(now)
+        return_stats.expire(now)
+        samples = depth_stats.count
+        metrics = {name: value for name, value in depth_data.items() if name != 'source'}
+        metrics['depth_samples'] = samples
+
+        if samples >= Config.MIN_DEPTH_SAMPLES:
+            mean = depth_stats.mean
+            std = depth_stats.std()
+            threshold = mean - Config.DEPTH_STD_THRESHOLD * std
+            metrics['depth_mean'], metrics['depth_std'] = mean, std
+            self.logger.info(f"{prefix}Depth - Current: ${depth_data['total_depth']:,.0f}, Mean: ${mean:,.0f}, Std: ${std:,.0f}, Threshold: ${threshold:,.0f}")
+        else:
+            self.logger.info(f"Not enough data for statistics (only {samples} records)")
+
+        # VRP
+        if 'change_24h' in depth_data and samples > 2 and return_stats.prices.count > 2:
+            returns = return_stats.returns
+            if returns.count > 0:
+                realized_vol = returns.std(ddof=0) * np.sqrt(365 * 24 * 12)  # 年化
+                implied_vol = abs(depth_data.get('change_24h', 0)) / 100 * np.sqrt(365)
+                vrp = implied_vol - realized_vol
+                metrics.update(realized_vol=realized_vol, implied_vol=implied_vol, vrp=vrp)
+                self.logger.info(f"{prefix}VRP - IV: {implied_vol*100:.2f}%, RV: {realized_vol*100:.2f}%, VRP: {vrp*100:.2f}%")
+
+        indicators = self.update_indicators(self.clock() if timestamp is None else timestamp, depth_data, instrument)
+        for name, value in indicators.items():
+            if name not in metrics:
+                metrics[name] = value
+        return metrics
+
+    def check_alerts(self, depth_data: Dict, instrument: Optional[Dict] = None, timestamp: Optional[float] = None,
+                     persist: bool = True):
+        """所有警報規則 (Config.ALERT_RULES 等) 對這個 instrument 的最新指標一次評估
+
+        persist=False (串流模式的中間評估) 時, cooldown 中的重複警報最多每 STREAM_PERSIST_INTERVAL 秒寫一列。
+        """
+        record_interval = 0 if persist else Config.STREAM_PERSIST_INTERVAL
+        try:
+            with self.metrics.stage('alert'):
+                metrics = self.alert_metrics(depth_data, instrument, timestamp)
+                for alert_type, message, value, threshold in self.rules.alerts(instrument_key(instrument), metrics):
+                    self.send_alert(alert_type, message, value, threshold, record_interval)
+        except Exception as e:
+            self.metrics.incr('alert_errors')
+            self.logger.error(f"Alert check error: {e}")
+
+    def send_alert(self, alert_type: str, message: str, value: float, threshold: float,
+                   record_interval: float = 0):
+        """發送警報 (排入 AlertDispatcher, 立即返回)"""
+        try:
+            self.metrics.incr('alerts')
+            self.alerts.send(alert_type, message, value, threshold, timestamp=self.clock(),
+                             record_interval=record_interval)
+        except Exception as e:
+            self.logger.error(f"Alert error: {e}")
+
+    def run_cycle(self, orderbook: Optional[Dict] = None, persist: bool = True, price_max_age: float = 0,
+                  instrument: Optional[Dict] = None):
+        """執行監控循環 (orderbook 為 None 時從 REST 抓取; instrument 為 None 時監控 SOL-USDT 多來源)"""
+        cycle_started = time.perf_counter()
+        try:
+            if persist and instrument is None:
+                self.logger.info("=" * 50)
+                self.logger.info("Starting monitoring cycle...")
+
+            if orderbook is None:
+                with self.metrics.stage('fetch'):
+                    if instrument is not None:
+                        orderbook = self.collector.fetch_orderbook(instrument)
+                    else:
+                        orderbook = self.collector.fetch_orderbook_any_source()
+            if not orderbook:
+                self.metrics.incr('orderbook_missing')
+                self.logger.warning("No orderbook data available")
+                return
+
+            depth_data = self.calculate_market_depth(orderbook)
+            if not depth_data:
+                self.metrics.incr('depth_failures')
+                self.logger.warning("Failed to calculate market depth")
+                return
+
+            coin_id = instrument.get('coingecko_id') if instrument else 'solana'
+            with self.metrics.stage('fetch_price'):
+                price_data = self.collector.fetch_price_data(max_age=price_max_age, coin_id=coin_id) if coin_id else None
+            if price_data:
+                depth_data['volume_24h'] = price_data.get('volume_24h', 0)
+                depth_data['change_24h'] = price_data.get('change_24h', 0)
+
+            if not persist:
+                self.check_alerts(depth_data, instrument, self.clock(), persist=False)
+                return depth_data
+
+            timestamp = int(self.clock())
+            with self.metrics.stage('persist'):
+                self.store.insert_market_data(timestamp, depth_data, instrument_key(instrument))
+                self.update_statistics(timestamp, depth_data, instrument)
+            self.check_alerts(depth_data, instrument, timestamp)
+
+            if instrument is not None:
+                self.logger.info(f"✅ {instrument_key(instrument)} price ${depth_data['price']:.4f}, "
+                                 f"depth ${depth_data['total_depth']:,.0f}, spread {depth_data['spread_bps']:.2f} bps, "
+                                 f"{time.perf_counter() - cycle_started:.2f}s")
+                return depth_data
+
+            self.logger.info(f"✅ Cycle complete")
+            self.logger.info(f"   Price: ${depth_data['price']:.2f}")
+            self.logger.info(f"   Depth: ${depth_data['total_depth']:,.0f}")
+            self.logger.info(f"   Spread: {depth_data['spread_bps']:.2f} bps")
+            self.logger.info(f"   Source: {depth_data['source']}")
+            self.logger.info(f"   Cycle time: {time.perf_counter() - cycle_started:.2f}s")
+            return depth_data
+
+        except Exception as e:
+            self.metrics.incr('cycle_errors')
+            self.logger.error(f"Cycle error: {e}", exc_info=True)
+        finally:
+            self.metrics.incr('cycles')
+            self.metrics.observe('cycle', time.perf_counter() - cycle_started)
+            self.export_metrics()
+            self.maintain_storage()
+
+    def maintain_storage(self, force: bool = False) -> Optional[threading.Thread]:
+        """每 Config.MAINTENANCE_INTERVAL 秒在背景執行 rollup / retention / compaction (同時只有一個)"""
+        now = time.time()
+        if not force and (not Config.MAINTENANCE_INTERVAL or now - self._maintained < Config.MAINTENANCE_INTERVAL):
+            return None
+        if self._maintenance is not None and self._maintenance.is_alive():
+            return None
+        self._maintained = now
+
+        def run():
+            try:
+                with self.metrics.stage('maintenance'):
+                    result = self.tiers.maintain(self.clock())
+                self.logger.info(f"Storage maintenance: {result}")
+            except Exception as e:
+                self.metrics.incr('maintenance_errors')
+                self.logger.error(f"Storage maintenance error: {e}", exc_info=True)
+
+        self._maintenance = threading.Thread(target=run, daemon=True, name="storage-maintenance")
+        self._maintenance.start()
+        return self._maintenance
+
+    def export_metrics(self, force: bool = False):
+        """每 Config.METRICS_INTERVAL 秒寫一次 Prometheus text 檔 (METRICS_PATH) 並輸出一行 JSON 指標 log"""
+        now = time.time()
+        if not force and (not Config.METRICS_INTERVAL or now - self._metrics_exported < Config.METRICS_INTERVAL):
+            return
+        self._metrics_exported = now
+        try:
+            alerts = self.alerts.stats()
+            for name in ('sent', 'emails', 'connections', 'suppressed', 'failed', 'queued'):
+                self.metrics.gauge(f'alert_dispatch_{name}', alerts[name])
+            self.metrics.gauge('db_rows_written', self.store.written)
+            self.metrics.gauge('db_rows_failed', self.store.failed)
+            self.metrics.gauge('db_queue', self.store._queue.qsize())
+            if Config.METRICS_PATH:
+                self.metrics.write(Config.METRICS_PATH)
+            self.metrics.log(self.logger)
+        except Exception as e:
+            self.logger.warning(f"Metrics export failed: {e}")
+
+    def start(self):
+        """啟動監控"""
+        self.running = True
+
+        def loop():
+            while self.running:
+                self.run_cycle()
+                time.sleep(Config.MONITOR_INTERVAL)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+
+        self.logger.info("Monitor started")
+
+        try:
+            from IPython.display import Javascript, display
+            display(Javascript('''
+            setInterval(() => {
+                console.log("Keep alive");
+            }, 60000);
+            '''))
+        except:
+            pass
+
+    def start_streaming(self, feeds: Optional[List] = None, snapshot_fetcher=None, record_path: Optional[str] = None):
+        """啟動 WebSocket 串流模式: 即時訂單簿 + 次秒級評估"""
+        from sol_orderbook_stream import StreamingCollector, KuCoinFeed, GateFeed
+
+        if feeds is None:
+            feeds = [KuCoinFeed('SOL-USDT'), GateFeed('SOL_USDT')]
+        self.stream = StreamingCollector(self.logger, feeds, snapshot_fetcher=snapshot_fetcher,
+                                         record_path=record_path)
+        self.stream.start()
+        self.running = True
+
+        def loop():
+            last_persist = 0.0
+            while self.running:
+                started = time.time()
+                orderbook = self.stream.get_orderbook()
+                if orderbook and started - last_persist >= Config.STREAM_PERSIST_INTERVAL:
+                    self.run_cycle(orderbook, price_max_age=Config.PRICE_REFRESH_INTERVAL)
+                    last_persist = started
+                elif orderbook:
+                    self.run_cycle(orderbook, persist=False, price_max_age=Config.PRICE_REFRESH_INTERVAL)
+                time.sleep(max(0.0, Config.STREAM_EVAL_INTERVAL - (time.time() - started)))
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        self.logger.info(f"Streaming monitor started (eval every {Config.STREAM_EVAL_INTERVAL}s)")
+
+    def start_scheduler(self, instruments: Optional[List[Dict]] = None):
+        """多商品 × 多 venue 同時監控"""
+        self.running = True
+        self.scheduler = MonitorScheduler(
+            self, instruments or Config.INSTRUMENTS, interval=Config.MONITOR_INTERVAL,
+            workers=Config.SCHEDULER_WORKERS, venue_limits=Config.VENUE_LIMITS,
+            default_venue_limit=Config.DEFAULT_VENUE_LIMIT, jitter=Config.SCHEDULER_JITTER,
+            price_refresh_interval=Config.PRICE_REFRESH_INTERVAL, slow_latency=Config.VENUE_SLOW_LATENCY)
+        self.scheduler.start()
+
+    def stop(self):
+        self.running = False
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.stream is not None:
+            self.stream.stop()
+        self.alerts.close()
+        if self._maintenance is not None:
+            self._maintenance.join(60)
+        self.store.flush()
+        self.export_metrics(force=True)
+        self.logger.info("Monitor stopped")
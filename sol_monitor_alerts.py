@@ -0,0 +1,434 @@
+"""Alert rules and e-mail delivery for the SOL risk monitor.
+
+    from sol_monitor_alerts import AlertDispatcher, RuleEngine
+    rules = RuleEngine(Config.ALERT_RULES, constants=Config)
+    for alert_type, message, value, threshold in rules.alerts(key, metrics):
+        dispatcher.send(alert_type, message, value, threshold)
+
+RuleEngine compiles declarative rules into arrays and evaluates every instrument
+against every rule with a few numpy operations. AlertDispatcher applies the
+cooldown in memory, records alerts through MarketStore's background writer and
+sends e-mails from its own thread over one reused SMTP connection, merging
+alerts that fire together into a digest.
+"""
+import time
+import queue
+import fnmatch
+import smtplib
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import numpy as np
+
+
+class AlertDispatcher:
+    """警報寄送管線: send() 只在記憶體內判斷 cooldown 並放進佇列, 不等待 SMTP
+
+    背景執行緒收到第一則警報後最多等 digest_window 秒, 把期間內觸發的警報合併成一封信,
+    並重用同一條已登入的 SMTP 連線 (斷線時重連一次, 閒置過久才關閉)。cooldown 以
+    alert_type -> 最後寄出時間的 dict 維護, 啟動時由 alerts 表載入一次, 之後只經
+    MarketStore 背景寫入 email_sent, 不再每次查詢資料庫。
+    """
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(self, store, email_config: Dict, logger, digest_window: float = 2.0, cooldown: float = 1800,
+                 queue_max: int = 1000, smtp_host: str = "smtp.gmail.com", smtp_port: int = 587,
+                 smtp_starttls: bool = True, smtp_timeout: float = 20, idle_timeout: float = 240):
+        self.store = store
+        self.email_config = email_config
+        self.logger = logger
+        self.digest_window = digest_window
+        self.cooldown = cooldown
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_starttls = smtp_starttls
+        self.smtp_timeout = smtp_timeout
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._lock = threading.Lock()
+        self._smtp = None
+        self._smtp_used = 0.0
+        self.last_sent = dict(store.query(
+            "SELECT alert_type, MAX(timestamp) FROM alerts WHERE email_sent = 1 GROUP BY alert_type"))
+        self.last_recorded = {}        # alert_type -> 最後寫入 alerts 表的時間 (record_interval 用)
+        self.sent = 0
+        self.emails = 0
+        self.connections = 0
+        self.suppressed = 0
+        self.failed = 0
+        self.latencies = []            # 最近 1000 則: send() 到寄出 (秒)
+        self._worker = threading.Thread(target=self._send_loop, daemon=True, name="alert-dispatcher")
+        self._worker.start()
+
+    def send(self, alert_type: str, message: str, value: float, threshold: float,
+             timestamp: Optional[int] = None, record_interval: float = 0) -> bool:
+        """記錄警報; 不在 cooldown 內時排入寄送佇列 (回傳是否排入)
+
+        record_interval > 0 時 (串流模式每秒數次的評估), cooldown 中的重複觸發每個 alert_type
+        最多每 record_interval 秒寫一列 alerts, 其餘只計入 suppressed; 會寄出的觸發一律寫入。
+        """
+        current_time = int(time.time()) if timestamp is None else int(timestamp)
+        with self._lock:
+            last_sent = self.last_sent.get(alert_type)
+            in_cooldown = bool(last_sent and (current_time - last_sent) < self.cooldown)
+            last_recorded = self.last_recorded.get(alert_type)
+            record = (not in_cooldown or record_interval <= 0 or last_recorded is None
+                      or current_time - last_recorded >= record_interval)
+            if record:
+                self.last_recorded[alert_type] = current_time
+            if in_cooldown:
+                self.suppressed += 1
+            else:
+                # 先佔用 cooldown, 寄送失敗時再還原
+                self.last_sent[alert_type] = current_time
+        if record:
+            self.store.enqueue("""
+            INSERT INTO alerts (timestamp, alert_type, message, value, threshold, email_sent)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (current_time, alert_type, message, value, threshold, 0))
+        if in_cooldown:
+            if record:
+                self.logger.info(f"Alert {alert_type} in cooldown period")
+            return False
+        try:
+            self._queue.put_nowait((time.perf_counter(), (current_time, alert_type, message, value, threshold),
+                                    last_sent))
+        except queue.Full:
+            self._restore(alert_type, current_time, last_sent)
+            self.failed += 1
+            self.logger.error(f"Alert queue full, dropped {alert_type}")
+            return False
+        return True
+
+    def flush(self, timeout: float = 60.0) -> bool:
+        """等待目前佇列中的警報全部寄出 (或失敗)"""
+        done = threading.Event()
+        self._queue.put((self._FLUSH, done, None))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._worker.is_alive():
+            self._queue.put((self._CLOSE, None, None))
+            self._worker.join(60)
+        self._disconnect()
+
+    def stats(self) -> Dict:
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'sent': self.sent, 'emails': self.emails, 'connections': self.connections,
+            'suppressed': self.suppressed, 'failed': self.failed, 'queued': self._queue.qsize(),
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if latencies.size else None,
+            'latency_p95_ms': float(np.percentile(latencies, 95)) if latencies.size else None,
+            'latency_max_ms': float(latencies.max()) if latencies.size else None,
+        }
+
+    def _restore(self, alert_type: str, current_time: int, last_sent: Optional[int]):
+        with self._lock:
+            if self.last_sent.get(alert_type) == current_time:
+                if last_sent:
+                    self.last_sent[alert_type] = last_sent
+                else:
+                    self.last_sent.pop(alert_type, None)
+
+    def _send_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            batch, waiters, closing = [], [], False
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                enqueued, alert, last_sent = item
+                if enqueued is self._FLUSH:
+                    waiters.append(alert)
+                    break
+                if enqueued is self._CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._deliver(batch)
+            for waiter in waiters:
+                waiter.set()
+            if closing:
+                return
+
+    def _deliver(self, batch: List[tuple]):
+        alerts = [alert for _, alert, _ in batch]
+        try:
+            self._send_message(self._render(alerts))
+        except Exception as e:
+            self.failed += len(batch)
+            for _, (current_time, alert_type, *_), last_sent in batch:
+                self._restore(alert_type, current_time, last_sent)
+            self.logger.error(f"Alert error: {e}")
+            return
+
+        sent_at = time.perf_counter()
+        for enqueued, (current_time, alert_type, *_), _ in batch:
+            self.store.enqueue("""
+            UPDATE alerts SET email_sent = 1 WHERE id = (
+                SELECT MIN(id) FROM alerts WHERE timestamp = ? AND alert_type = ? AND email_sent = 0
+            )
+            """, (current_time, alert_type))
+            self.latencies.append(sent_at - enqueued)
+        del self.latencies[:-1000]
+        self.sent += len(batch)
+        self.emails += 1
+        self.logger.info(f"✅ Alert email sent: {', '.join(alert[1] for alert in alerts)}")
+
+    def _render(self, alerts: List[tuple]) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        if len(alerts) == 1:
+            msg['Subject'] = f"🚨 SOL Alert: {alerts[0][1]}"
+        else:
+            msg['Subject'] = f"🚨 SOL Alert: {len(alerts)} alerts ({', '.join(alert[1] for alert in alerts)})"
+        msg['From'] = self.email_config['sender_email']
+        msg['To'] = ', '.join(self.email_config['recipients'])
+
+        details = "".join(f"""
+                <div style="background: #f8f9fa; padding: 15px; border-radius: 5px; margin-bottom: 10px;">
+                    <p><strong>Type:</strong> {alert_type.replace('_', ' ')}</p>
+                    <p><strong>Message:</strong> {message}</p>
+                    <p><strong>Current Value:</strong> {value:,.2f}</p>
+                    <p><strong>Threshold:</strong> {threshold:,.2f}</p>
+                    <p><strong>Time:</strong> {datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')} UTC+8</p>
+                </div>""" for current_time, alert_type, message, value, threshold in alerts)
+        html = f"""
+            <html>
+            <body style="font-family: Arial; padding: 20px;">
+                <h2 style="color: #e74c3c;">🚨 SOL Risk Alert</h2>{details}
+                <div style="margin-top: 20px;">
+                    <h3>Recommended Actions:</h3>
+                    <ul>
+                        <li>Reduce leverage to below 10x</li>
+                        <li>Use limit orders instead of market orders</li>
+                        <li>Monitor liquidation levels closely</li>
+                    </ul>
+                </div>
+            </body>
+            </html>
+            """
+        msg.attach(MIMEText(html, 'html'))
+        return msg
+
+    def _connect(self):
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.smtp_timeout)
+        if self.smtp_starttls:
+            server.starttls()
+        if self.email_config.get('sender_password'):
+            server.login(self.email_config['sender_email'], self.email_config['sender_password'])
+        self.connections += 1
+        return server
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send_message(self, msg: MIMEMultipart):
+        """重用已登入的連線; 連線已被伺服器關閉 (或閒置過久) 時重連後重試一次"""
+        if self._smtp is not None and time.monotonic() - self._smtp_used > self.idle_timeout:
+            self._disconnect()
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.send_message(msg)
+                self._smtp_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                self._disconnect()
+                if attempt:
+                    raise
+            except Exception:
+                self._disconnect()
+                raise
+
+
+class RuleEngine:
+    """宣告式警報規則, 編譯成陣列後對所有 instrument × 規則做一次向量化評估
+
+    規則 (dict):
+        name         警報類型 (非預設 instrument 時附加 ':<instrument>')
+        metric       指標名稱
+        op           '<' '<=' '>' '>=', 或 'cross_above' / 'cross_below' (與該 instrument 上一筆比較)
+        threshold    數值 / 指標名稱 / {'metric': 指標, 'offset': 指標或數值, 'k': 數值} (= metric + k * offset)
+        when         [(指標, op, threshold), ...] 全部成立才評估 (選用)
+        instruments  instrument key 的 fnmatch 樣式 (選用, 省略 = 全部)
+        message      str.format 樣式, 可用 {value} {threshold} 與任何指標
+    數值可寫成 'Config.X' / '-Config.X', 編譯時取 constants (監控的 Config 類別) 的屬性。
+
+    指標存成 instrument × 指標 的矩陣 (缺值為 NaN, 與 NaN 比較一律不成立), 每次評估是固定
+    幾個 numpy 運算, 不查詢資料庫。
+    """
+    OPS = ('<', '<=', '>', '>=', 'cross_above', 'cross_below')
+
+    def __init__(self, rules: List[Dict], constants=None):
+        self.constants = constants
+        self._lock = threading.Lock()
+        self.columns = {'': 0}          # 第 0 欄恆為 1, 常數門檻用
+        self.rows = {}
+        self.keys = []
+        self.values = np.ones((0, 1))
+        self.prev = np.ones((0, 1))
+        self.rules = [self._resolve(rule) for rule in rules]
+        self._compile()
+
+    def _resolve(self, value):
+        if isinstance(value, dict):
+            return {k: self._resolve(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._resolve(v) for v in value]
+        if isinstance(value, str) and value.lstrip('-').startswith('Config.'):
+            if self.constants is None:
+                raise ValueError(f"{value!r} needs RuleEngine(constants=Config)")
+            resolved = getattr(self.constants, value.lstrip('-')[len('Config.'):])
+            return -resolved if value.startswith('-') else resolved
+        return value
+
+    def _column(self, name: str) -> int:
+        if name not in self.columns:
+            self.columns[name] = len(self.columns)
+            pad = np.full((len(self.values), 1), np.nan)
+            self.values = np.hstack((self.values, pad))
+            self.prev = np.hstack((self.prev, pad))
+        return self.columns[name]
+
+    def _linear(self, spec) -> tuple:
+        """門檻 -> (c0, i1, c1, i2, c2): c0 + c1 * X[:, i1] + c2 * X[:, i2]"""
+        if isinstance(spec, dict):
+            c0, i1, c1, _, _ = self._linear(spec['metric'])
+            k = float(spec.get('k', 1.0))
+            offset = spec.get('offset', 0.0)
+            if isinstance(offset, str):
+                return c0, i1, c1, self._column(offset), k
+            return c0 + k * float(offset), i1, c1, 0, 0.0
+        if isinstance(spec, str):
+            return 0.0, self._column(spec), 1.0, 0, 0.0
+        return float(spec), 0, 0.0, 0, 0.0
+
+    def _compile(self):
+        tests, owners = [], []
+        for rule in self.rules:
+            tests.append((rule['metric'], rule['op'], rule['threshold']))
+        # 相同的條件 (例如共用的樣本數下限) 只評估一次
+        guards = {}
+        for i, rule in enumerate(self.rules):
+            for metric, op, threshold in rule.get('when') or []:
+                key = (metric, op, repr(threshold))
+                if key not in guards:
+                    guards[key] = len(tests)
+                    tests.append((metric, op, threshold))
+                    owners.append([])
+                owners[guards[key] - len(self.rules)].append(i)
+        for metric, op, _ in tests:
+            if op not in self.OPS:
+                raise ValueError(f"Unknown op {op!r} for {metric}")
+
+        self.lhs = np.array([self._column(metric) for metric, _, _ in tests], dtype=np.intp)
+        self.op = np.array([self.OPS.index(op) for _, op, _ in tests], dtype=np.intp)
+        linear = np.array([self._linear(threshold) for _, _, threshold in tests], dtype=np.float64).reshape(-1, 5)
+        self.c0, self.c1, self.c2 = linear[:, 0], linear[:, 2], linear[:, 4]
+        self.i1, self.i2 = linear[:, 1].astype(np.intp), linear[:, 3].astype(np.intp)
+        self.by_op = [np.flatnonzero(self.op == code) for code in range(len(self.OPS))]
+        self.crossing = bool(len(self.by_op[4]) or len(self.by_op[5]))
+        # 條件 -> 所屬規則 (one-hot), 失敗的條件數 > 0 的規則不觸發
+        self.guards = np.zeros((len(tests) - len(self.rules), len(self.rules)), dtype=np.float32)
+        for g, rules in enumerate(owners):
+            self.guards[g, rules] = 1
+        self._applicable = np.zeros((0, len(self.rules)), dtype=bool)
+
+    def _row(self, key) -> int:
+        if key not in self.rows:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+            pad = np.full((1, self.values.shape[1]), np.nan)
+            pad[0, 0] = 1.0
+            self.values = np.vstack((self.values, pad))
+            self.prev = np.vstack((self.prev, pad))
+            self._applicable = np.vstack((self._applicable, [[
+                not rule.get('instruments') or
+                (key is not None and any(fnmatch.fnmatchcase(key, p) for p in rule['instruments']))
+                for rule in self.rules
+            ]]))
+        return self.rows[key]
+
+    def update(self, key, metrics: Dict):
+        """以本次的指標取代該 instrument 的整列 (未提供的指標為 NaN), 原值留作穿越判斷"""
+        with self._lock:
+            row = np.full(self.values.shape[1], np.nan)
+            row[0] = 1.0
+            for name, value in metrics.items():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                column = self._column(name)
+                if column >= len(row):
+                    row = np.append(row, np.full(column + 1 - len(row), np.nan))
+                row[column] = value
+            i = self._row(key)
+            self.prev[i] = self.values[i]
+            self.values[i] = row
+
+    def evaluate(self, keys: Optional[List] = None) -> List[tuple]:
+        """評估 keys (預設全部) 的所有規則, 回傳觸發的 (key, rule, value, threshold)"""
+        with self._lock:
+            rows = np.arange(len(self.keys)) if keys is None else np.array([self.rows[k] for k in keys], dtype=np.intp)
+            x = self.values[rows]
+            lhs = x[:, self.lhs]
+            threshold = self.c0 + self.c1 * x[:, self.i1] + self.c2 * x[:, self.i2]
+            diff = lhs - threshold
+            if self.crossing:
+                p = self.prev[rows]
+                before = p[:, self.lhs] - (self.c0 + self.c1 * p[:, self.i1] + self.c2 * p[:, self.i2])
+            passed = np.zeros(diff.shape, dtype=bool)
+            with np.errstate(invalid='ignore'):
+                lt, le, gt, ge, up, down = self.by_op
+                passed[:, lt] = diff[:, lt] < 0
+                passed[:, le] = diff[:, le] <= 0
+                passed[:, gt] = diff[:, gt] > 0
+                passed[:, ge] = diff[:, ge] >= 0
+                if self.crossing:
+                    passed[:, up] = (before[:, up] <= 0) & (diff[:, up] > 0)
+                    passed[:, down] = (before[:, down] >= 0) & (diff[:, down] < 0)
+            n = len(self.rules)
+            fired = passed[:, :n] & self._applicable[rows]
+            if len(self.guards):
+                fired &= (~passed[:, n:]).astype(np.float32) @ self.guards == 0
+            i, j = np.nonzero(fired)
+            keys, rules = self.keys, self.rules
+            return [(keys[r], rules[c], v, t) for r, c, v, t in
+                    zip(rows[i].tolist(), j.tolist(), lhs[i, j].tolist(), threshold[i, j].tolist())]
+
+    def alerts(self, key, metrics: Dict) -> List[tuple]:
+        """update + evaluate 單一 instrument, 回傳 send_alert 的參數 (alert_type, message, value, threshold)"""
+        self.update(key, metrics)
+        prefix = f"{key} " if key else ""
+        suffix = f":{key}" if key else ""
+        out = []
+        for _, rule, value, threshold in self.evaluate([key]):
+            try:
+                message = rule['message'].format_map({**metrics, 'value': value, 'threshold': threshold})
+            except (KeyError, ValueError, TypeError, IndexError, AttributeError):
+                message = f"{rule['metric']} {value:,.4f} {rule['op']} {threshold:,.4f}"
+            out.append((rule['name'] + suffix, prefix + message, value, threshold))
+        return out
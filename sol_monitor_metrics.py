@@ -0,0 +1,117 @@
+"""Stage timings and counters for the SOL risk monitor.
+
+    from sol_monitor_metrics import Metrics
+    metrics = Metrics()
+    with metrics.stage('fetch'):
+        ...
+    metrics.incr('cycles')
+    metrics.write("sol_monitor.prom")     # Prometheus text (node_exporter textfile collector)
+    metrics.log(logger)                   # one JSON line
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from typing import Dict
+
+
+class StageTimer:
+    """with metrics.stage(name): 的計時器 (比 contextmanager 產生器便宜, 熱路徑上每個階段只多幾 µs)"""
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+class Metrics:
+    """各階段耗時與計數器, 輸出 Prometheus text 或一行 JSON log
+
+    with metrics.stage('fetch'): ... 累計次數、總秒數、最大值、最近一次與 histogram;
+    incr() 為單調遞增的計數器, gauge() 為當下數值 (佇列長度等)。執行緒安全。
+    """
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, namespace: str = 'sol_monitor'):
+        self.namespace = namespace
+        self.started = time.time()
+        self.stages = {}             # stage -> [count, 總秒數, 最大, 最近一次, 各 bucket 次數]
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str) -> StageTimer:
+        return StageTimer(self, name)
+
+    def observe(self, name: str, seconds: float):
+        bucket = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = [0, 0.0, 0.0, 0.0, [0] * (len(self.BUCKETS) + 1)]
+            s[0] += 1
+            s[1] += seconds
+            s[2] = max(s[2], seconds)
+            s[3] = seconds
+            s[4][bucket] += 1
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self) -> Dict:
+        """結構化指標 (毫秒), 供 JSON log 與回放報告使用"""
+        with self._lock:
+            stages = {name: {'count': s[0], 'total_ms': round(s[1] * 1000, 3),
+                             'mean_ms': round(s[1] * 1000 / s[0], 4), 'max_ms': round(s[2] * 1000, 3),
+                             'last_ms': round(s[3] * 1000, 3)}
+                      for name, s in self.stages.items()}
+            return {'uptime_s': round(time.time() - self.started, 1), 'stages': stages,
+                    'counters': dict(self.counters), 'gauges': dict(self.gauges)}
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        ns = self.namespace
+        with self._lock:
+            stages = {name: (s[0], s[1], s[2], list(s[4])) for name, s in sorted(self.stages.items())}
+            counters, gauges = sorted(self.counters.items()), sorted(self.gauges.items())
+        lines = [f'# HELP {ns}_stage_seconds Time spent per monitor stage',
+                 f'# TYPE {ns}_stage_seconds histogram']
+        for name, (count, total, _, buckets) in stages.items():
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{ns}_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{ns}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{ns}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{ns}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines += [f'# HELP {ns}_stage_seconds_max Slowest observation per stage since start',
+                  f'# TYPE {ns}_stage_seconds_max gauge']
+        lines += [f'{ns}_stage_seconds_max{{stage="{name}"}} {s[2]:.6f}' for name, s in stages.items()]
+        for name, value in counters:
+            lines += [f'# TYPE {ns}_{name}_total counter', f'{ns}_{name}_total {value}']
+        for name, value in gauges:
+            lines += [f'# TYPE {ns}_{name} gauge', f'{ns}_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """原子寫入 (先寫暫存檔再 rename), textfile collector 不會讀到一半的檔案"""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def log(self, logger):
+        logger.info("metrics " + json.dumps(self.snapshot(), sort_keys=True))
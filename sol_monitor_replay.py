@@ -0,0 +1,313 @@
+"""Replay recorded market data through the SOL risk monitor on a virtual clock.
+
+    python sol_monitor_replay.py --db sol_risk.db                                  # market_data rows
+    python sol_monitor_replay.py --db sol_risk.db --instrument KuCoin:SOL-USDT:perp  # instrument_data rows
+    python sol_monitor_replay.py --frames stream.jsonl    # StreamingCollector(record_path=...) capture
+    python sol_monitor_replay.py --synthetic 500000       # generated history (self-test / throughput)
+
+Sources:
+    market_data / instrument_data   the per-cycle metrics the monitor stored; each row is one
+                                    update_statistics + check_alerts cycle
+    --frames (JSON lines)           recorded WebSocket frames and REST snapshots are applied to local
+                                    books; every STREAM_EVAL_INTERVAL of recorded time the book goes
+                                    through calculate_market_depth -> check_alerts, and statistics are
+                                    updated every STREAM_PERSIST_INTERVAL, like start_streaming().
+                                    Lines of {'ts', 'source', 'data': {'bids', 'asks'}} (REST
+                                    orderbooks) are evaluated as one cycle each.
+
+The monitor's clock (SOLMonitor.clock) returns the timestamp of the event being replayed, so the
+rolling windows, indicator days and the e-mail cooldown follow recorded time and nothing sleeps;
+alerts are recorded instead of e-mailed and the database writes of the live loop are skipped.
+
+Scoring: an alert is a true positive when the price moves at least --move-bps away from the alert
+price within --horizon seconds, otherwise a false positive (alerts closer than --horizon to the end
+of the data are not scored). "base rate" is the same test applied to every cycle, i.e. the hit
+rate of an alert that fires at random.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import tempfile
+from collections import defaultdict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from sol_monitor import Config, SOLMonitor
+
+MARKET_COLUMNS = ('timestamp', 'price', 'volume_24h', 'change_24h', 'bid_depth', 'ask_depth',
+                  'total_depth', 'spread_bps', 'source')
+
+
+class ReplayAlerts:
+    """取代 AlertDispatcher: 記錄每次觸發, 以虛擬時間套用 EMAIL_COOLDOWN 判斷是否會寄出"""
+
+    def __init__(self, cooldown: float):
+        self.cooldown = cooldown
+        self.last_sent = {}
+        self.fired = []             # (timestamp, alert_type, message, value, threshold, emailed)
+
+    def send(self, alert_type: str, message: str, value: float, threshold: float,
+             timestamp: Optional[int] = None, record_interval: float = 0) -> bool:
+        last_sent = self.last_sent.get(alert_type)
+        emailed = not (last_sent and (timestamp - last_sent) < self.cooldown)
+        if emailed:
+            self.last_sent[alert_type] = timestamp
+        self.fired.append((timestamp, alert_type, message, value, threshold, emailed))
+        return emailed
+
+    def flush(self, timeout: float = 0) -> bool:
+        return True
+
+    def stats(self) -> Dict:
+        emails = sum(1 for fired in self.fired if fired[5])
+        return {'sent': len(self.fired), 'emails': emails, 'connections': 0,
+                'suppressed': len(self.fired) - emails, 'failed': 0, 'queued': 0}
+
+    def close(self):
+        pass
+
+
+class Replay:
+    """SOLMonitor 在暫存資料庫上, 時鐘由回放的事件推進"""
+
+    PATHS = {'DB_PATH': "replay.db", 'LOG_PATH': "replay.log",
+             'HTTP_CACHE_DIR': "http_cache", 'ARCHIVE_DIR': "market_archive"}
+
+    def __init__(self, workdir: str, cooldown: Optional[float] = None):
+        # SOLMonitor 建構時讀取這些路徑; 暫時指向 workdir, close() 時還原
+        self._saved_paths = {name: getattr(Config, name) for name in self.PATHS}
+        for name, path in self.PATHS.items():
+            setattr(Config, name, os.path.join(workdir, path))
+        self.now = 0.0
+        try:
+            monitor = SOLMonitor({'sender_email': 'replay@localhost', 'sender_password': '', 'recipients': []})
+        except Exception:
+            self._restore_paths()
+            raise
+        monitor.logger.setLevel(logging.WARNING)
+        monitor.alerts.close()
+        monitor.alerts = ReplayAlerts(Config.EMAIL_COOLDOWN if cooldown is None else cooldown)
+        monitor.clock = lambda: self.now
+        monitor.collector.fetch_daily_bars = lambda *args, **kwargs: None   # 指標只由回放的價格累積
+        self.monitor = monitor
+        self.events = 0
+        self.cycles = 0
+        self.ts = []
+        self.prices = []
+
+    def close(self):
+        try:
+            self.monitor.stop()
+            self.monitor.store.close()
+        finally:
+            self._restore_paths()
+
+    def _restore_paths(self):
+        for name, path in self._saved_paths.items():
+            setattr(Config, name, path)
+
+    def cycle(self, ts: float, depth_data: Dict, instrument: Optional[Dict] = None, persist: bool = True):
+        """與 run_cycle 相同的順序: (寫入時) 更新統計, 再評估警報"""
+        self.now = ts
+        if persist:
+            self.monitor.update_statistics(int(ts), depth_data, instrument)
+        self.monitor.check_alerts(depth_data, instrument, ts, persist=persist)
+        self.cycles += 1
+        self.ts.append(ts)
+        self.prices.append(depth_data['price'])
+
+    # ---------- 來源 ----------
+    def run_market_data(self, db_path: str, instrument_key: Optional[str] = None,
+                        since: Optional[int] = None, until: Optional[int] = None, chunk: int = 50000):
+        instrument = None
+        where, params = ["timestamp >= ?", "timestamp < ?"], [since or 0, until or 2 ** 62]
+        table = "market_data"
+        if instrument_key:
+            venue, symbol, market = instrument_key.split(':', 2)
+            instrument = {'venue': venue, 'symbol': symbol, 'market': market}
+            table = "instrument_data"
+            where.append("instrument = ?")
+            params.append(instrument_key)
+        conn = sqlite3.connect(db_path)
+        cursor = conn.execute(f"SELECT {', '.join(MARKET_COLUMNS)} FROM {table} "
+                              f"WHERE {' AND '.join(where)} ORDER BY timestamp", params)
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            for row in rows:
+                depth_data = dict(zip(MARKET_COLUMNS[1:], row[1:]))
+                if not depth_data['price'] or depth_data['total_depth'] is None:
+                    continue
+                self.events += 1
+                self.cycle(row[0], depth_data, instrument)
+        conn.close()
+
+    def run_frames(self, path: str):
+        from sol_orderbook_stream import LocalOrderBook, KuCoinFeed, GateFeed, SequenceGap
+        feeds = {feed.name: feed for feed in (KuCoinFeed(''), GateFeed(''))}
+        books = {}
+        next_eval = next_persist = None
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                ts = float(record['ts'])
+                self.events += 1
+                if 'data' in record:
+                    self.now = ts
+                    depth_data = self.monitor.calculate_market_depth(record)
+                    if depth_data:
+                        self.cycle(ts, depth_data)
+                    continue
+
+                # 先以目前 (事件之前) 的訂單簿補上這段期間應有的評估
+                while next_eval is not None and next_eval <= ts:
+                    orderbook = next(({'source': f"{name} (stream)", 'data': book.top(100)}
+                                      for name, book in books.items() if book.synced), None)
+                    if orderbook:
+                        self.now = next_eval
+                        depth_data = self.monitor.calculate_market_depth(orderbook)
+                        if depth_data:
+                            persist = next_persist is None or next_eval >= next_persist
+                            if persist:
+                                next_persist = next_eval + Config.STREAM_PERSIST_INTERVAL
+                            self.cycle(next_eval, depth_data, persist=persist)
+                    next_eval += Config.STREAM_EVAL_INTERVAL
+
+                venue = record['venue']
+                book = books.setdefault(venue, LocalOrderBook(venue))
+                if 'snapshot' in record:
+                    snapshot = record['snapshot']
+                    book.load_snapshot(snapshot['bids'], snapshot['asks'], snapshot['sequence'],
+                                       partial=venue in feeds and feeds[venue].partial_snapshot)
+                    if next_eval is None:
+                        next_eval = ts + Config.STREAM_EVAL_INTERVAL
+                elif book.synced and venue in feeds:
+                    delta = feeds[venue].parse(record['frame'])
+                    if delta is not None:
+                        try:
+                            feeds[venue].apply(book, *delta)
+                        except SequenceGap:
+                            book.synced = False     # 等下一個錄到的快照
+                        if book.levels() < feeds[venue].resync_levels:
+                            book.synced = False     # 超出部分快照的範圍, 同上
+
+    # ---------- 評分 ----------
+    def report(self, horizon: float, move_bps: float) -> pd.DataFrame:
+        ts = np.asarray(self.ts, dtype=np.float64)
+        price = np.asarray(self.prices, dtype=np.float64)
+        order = np.argsort(ts, kind='stable')
+        ts, price = ts[order], price[order]
+        # [t, t + horizon] 的最高/最低價: 時間取負值後反轉, 變成一般的向後 rolling
+        series = pd.Series(price[::-1], index=pd.to_datetime(-ts[::-1], unit='s'))
+        window = series.rolling(pd.Timedelta(seconds=horizon), closed='both')
+        high, low = window.max().to_numpy()[::-1], window.min().to_numpy()[::-1]
+        move = np.log(np.maximum(high / price, price / low)) >= move_bps / 1e4
+        scored = ts + horizon <= ts[-1] if len(ts) else ts.astype(bool)
+
+        rows = defaultdict(lambda: [0, 0, 0, 0, 0, 0])   # fired, emails, tp, fp, email tp, email fp
+        for timestamp, alert_type, _, _, _, emailed in self.monitor.alerts.fired:
+            i = max(np.searchsorted(ts, timestamp, side='right') - 1, 0)
+            name = alert_type.split(':', 1)[0]
+            stats = rows[name]
+            stats[0] += 1
+            stats[1] += emailed
+            if scored[i]:
+                stats[2 if move[i] else 3] += 1
+                if emailed:
+                    stats[4 if move[i] else 5] += 1
+        out = pd.DataFrame([[name] + values for name, values in sorted(rows.items())],
+                           columns=['alert', 'fired', 'emails', 'tp', 'fp', 'email_tp', 'email_fp'])
+        out['fp_rate'] = out['fp'] / (out['tp'] + out['fp'])
+        out['email_fp_rate'] = out['email_fp'] / (out['email_tp'] + out['email_fp'])
+        self.base_rate = float(move[scored].mean()) if scored.any() else float('nan')
+        return out
+
+
+def synthetic_market_data(path: str, rows: int, interval: int = 60, end: Optional[int] = None, seed: int = 21):
+    """market_data 形狀的合成歷史: 平靜/壓力兩種狀態, 壓力前深度變薄、價差變寬, 壓力期間波動放大"""
+    rng = np.random.default_rng(seed)
+    end = end or int(time.time()) // interval * interval
+    ts = end - interval * np.arange(rows)[::-1]
+    stress = np.zeros(rows, dtype=bool)
+    starts = rng.choice(rows, size=max(rows // 2000, 1), replace=False)
+    for start in starts:
+        stress[start:start + rng.integers(30, 180)] = True
+    # 流動性在壓力前 60 個週期開始惡化 (警報的提前量)
+    warning = np.convolve(stress, np.ones(60), 'full')[60 - 1:][:rows] > 0
+    vol = np.where(stress, 0.006, 0.0012) * np.sqrt(interval / 60)
+    price = 150 * np.exp(np.cumsum(rng.normal(0, vol)))
+    depth = rng.lognormal(np.log(2e6), 0.25, rows) * np.where(warning, 0.55, 1.0)
+    spread = rng.gamma(2.0, 1.5, rows) * np.where(warning, 3.0, 1.0)
+    lag = max(86400 // interval, 1)
+    change = np.where(np.arange(rows) >= lag, (price / np.roll(price, lag) - 1) * 100, 0.0)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS market_data (
+        timestamp INTEGER PRIMARY KEY, price REAL, volume_24h REAL, change_24h REAL,
+        bid_depth REAL, ask_depth REAL, total_depth REAL, spread_bps REAL, source TEXT
+    )""")
+    conn.executemany("INSERT OR REPLACE INTO market_data VALUES (?, ?, 0, ?, ?, ?, ?, ?, 'synthetic')",
+                     zip(ts.tolist(), price.tolist(), change.tolist(), (depth / 2).tolist(), (depth / 2).tolist(),
+                         depth.tolist(), spread.tolist()))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--db', help='monitor database (market_data / instrument_data)')
+    source.add_argument('--frames', help='JSON lines recorded by StreamingCollector(record_path=...)')
+    source.add_argument('--synthetic', type=int, metavar='ROWS', help='replay generated market_data rows')
+    parser.add_argument('--instrument', help='venue:symbol:market, reads instrument_data')
+    parser.add_argument('--since', help='first timestamp (ISO date or epoch seconds)')
+    parser.add_argument('--until', help='end timestamp (ISO date or epoch seconds)')
+    parser.add_argument('--horizon', type=float, default=3600, help='seconds after an alert to look for a move')
+    parser.add_argument('--move-bps', type=float, default=150, help='move that makes an alert a true positive')
+    parser.add_argument('--cooldown', type=float, help='e-mail cooldown (default Config.EMAIL_COOLDOWN)')
+    args = parser.parse_args()
+
+    def epoch(value):
+        if value is None:
+            return None
+        return int(value) if value.isdigit() else int(pd.Timestamp(value).timestamp())
+
+    with tempfile.TemporaryDirectory() as workdir:
+        replay = Replay(workdir, args.cooldown)
+        started = time.perf_counter()
+        if args.frames:
+            replay.run_frames(args.frames)
+            label = "frames"
+        else:
+            db_path = args.db
+            if args.synthetic:
+                db_path = os.path.join(workdir, "synthetic.db")
+                synthetic_market_data(db_path, args.synthetic)
+                started = time.perf_counter()
+            replay.run_market_data(db_path, args.instrument, epoch(args.since), epoch(args.until))
+            label = "instrument_data rows" if args.instrument else "market_data rows"
+        elapsed = time.perf_counter() - started
+        report = replay.report(args.horizon, args.move_bps)
+        replay.close()
+
+    print(f"{replay.events:,} {label} -> {replay.cycles:,} cycles in {elapsed:.2f}s "
+          f"({replay.events / max(elapsed, 1e-9):,.0f} events/s, {replay.cycles / max(elapsed, 1e-9):,.0f} cycles/s)")
+    stages = replay.monitor.metrics.snapshot()['stages']
+    print("per cycle: " + ", ".join(f"{name} {s['mean_ms'] * 1000:.0f}us" for name, s in sorted(stages.items())))
+    print(f"true positive: |move| >= {args.move_bps:g} bps within {args.horizon:g}s; "
+          f"base rate {replay.base_rate:.1%}")
+    if report.empty:
+        print("no alerts fired")
+    else:
+        with pd.option_context('display.width', 200, 'display.float_format', '{:.1%}'.format):
+            print(report.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
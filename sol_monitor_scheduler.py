@@ -0,0 +1,237 @@
+"""Multi-instrument scheduling for the SOL risk monitor.
+
+    from sol_monitor_scheduler import MonitorScheduler
+    scheduler = MonitorScheduler(monitor, [{'venue': 'KuCoin', 'symbol': 'SOL-USDT', 'market': 'perp'}],
+                                 interval=300, venue_limits={'KuCoin': (5, 10, 4)})
+    scheduler.start()
+
+Runs `monitor.run_cycle(instrument=...)` for every instrument on one thread pool.
+Start times are spread over the interval with random jitter, each venue has a
+token bucket and an in-flight limit (work over budget is deferred, not queued in
+the pool), and a venue whose latency rises gets a longer interval.
+"""
+import time
+import heapq
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+
+def instrument_key(instrument: Optional[Dict]) -> Optional[str]:
+    """venue:symbol:market, None 代表原本的 SOL-USDT 多來源監控"""
+    if instrument is None:
+        return None
+    return f"{instrument['venue']}:{instrument['symbol']}:{instrument.get('market', 'spot')}"
+
+
+class VenueBudget:
+    """每個 venue 的 token bucket 速率限制、同時進行的 cycle 上限、429 / 5xx 退避與延遲 EWMA
+
+    排程器以 admit() 決定 cycle 能否開始 (不消耗 token); cycle 內每個實際送出的 HTTP 請求
+    (訂單簿、合約規格、重試) 各以 acquire() 取一個 token。venue 回 429 / 5xx 時 throttled()
+    讓整個 venue 暫停 (有 Retry-After 時依其秒數), 期間 admit() 延後、acquire() 等待或放棄。
+    """
+    __slots__ = ('rate', 'burst', 'max_in_flight', 'slow_latency', 'tokens', 'updated', 'in_flight',
+                 'backoff_until', 'latency', 'completed', 'deferred', 'errors', 'requests', 'throttles',
+                 'lock')
+
+    def __init__(self, rate: float, burst: float, max_in_flight: int, slow_latency: float = 2.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.slow_latency = slow_latency
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.backoff_until = 0.0
+        self.latency = 0.0
+        self.completed = 0
+        self.deferred = 0
+        self.errors = 0
+        self.requests = 0
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def admit(self, now: float) -> float:
+        """開始一次 cycle; 回傳 0 表示可以開始, 否則為建議的延後秒數"""
+        with self.lock:
+            self._refill(now)
+            if now < self.backoff_until:
+                delay = self.backoff_until - now
+            elif self.in_flight >= self.max_in_flight:
+                delay = max(self.latency / self.max_in_flight, 0.1)
+            elif self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+            else:
+                self.in_flight += 1
+                return 0.0
+            self.deferred += 1
+            return delay
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """每個 HTTP 請求送出前呼叫: 等到有 token 且不在退避期間; timeout 秒內等不到回傳 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.backoff_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return True
+                wait = max(self.backoff_until - now, (1 - self.tokens) / self.rate)
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def throttled(self, seconds: float):
+        """venue 回應 429 / 5xx: seconds 秒內不再送出請求"""
+        with self.lock:
+            self.backoff_until = max(self.backoff_until, time.monotonic() + seconds)
+            self.throttles += 1
+
+    def release(self, elapsed: float, ok: bool):
+        """cycle 結束; elapsed 為實際執行時間 (不含在執行緒池排隊的時間)"""
+        with self.lock:
+            self.in_flight -= 1
+            self.latency = elapsed if not self.completed else 0.8 * self.latency + 0.2 * elapsed
+            self.completed += 1
+            if not ok:
+                self.errors += 1
+
+    @property
+    def slowdown(self) -> float:
+        """venue 平均延遲超過 slow_latency 時的間隔倍數 (1 ~ 4)"""
+        return min(4.0, max(1.0, self.latency / self.slow_latency))
+
+
+class MonitorScheduler:
+    """在一個執行緒池上排程多個 instrument 的 run_cycle
+
+    - 啟動時把各 instrument 均勻分散在一個 interval 內, 之後每次再加上隨機抖動
+    - 每個 venue 有 token bucket 與同時 cycle 上限, 額度不足的工作延後而不是堆積在池中;
+      token 按實際送出的 HTTP 請求計 (monitor.collector.budgets), 429 / 5xx 時整個 venue 退避
+    - venue 延遲升高時拉長該 venue 的間隔 (back-pressure)
+    """
+
+    def __init__(self, monitor, instruments: List[Dict], interval: float = 300, workers: int = 16,
+                 venue_limits: Optional[Dict[str, tuple]] = None, default_venue_limit: tuple = (2, 5, 2),
+                 jitter: float = 0.1, price_refresh_interval: float = 60, slow_latency: float = 2.0):
+        self.monitor = monitor
+        self.logger = monitor.logger
+        self.interval = interval
+        self.jitter = jitter
+        self.price_refresh_interval = price_refresh_interval
+        self.instruments = {instrument_key(i): i for i in instruments}
+        self.budgets = {}
+        for instrument in instruments:
+            venue = instrument['venue']
+            if venue not in self.budgets:
+                limit = (venue_limits or {}).get(venue, default_venue_limit)
+                self.budgets[venue] = VenueBudget(*limit, slow_latency=slow_latency)
+        # DataCollector 在送出每個 venue 請求前向同一個 budget 取 token
+        monitor.collector.budgets.update(self.budgets)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="monitor")
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._last_price_refresh = 0.0
+
+    def _jitter(self) -> float:
+        return random.uniform(-self.jitter, self.jitter) * self.interval
+
+    def _schedule(self, key: str, when: float):
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (when, self._seq, key))
+            self._cond.notify()
+
+    def start(self):
+        self._running = True
+        self.refresh_prices()
+        now = time.monotonic()
+        n = len(self.instruments)
+        for i, key in enumerate(self.instruments):
+            self._schedule(key, now + self.interval * i / max(n, 1) + abs(self._jitter()))
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="monitor-scheduler")
+        self._thread.start()
+        self.logger.info(f"Scheduler started: {n} instruments on {len(self.budgets)} venues")
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(5)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def refresh_prices(self):
+        """所有 instrument 的 CoinGecko 價格合併成一次請求"""
+        coin_ids = sorted({i['coingecko_id'] for i in self.instruments.values() if i.get('coingecko_id')})
+        if coin_ids:
+            self.monitor.collector.fetch_prices(coin_ids, max_age=self.price_refresh_interval)
+        self._last_price_refresh = time.monotonic()
+
+    def _loop(self):
+        while self._running:
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait(1.0)
+                    continue
+                when, _, key = self._heap[0]
+                now = time.monotonic()
+                if when > now:
+                    self._cond.wait(when - now)
+                    continue
+                heapq.heappop(self._heap)
+
+            if now - self._last_price_refresh >= self.price_refresh_interval:
+                self._last_price_refresh = now
+                self.pool.submit(self.refresh_prices)
+
+            delay = self.budgets[self.instruments[key]['venue']].admit(now)
+            if delay > 0:
+                self._schedule(key, now + delay + random.uniform(0, 0.1))
+                continue
+            self.pool.submit(self._run, key, now)
+
+    def _run(self, key: str, started: float):
+        """started 為排定的時間 (決定下一次的時間); 延遲從實際開始執行算起"""
+        instrument = self.instruments[key]
+        budget = self.budgets[instrument['venue']]
+        began = time.monotonic()
+        ok = False
+        try:
+            ok = self.monitor.run_cycle(instrument=instrument,
+                                        price_max_age=2 * self.price_refresh_interval) is not None
+        except Exception as e:
+            ok = False
+            self.logger.error(f"{key} cycle error: {e}")
+        finally:
+            finished = time.monotonic()
+            budget.release(finished - began, ok)
+            if self._running:
+                next_run = started + self.interval * budget.slowdown + self._jitter()
+                self._schedule(key, max(next_run, finished))
+
+    def status(self) -> Dict[str, Dict]:
+        with self._cond:
+            return {
+                venue: {
+                    'completed': b.completed,
+                    'deferred': b.deferred,
+                    'errors': b.errors,
+                    'requests': b.requests,
+                    'throttles': b.throttles,
+                    'in_flight': b.in_flight,
+                    'latency_ms': b.latency * 1000
+                }
+                for venue, b in self.budgets.items()
+            }
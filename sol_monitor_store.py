@@ -0,0 +1,552 @@
+"""SQLite storage for the SOL risk monitor.
+
+    from sol_monitor_store import MarketStore, MarketTiers
+    store = MarketStore("sol_risk.db", logger)        # one connection, background group commit
+    store.insert_market_data(ts, depth_data)          # into the UTC day's market_raw_YYYYMMDD partition
+    tiers = MarketTiers(store, logger, archive_dir="market_archive")
+    tiers.maintain()                                  # 1m / 1h rollups, retention, Parquet archive
+    entries = tiers.history(None, since, resolution=60)
+
+`market_data` / `instrument_data` are UNION ALL views over the daily partitions, so
+readers written against the old single tables (the replay harness, ad-hoc queries)
+keep working. Rollup entries store n / mean / M2 per metric and merge exactly, so a
+statistics window can be rebuilt from any mix of 1h, 1m and raw rows.
+"""
+import os
+import time
+import queue
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class MarketStore:
+    """每個 process 共用一條 SQLite 連線, 寫入經背景執行緒批次 group commit
+
+    enqueue() 不等待 fsync; 寫入執行緒收到第一筆後最多等 flush_interval 秒或湊滿
+    batch_size 筆就在同一個 transaction 內 commit, 因此任何一筆資料最晚在
+    flush_interval + 一次 commit 的時間內落地。
+    """
+    _FLUSH = object()
+    _CLOSE = object()
+    RAW_COLUMNS = ('instrument', 'timestamp', 'price', 'volume_24h', 'change_24h', 'bid_depth', 'ask_depth',
+                   'total_depth', 'spread_bps', 'source')
+    MAX_VIEW_PARTITIONS = 500   # SQLite 的 compound SELECT 上限
+
+    def __init__(self, path: str, logger, batch_size: int = 5000, flush_interval: float = 1.0,
+                 queue_max: int = 200000):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_max)
+        self.written = 0
+        self.failed = 0
+        self.partitions = {}        # UTC 日 (epoch 日數) -> 原始分區表名
+        self._partition_lock = threading.Lock()
+        self._insert_sql = {}
+        self._configure()
+        self._load_partitions()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="sqlite-writer")
+        self._writer.start()
+
+    def _configure(self):
+        with self._lock:
+            mode = self._conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            if mode.lower() != 'wal':
+                # 部分 FUSE 檔案系統不支援 WAL 需要的共享記憶體
+                self.logger.warning(f"WAL not available, journal_mode={mode}")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn.execute("PRAGMA cache_size=-32000")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+
+    # ---------- 同步操作 ----------
+    def executescript(self, script: str):
+        with self._lock:
+            self._conn.executescript(script)
+            self._conn.commit()
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def execute_batch(self, statements: List[tuple]) -> int:
+        """[(sql, [params, ...]), ...] 在同一個 transaction 內執行; 回傳變動的列數"""
+        with self._lock:
+            before = self._conn.total_changes
+            try:
+                for sql, rows in statements:
+                    self._conn.executemany(sql, rows)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return self._conn.total_changes - before
+
+    # ---------- 原始分區 ----------
+    @staticmethod
+    def partition_name(day: int) -> str:
+        return "market_raw_" + str(np.datetime64(day, 'D')).replace('-', '')
+
+    @staticmethod
+    def partition_day(name: str) -> int:
+        d = name[-8:]
+        return int(np.datetime64(f"{d[:4]}-{d[4:6]}-{d[6:]}", 'D').astype(np.int64))
+
+    def _load_partitions(self):
+        names = self.query("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'market_raw_[0-9]*'")
+        self.partitions = {self.partition_day(name): name for name, in names}
+
+    def create_partition(self, day: int, views: bool = True) -> str:
+        """建立 UTC 日的原始分區 (instrument '' 為預設的 SOL-USDT 多來源)"""
+        with self._partition_lock:
+            if day in self.partitions:
+                return self.partitions[day]
+            name = self.partition_name(day)
+            self.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                instrument TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                price REAL,
+                volume_24h REAL,
+                change_24h REAL,
+                bid_depth REAL,
+                ask_depth REAL,
+                total_depth REAL,
+                spread_bps REAL,
+                source TEXT,
+                PRIMARY KEY (instrument, timestamp)
+            ) WITHOUT ROWID;
+            """)
+            self.partitions[day] = name
+            if views:
+                self.create_views()
+            return name
+
+    def drop_partition(self, day: int):
+        with self._partition_lock:
+            name = self.partitions.pop(day, None)
+            if name is None:
+                return
+            self.create_views()
+            self.executescript(f"DROP TABLE IF EXISTS {name};")
+
+    def create_views(self):
+        """market_data / instrument_data 為最近分區的 UNION ALL view, 舊的讀取端 (回放、查詢) 不用改"""
+        tables = [self.partitions[day] for day in sorted(self.partitions)][-self.MAX_VIEW_PARTITIONS:]
+        values = ', '.join(self.RAW_COLUMNS[2:])
+        # 沒有分區時用一個空的 SELECT 保留欄位
+        sources = tables or ["(SELECT " + ', '.join(f"NULL AS {c}" for c in self.RAW_COLUMNS) + " WHERE 0)"]
+        market = " UNION ALL ".join(f"SELECT timestamp, {values} FROM {t} WHERE instrument = ''" for t in sources)
+        instrument = " UNION ALL ".join(f"SELECT timestamp, instrument, {values} FROM {t} WHERE instrument != ''"
+                                        for t in sources)
+        self.executescript(f"""
+        DROP VIEW IF EXISTS market_data;
+        DROP VIEW IF EXISTS instrument_data;
+        CREATE VIEW market_data AS {market};
+        CREATE VIEW instrument_data AS {instrument};
+        """)
+
+    def migrate_legacy(self):
+        """舊版的 market_data / instrument_data 資料表搬進日分區 (只在第一次啟動時發生)"""
+        for table, instrument in (('market_data', "''"), ('instrument_data', 'instrument')):
+            if not self.query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)):
+                continue
+            days = [day for day, in self.query(f"SELECT DISTINCT CAST(timestamp / 86400 AS INTEGER) FROM {table}")]
+            for day in days:
+                self.create_partition(day, views=False)
+            columns = ', '.join(self.RAW_COLUMNS[1:])
+            self.executescript("BEGIN;\n" + "".join(
+                f"INSERT OR REPLACE INTO {self.partitions[day]} SELECT {instrument}, {columns} FROM {table} "
+                f"WHERE timestamp >= {day * 86400} AND timestamp < {(day + 1) * 86400};\n" for day in days
+            ) + f"DROP TABLE {table};\nCOMMIT;")
+            self.logger.info(f"Migrated {table} into {len(days)} daily partitions")
+
+    # ---------- 背景寫入 ----------
+    def enqueue(self, sql: str, params: tuple):
+        self._queue.put((sql, params))
+
+    def insert_market_data(self, timestamp: int, depth_data: Dict, instrument: Optional[str] = None):
+        """寫入 timestamp 所在 UTC 日的原始分區 (第一次遇到新的一天時同步建表)"""
+        day = int(timestamp // 86400)
+        table = self.partitions.get(day) or self.create_partition(day)
+        sql = self._insert_sql.get(table)
+        if sql is None:
+            sql = self._insert_sql[table] = (f"INSERT OR REPLACE INTO {table} ({', '.join(self.RAW_COLUMNS)}) "
+                                             f"VALUES ({', '.join('?' * len(self.RAW_COLUMNS))})")
+        self.enqueue(sql, (
+            instrument or '',
+            timestamp,
+            depth_data['price'],
+            depth_data.get('volume_24h', 0),
+            depth_data.get('change_24h', 0),
+            depth_data['bid_depth'],
+            depth_data['ask_depth'],
+            depth_data['total_depth'],
+            depth_data['spread_bps'],
+            depth_data['source']
+        ))
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """等待目前佇列中的資料全部 commit"""
+        done = threading.Event()
+        self._queue.put((self._FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put((self._CLOSE, None))
+            self._writer.join(30)
+        with self._lock:
+            self._conn.close()
+
+    def _write_loop(self):
+        while True:
+            batch, waiters, closing = [], [], False
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                sql, params = item
+                if sql is self._FLUSH:
+                    waiters.append(params)
+                    break
+                if sql is self._CLOSE:
+                    closing = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._commit(batch)
+            for waiter in waiters:
+                waiter.set()
+            if closing:
+                return
+
+    def _commit(self, batch: List[tuple]):
+        """同一 transaction 內依序寫入, 連續相同 SQL 合併為 executemany"""
+        with self._lock:
+            try:
+                i = 0
+                while i < len(batch):
+                    sql = batch[i][0]
+                    j = i
+                    while j < len(batch) and batch[j][0] == sql:
+                        j += 1
+                    self._conn.executemany(sql, [params for _, params in batch[i:j]])
+                    i = j
+                self._conn.commit()
+                self.written += len(batch)
+            except Exception as e:
+                self._conn.rollback()
+                self.failed += len(batch)
+                self.logger.error(f"Batch write failed ({len(batch)} rows): {e}")
+
+class MarketTiers:
+    """市場資料的分層儲存: 原始日分區 -> 1m / 1h rollup -> Parquet 封存
+
+    maintain() 把收盤的 bucket 從原始分區彙總到 market_1m, 再由 1m 彙總到 market_1h; 每欄
+    (price / depth / spread) 記 min / max / mean / M2 / last, 價格另有 first, 以及相鄰樣本
+    對數報酬的 n / mean / M2, 因此任意層級的條目都能精確合併回窗口的均值與標準差。rollup
+    只寫到 watermark (收盤且過了 rollup_lag 的 bucket), 重跑結果相同。超過 raw_retention_days
+    且已 rollup 的原始分區壓縮成 Parquet (archive_dir) 後移除; rollup 依 rollup_retention 過期。
+
+    history() 依需要的解析度讀最便宜的層級 (1h -> 1m -> 原始), 尚未 rollup 的尾段由
+    較細的層級補上, 結果與解析度無關地都是 (bucket, n, 各欄統計) 條目。
+    """
+    TIERS = (('1h', 3600), ('1m', 60))
+    METRICS = (('price', 'price'), ('depth', 'total_depth'), ('spread', 'spread_bps'))
+    COLUMNS = (('instrument', 'bucket', 'last_ts', 'n', 'price_first')
+               + tuple(f"{m}_{s}" for m, _ in METRICS for s in ('min', 'max', 'mean', 'm2', 'last'))
+               + ('ret_n', 'ret_mean', 'ret_m2'))
+    CHUNK = 6 * 3600            # rollup 每次處理的時間範圍 (對齊 UTC, 不跨日分區)
+
+    def __init__(self, store: MarketStore, logger, archive_dir: Optional[str] = None,
+                 raw_retention_days: Optional[int] = 7, rollup_retention: Optional[Dict[str, Optional[float]]] = None,
+                 rollup_lag: float = 60):
+        self.store = store
+        self.logger = logger
+        self.archive_dir = archive_dir
+        self.raw_retention_days = raw_retention_days
+        self.rollup_retention = {'1m': 90 * 86400, '1h': None} if rollup_retention is None else rollup_retention
+        self.rollup_lag = rollup_lag
+        columns = ',\n'.join(f"    {c} {'TEXT NOT NULL' if c == 'instrument' else 'INTEGER' if c in ('bucket', 'n', 'ret_n') else 'REAL'}"
+                             for c in self.COLUMNS)
+        self.store.executescript("".join(f"""
+        CREATE TABLE IF NOT EXISTS market_{name} (
+        {columns},
+            PRIMARY KEY (instrument, bucket)
+        ) WITHOUT ROWID;
+        """ for name, _ in self.TIERS) + """
+        CREATE TABLE IF NOT EXISTS storage_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER
+        );
+        """)
+        self._insert = {name: f"INSERT OR REPLACE INTO market_{name} VALUES ({', '.join('?' * len(self.COLUMNS))})"
+                        for name, _ in self.TIERS}
+
+    def watermark(self, name: str) -> Optional[int]:
+        """該層級已完成的範圍: bucket < watermark 的資料不會再變"""
+        rows = self.store.query("SELECT value FROM storage_state WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    # ---------- 條目 ----------
+    @classmethod
+    def raw_entries(cls, raw: pd.DataFrame, prev: Dict[str, float]) -> pd.DataFrame:
+        """原始樣本 (依 instrument, timestamp 排序) -> 每筆一個 n = 1 的條目; prev 為各 instrument 前一筆價格"""
+        instrument = raw['instrument'].to_numpy(dtype=object)
+        ts = raw['timestamp'].to_numpy()
+        price = raw['price'].to_numpy(dtype=np.float64)
+        log_price = np.log(price)
+        first = np.r_[True, instrument[1:] != instrument[:-1]] if len(raw) else np.zeros(0, dtype=bool)
+        ret = np.empty(len(raw))
+        ret[1:] = np.diff(log_price)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret[first] = log_price[first] - np.log([prev.get(i, np.nan) for i in instrument[first]])
+        ok = np.isfinite(ret)
+        entries = {'instrument': instrument, 'bucket': ts, 'last_ts': ts, 'n': np.ones(len(raw), dtype=np.int64),
+                   'price_first': price}
+        for name, column in cls.METRICS:
+            values = raw[column].to_numpy(dtype=np.float64)
+            for stat in ('min', 'max', 'mean', 'last'):
+                entries[f"{name}_{stat}"] = values
+            entries[f"{name}_m2"] = np.zeros(len(raw))
+        entries.update(ret_n=ok.astype(np.int64), ret_mean=np.where(ok, ret, np.nan), ret_m2=np.zeros(len(raw)))
+        return pd.DataFrame(entries, columns=list(cls.COLUMNS))
+
+    @staticmethod
+    def _merge(n: np.ndarray, mean: np.ndarray, m2: np.ndarray, starts: np.ndarray, total: np.ndarray) -> tuple:
+        """各組條目的 (n, 均值, M2) 合併 (Chan et al. 平行公式)"""
+        live = n > 0
+        mean = np.where(live, mean, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            merged = np.add.reduceat(n * mean, starts) / total
+        spread = np.where(live, mean - np.repeat(merged, np.diff(np.r_[starts, n.size])), 0.0)
+        return merged, np.add.reduceat(np.where(live, np.nan_to_num(m2), 0.0) + n * spread ** 2, starts)
+
+    @classmethod
+    def combine(cls, entries: pd.DataFrame, seconds: int) -> pd.DataFrame:
+        """條目 (依 instrument, bucket 排序) 合併為 seconds 秒的 bucket"""
+        if not len(entries):
+            return entries
+        instrument = entries['instrument'].to_numpy(dtype=object)
+        bucket = (entries['bucket'].to_numpy() // seconds * seconds).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, (instrument[1:] != instrument[:-1]) | (bucket[1:] != bucket[:-1])])
+        ends = np.r_[starts[1:], len(entries)] - 1
+        col = lambda name: entries[name].to_numpy()
+        n = col('n').astype(np.int64)
+        total = np.add.reduceat(n, starts)
+        out = {'instrument': instrument[starts], 'bucket': bucket[starts],
+               'last_ts': np.maximum.reduceat(col('last_ts'), starts), 'n': total,
+               'price_first': col('price_first')[starts]}
+        for name, _ in cls.METRICS:
+            out[f"{name}_min"] = np.minimum.reduceat(col(f"{name}_min"), starts)
+            out[f"{name}_max"] = np.maximum.reduceat(col(f"{name}_max"), starts)
+            out[f"{name}_mean"], out[f"{name}_m2"] = cls._merge(n, col(f"{name}_mean"), col(f"{name}_m2"), starts, total)
+            out[f"{name}_last"] = col(f"{name}_last")[ends]
+        ret_n = col('ret_n').astype(np.int64)
+        out['ret_n'] = np.add.reduceat(ret_n, starts)
+        out['ret_mean'], out['ret_m2'] = cls._merge(ret_n, col('ret_mean'), col('ret_m2'), starts, out['ret_n'])
+        return pd.DataFrame(out, columns=list(cls.COLUMNS))
+
+    # ---------- 讀取 ----------
+    def _frame(self, rows: List[tuple]) -> pd.DataFrame:
+        frame = pd.DataFrame(rows, columns=list(self.COLUMNS))
+        numeric = list(self.COLUMNS[1:])
+        frame[numeric] = frame[numeric].astype(np.float64)
+        for column in ('bucket', 'n', 'ret_n'):
+            frame[column] = frame[column].astype(np.int64)
+        return frame
+
+    def _rollup_rows(self, name: str, lo: float, hi: float, instrument: Optional[str] = None,
+                     inclusive: bool = True) -> pd.DataFrame:
+        where = f"bucket {'>=' if inclusive else '>'} ? AND bucket < ?" + (" AND instrument = ?" if instrument is not None else "")
+        params = (lo, hi) + ((instrument,) if instrument is not None else ())
+        return self._frame(self.store.query(f"SELECT * FROM market_{name} WHERE {where} ORDER BY instrument, bucket",
+                                            params))
+
+    def archived_days(self) -> Dict[int, str]:
+        """{UTC 日: Parquet 檔}"""
+        root = os.path.join(self.archive_dir, 'market_raw') if self.archive_dir else None
+        if not root or not os.path.isdir(root):
+            return {}
+        days = {}
+        for name in os.listdir(root):
+            if name.startswith('date='):
+                days[int(np.datetime64(name[5:], 'D').astype(np.int64))] = os.path.join(root, name, 'part-0.parquet')
+        return days
+
+    def _raw_rows(self, lo: float, hi: float, instrument: Optional[str] = None, inclusive: bool = True) -> pd.DataFrame:
+        """[lo, hi) (inclusive=False 時為 (lo, hi)) 的原始樣本, 依 instrument, timestamp 排序; 已封存的日子讀 Parquet"""
+        columns = ['instrument', 'timestamp', 'price', 'total_depth', 'spread_bps']
+        archived = self.archived_days()
+        days = sorted(d for d in set(self.store.partitions) | set(archived) if lo // 86400 <= d and d * 86400 < hi)
+        where = f"timestamp {'>=' if inclusive else '>'} ? AND timestamp < ? AND price > 0 AND total_depth IS NOT NULL"
+        if instrument is not None:
+            where += " AND instrument = ?"
+        params = (lo, hi) + ((instrument,) if instrument is not None else ())
+        frames = []
+        for day in days:
+            table = self.store.partitions.get(day)
+            if table is not None:
+                rows = self.store.query(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", params)
+                frames.append(pd.DataFrame(rows, columns=columns))
+                continue
+            import pyarrow.parquet as pq
+            frame = pq.read_table(archived[day], columns=columns).to_pandas()
+            keep = ((frame['timestamp'] >= lo) if inclusive else (frame['timestamp'] > lo)) & (frame['timestamp'] < hi)
+            keep &= (frame['price'] > 0) & frame['total_depth'].notna()
+            if instrument is not None:
+                keep &= frame['instrument'] == instrument
+            frames.append(frame[keep])
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True).sort_values(['instrument', 'timestamp'], kind='stable')
+
+    def _last_prices(self, before: float, instrument: Optional[str] = None) -> Dict[str, float]:
+        """各 instrument 在 before 之前最後一個 1m bucket 的價格 (計算第一筆報酬用)"""
+        where, params = ("instrument = ? AND ", (instrument, before)) if instrument is not None else ("", (before,))
+        return dict(self.store.query(
+            f"SELECT instrument, price_last FROM market_1m WHERE (instrument, bucket) IN "
+            f"(SELECT instrument, MAX(bucket) FROM market_1m WHERE {where}bucket < ? GROUP BY instrument)", params))
+
+    def history(self, instrument: Optional[str], since: float, until: Optional[float] = None,
+                resolution: int = 0) -> pd.DataFrame:
+        """instrument 在 (since, until) 的條目, 依 bucket 排序
+
+        resolution (秒) 為可接受的最粗粒度: 依序取 1h / 1m 中不超過 resolution 的層級直到其
+        watermark, 之後由原始分區補上 (resolution > 0 時原始樣本先合併成 resolution 秒, 最多 60)。
+        窗口起點對齊到所選層級的 bucket (只取完全落在窗口內的 bucket)。
+        """
+        key = instrument or ''
+        until = 2 ** 62 if until is None else until
+        pieces, cursor, inclusive = [], since, False
+        for name, seconds in self.TIERS:
+            mark = self.watermark(name)
+            if seconds > resolution or not mark or mark <= cursor:
+                continue
+            rows = self._rollup_rows(name, cursor, min(mark, until), key, inclusive)
+            if len(rows):
+                pieces.append(rows)
+            cursor, inclusive = min(mark, until), True
+        if cursor < until:
+            raw = self._raw_rows(cursor, until, key, inclusive)
+            if len(raw):
+                prev = pieces[-1]['price_last'].iloc[-1] if pieces else self._last_prices(cursor, key).get(key)
+                entries = self.raw_entries(raw, {key: prev} if prev else {})
+                pieces.append(self.combine(entries, min(resolution, 60)) if resolution > 0 else entries)
+        if not pieces:
+            return self._frame([])
+        return pd.concat(pieces, ignore_index=True)
+
+    # ---------- 維護 ----------
+    def rollup(self, name: str, now: float) -> int:
+        """把 watermark 之後收盤的 bucket 寫入 market_{name}, 每個 CHUNK 與 watermark 同一個 transaction"""
+        seconds = dict(self.TIERS)[name]
+        if name == '1m':
+            end = int(now - self.rollup_lag) // seconds * seconds
+            start = self.watermark('1m')
+            if start is None and self.store.partitions:
+                first = self.store.query(f"SELECT MIN(timestamp) FROM {self.store.partitions[min(self.store.partitions)]}")[0][0]
+                start = None if first is None else int(first) // seconds * seconds
+            prev = self._last_prices(start) if start is not None else {}
+        else:
+            end = (self.watermark('1m') or 0) // seconds * seconds
+            start = self.watermark('1h')
+            if start is None:
+                first = self.store.query("SELECT MIN(bucket) FROM market_1m")[0][0]
+                start = None if first is None else first // seconds * seconds
+        if start is None:
+            return 0
+
+        written, lo = 0, start
+        while lo < end:
+            hi = min((lo // self.CHUNK + 1) * self.CHUNK, end)
+            if name == '1m':
+                raw = self._raw_rows(lo, hi)
+                entries = self.raw_entries(raw, prev)
+                if len(raw):
+                    last = raw.drop_duplicates('instrument', keep='last')
+                    prev.update(zip(last['instrument'], last['price']))
+            else:
+                entries = self._rollup_rows('1m', lo, hi)
+            rows = self.combine(entries, seconds)
+            self.store.execute_batch([
+                (self._insert[name], list(zip(*(rows[c].tolist() for c in self.COLUMNS)))),
+                ("INSERT OR REPLACE INTO storage_state VALUES (?, ?)", [(name, hi)]),
+            ])
+            written += len(rows)
+            lo = hi
+        return written
+
+    def compact(self, day: int) -> Optional[str]:
+        """原始分區 -> archive_dir/market_raw/date=YYYY-MM-DD/part-0.parquet (zstd, 依 instrument, timestamp 排序)"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = self.store.partitions[day]
+        columns = list(MarketStore.RAW_COLUMNS)
+        frame = pd.DataFrame(self.store.query(f"SELECT {', '.join(columns)} FROM {table} ORDER BY instrument, timestamp"),
+                             columns=columns)
+        directory = os.path.join(self.archive_dir, 'market_raw', f"date={np.datetime64(day, 'D')}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'part-0.parquet')
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        return path
+
+    def expire_raw(self, now: float) -> tuple:
+        """超過 raw_retention_days 且已完全 rollup 的原始分區: 封存 (有 archive_dir 時) 後移除"""
+        if self.raw_retention_days is None:
+            return [], 0
+        keep_from = int(now // 86400) - self.raw_retention_days
+        mark = self.watermark('1m') or 0
+        archived, dropped = [], 0
+        for day in sorted(self.store.partitions):
+            if day >= keep_from or (day + 1) * 86400 > mark:
+                continue
+            if self.archive_dir:
+                try:
+                    archived.append(self.compact(day))
+                except ImportError:
+                    self.logger.warning("pyarrow not installed, keeping raw partitions instead of archiving")
+                    break
+            self.store.drop_partition(day)
+            dropped += 1
+        return archived, dropped
+
+    def expire_rollups(self, now: float) -> int:
+        """依 rollup_retention 刪除舊的 rollup (1m 只刪已併入 1h 的部分)"""
+        deleted = 0
+        for name, _ in self.TIERS:
+            retention = self.rollup_retention.get(name)
+            if not retention:
+                continue
+            cutoff = now - retention
+            if name == '1m':
+                cutoff = min(cutoff, self.watermark('1h') or 0)
+            deleted += self.store.execute_batch([(f"DELETE FROM market_{name} WHERE bucket < ?", [(cutoff,)])])
+        return deleted
+
+    def maintain(self, now: Optional[float] = None) -> Dict:
+        """rollup (1m, 再 1h) -> 原始分區過期 / 封存 -> rollup 過期"""
+        now = time.time() if now is None else now
+        self.store.flush()
+        rolled = {name: self.rollup(name, now) for name in ('1m', '1h')}
+        archived, dropped = self.expire_raw(now)
+        return {'rollup_1m': rolled['1m'], 'rollup_1h': rolled['1h'], 'archived': len(archived),
+                'dropped_partitions': dropped, 'expired_rollups': self.expire_rollups(now)}
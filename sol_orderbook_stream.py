@@ -0,0 +1,501 @@
+"""Streaming L2 orderbook collector for the SOL risk monitor.
+
+Keeps one local orderbook per venue from the exchanges' diff/delta WebSocket
+feeds. Each book is synced from a REST snapshot, checked for sequence gaps on
+every update, and resynced from a new snapshot when a gap or disconnect
+happens. `StreamingCollector.get_orderbook()` returns the same
+{'source', 'data': {'bids', 'asks'}} shape as
+`DataCollector.fetch_orderbook_any_source`, so `calculate_market_depth` and
+`check_alerts` can run on the live book.
+
+Partial snapshots: the public REST snapshots of KuCoin (`level2_100`) and Gate
+(`limit=100`) only hold the top 100 levels per side, while the diff streams
+cover the whole book. Levels beyond the snapshot are unknown, so the local
+book is clipped to the snapshot's price range (bids >= lowest snapshot bid,
+asks <= highest snapshot ask) and updates outside it are dropped. When the
+price drifts and fewer than `resync_levels` levels are left on a side, the
+book is resynced from a fresh snapshot.
+
+Offline testing: record frames with `record_path=...`, then serve them back with
+`FrameReplayServer` and point the feeds at it (`url=` plus a `snapshot_fetcher`
+that reads the recorded snapshots, see `RecordedSnapshots`).
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+
+class SequenceGap(Exception):
+    """Raised when a delta does not continue the local book's sequence."""
+
+
+class LocalOrderBook:
+    """Price -> size map for each side, updated incrementally.
+
+    A partial snapshot (top N levels) sets `bid_floor` / `ask_ceiling`; the book
+    only keeps levels inside that range, since nothing is known beyond it.
+    """
+
+    def __init__(self, venue: str):
+        self.venue = venue
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+        self.bid_floor = 0.0
+        self.ask_ceiling = float('inf')
+        self.sequence: Optional[int] = None
+        self.synced = False
+        self.updated_at = 0.0
+        self.updates = 0
+
+    def load_snapshot(self, bids: List, asks: List, sequence: int, partial: bool = False):
+        self.bids = {float(p): float(s) for p, s, *_ in bids if float(s) > 0}
+        self.asks = {float(p): float(s) for p, s, *_ in asks if float(s) > 0}
+        # 部分快照: 範圍外的檔位未知, 之後的更新也只保留範圍內的
+        self.bid_floor = min(self.bids) if partial and self.bids else 0.0
+        self.ask_ceiling = max(self.asks) if partial and self.asks else float('inf')
+        self.sequence = int(sequence)
+        self.synced = True
+        self.updated_at = time.time()
+
+    @staticmethod
+    def _apply_side(side: Dict[float, float], levels: List, low: float, high: float):
+        for level in levels:
+            price, size = float(level[0]), float(level[1])
+            if price <= 0 or price < low or price > high:
+                continue
+            if size == 0:
+                side.pop(price, None)
+            else:
+                side[price] = size
+
+    def apply(self, bids: List, asks: List, sequence: int):
+        self._apply_side(self.bids, bids, self.bid_floor, float('inf'))
+        self._apply_side(self.asks, asks, 0.0, self.ask_ceiling)
+        self.sequence = int(sequence)
+        self.updated_at = time.time()
+        self.updates += 1
+
+    def levels(self) -> int:
+        """Levels on the thinner side (drops as the price drifts out of a partial snapshot's range)."""
+        return min(len(self.bids), len(self.asks))
+
+    def top(self, depth: int = 100) -> Dict:
+        bids = sorted(self.bids.items(), key=lambda x: -x[0])[:depth]
+        asks = sorted(self.asks.items())[:depth]
+        return {
+            'bids': [[p, s] for p, s in bids],
+            'asks': [[p, s] for p, s in asks],
+            'sequence': self.sequence
+        }
+
+
+class VenueFeed:
+    """Venue-specific WebSocket protocol: subscribe, parse, snapshot, sync rules."""
+
+    name = "venue"
+    ping_interval = 15.0
+    partial_snapshot = False    # REST snapshot holds only the top levels (see module docstring)
+    resync_levels = 0           # resync when a side of a partial book has fewer levels than this
+
+    def __init__(self, symbol: str, url: Optional[str] = None):
+        self.symbol = symbol
+        self.url = url
+
+    def resolve_url(self, session: requests.Session) -> Tuple[str, Optional[float]]:
+        return self.url, None
+
+    def subscribe_message(self) -> Dict:
+        raise NotImplementedError
+
+    def ping_message(self) -> Optional[Dict]:
+        return None
+
+    def parse(self, message: Dict) -> Optional[Tuple[int, int, List, List]]:
+        """Return (first_seq, last_seq, bids, asks) for a delta frame, else None."""
+        raise NotImplementedError
+
+    def fetch_snapshot(self, session: requests.Session) -> Dict:
+        """Return {'bids', 'asks', 'sequence'} from the REST API."""
+        raise NotImplementedError
+
+    def apply(self, book: LocalOrderBook, first_seq: int, last_seq: int, bids: List, asks: List) -> bool:
+        """Apply a delta; False if it is older than the book, SequenceGap if it skips ahead."""
+        if last_seq <= book.sequence:
+            return False
+        if first_seq > book.sequence + 1:
+            raise SequenceGap(f"{self.name}: expected {book.sequence + 1}, got {first_seq}")
+        book.apply(bids, asks, last_seq)
+        return True
+
+
+class KuCoinFeed(VenueFeed):
+    """KuCoin spot `/market/level2` diffs, synced against `level2_100`.
+
+    The full-depth snapshot (`/api/v3/market/orderbook/level2`) needs API keys,
+    so the book is the partial snapshot's price range, kept current by the diffs.
+    """
+
+    name = "KuCoin"
+    partial_snapshot = True
+    resync_levels = 50
+
+    def resolve_url(self, session):
+        if self.url:
+            return self.url, None
+        response = session.post("https://api.kucoin.com/api/v1/bullet-public", timeout=10)
+        data = response.json()['data']
+        server = data['instanceServers'][0]
+        url = f"{server['endpoint']}?token={data['token']}&connectId={int(time.time() * 1000)}"
+        return url, server.get('pingInterval', 18000) / 1000
+
+    def subscribe_message(self):
+        return {
+            'id': str(int(time.time() * 1000)),
+            'type': 'subscribe',
+            'topic': f'/market/level2:{self.symbol}',
+            'response': True
+        }
+
+    def ping_message(self):
+        return {'id': str(int(time.time() * 1000)), 'type': 'ping'}
+
+    def parse(self, message):
+        if message.get('type') != 'message' or message.get('subject') != 'trade.l2update':
+            return None
+        data = message['data']
+        changes = data.get('changes', {})
+        return (int(data['sequenceStart']), int(data['sequenceEnd']),
+                changes.get('bids', []), changes.get('asks', []))
+
+    def fetch_snapshot(self, session):
+        response = session.get('https://api.kucoin.com/api/v1/market/orderbook/level2_100',
+                               params={'symbol': self.symbol}, timeout=10)
+        data = response.json()['data']
+        return {'bids': data['bids'], 'asks': data['asks'], 'sequence': int(data['sequence'])}
+
+    def apply(self, book, first_seq, last_seq, bids, asks):
+        # 每筆 change 自帶序號, 快照之前的 change 需逐筆略過
+        if last_seq <= book.sequence:
+            return False
+        if first_seq > book.sequence + 1:
+            raise SequenceGap(f"{self.name}: expected {book.sequence + 1}, got {first_seq}")
+        book.apply([c for c in bids if int(c[2]) > book.sequence],
+                   [c for c in asks if int(c[2]) > book.sequence],
+                   last_seq)
+        return True
+
+
+class GateFeed(VenueFeed):
+    """Gate.io spot `spot.order_book_update` diffs, synced against `order_book?with_id=true`."""
+
+    name = "Gate.io"
+    partial_snapshot = True
+    resync_levels = 50
+
+    def resolve_url(self, session):
+        return self.url or "wss://api.gateio.ws/ws/v4/", None
+
+    def subscribe_message(self):
+        return {
+            'time': int(time.time()),
+            'channel': 'spot.order_book_update',
+            'event': 'subscribe',
+            'payload': [self.symbol, '100ms']
+        }
+
+    def ping_message(self):
+        return {'time': int(time.time()), 'channel': 'spot.ping'}
+
+    def parse(self, message):
+        if message.get('channel') != 'spot.order_book_update' or message.get('event') != 'update':
+            return None
+        result = message['result']
+        return int(result['U']), int(result['u']), result.get('b', []), result.get('a', [])
+
+    def fetch_snapshot(self, session):
+        response = session.get('https://api.gateio.ws/api/v4/spot/order_book',
+                               params={'currency_pair': self.symbol, 'limit': 100, 'with_id': 'true'},
+                               timeout=10)
+        data = response.json()
+        return {'bids': data['bids'], 'asks': data['asks'], 'sequence': int(data['id'])}
+
+
+class StreamingCollector:
+    """Runs every venue feed on one asyncio loop in a background thread."""
+
+    def __init__(self, logger: logging.Logger, feeds: List[VenueFeed],
+                 snapshot_fetcher: Optional[Callable[[VenueFeed], Dict]] = None,
+                 record_path: Optional[str] = None, stale_after: float = 10.0):
+        try:
+            import websockets  # noqa: F401
+        except ImportError:
+            raise ImportError("Streaming mode requires `pip install websockets`")
+        self.logger = logger
+        self.feeds = feeds
+        self.books = {feed.name: LocalOrderBook(feed.name) for feed in feeds}
+        self.stats = {feed.name: {'frames': 0, 'applied': 0, 'gaps': 0, 'resyncs': 0, 'reconnects': 0}
+                      for feed in feeds}
+        self.snapshot_fetcher = snapshot_fetcher
+        self.record_path = record_path
+        self.stale_after = stale_after
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._stopping = False
+
+    # ---------- 生命週期 ----------
+    def start(self):
+        self._stopping = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name="orderbook-stream")
+        self._thread.start()
+        self.logger.info(f"Streaming collector started: {', '.join(self.books)}")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        tasks = [self._loop.create_task(self._run_feed(feed)) for feed in self.feeds]
+        try:
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            self._loop.close()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            for task in asyncio.all_tasks(self._loop):
+                self._loop.call_soon_threadsafe(task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.logger.info("Streaming collector stopped")
+
+    def wait_until_synced(self, timeout: float = 30.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if any(book.synced for book in self.books.values()):
+                return True
+            time.sleep(0.05)
+        return False
+
+    # ---------- 讀取 ----------
+    def get_orderbook(self, venue: Optional[str] = None, depth: int = 100) -> Optional[Dict]:
+        """最新本地訂單簿 (依 feeds 順序選第一個已同步且未過期的 venue)"""
+        names = [venue] if venue else list(self.books)
+        now = time.time()
+        with self._lock:
+            for name in names:
+                book = self.books[name]
+                if book.synced and now - book.updated_at <= self.stale_after:
+                    return {'source': f"{name} (stream)", 'data': book.top(depth)}
+        return None
+
+    # ---------- feed 處理 ----------
+    def _record(self, venue: str, kind: str, payload):
+        if not self.record_path:
+            return
+        with self._record_lock, open(self.record_path, 'a') as f:
+            f.write(json.dumps({'venue': venue, 'ts': time.time(), kind: payload}) + "\n")
+
+    def _fetch_snapshot(self, feed: VenueFeed) -> Dict:
+        if self.snapshot_fetcher is not None:
+            snapshot = self.snapshot_fetcher(feed)
+        else:
+            snapshot = feed.fetch_snapshot(self.session)
+        self._record(feed.name, 'snapshot', snapshot)
+        return snapshot
+
+    async def _run_feed(self, feed: VenueFeed):
+        import websockets
+
+        backoff = 1.0
+        while not self._stopping:
+            try:
+                url, ping_interval = await self._loop.run_in_executor(None, feed.resolve_url, self.session)
+                async with websockets.connect(url, max_size=2 ** 22) as ws:
+                    await ws.send(json.dumps(feed.subscribe_message()))
+                    backoff = 1.0
+                    pinger = self._loop.create_task(self._ping(ws, feed, ping_interval or feed.ping_interval))
+                    try:
+                        await self._consume(ws, feed)
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if self._stopping:
+                    break
+                self.logger.warning(f"{feed.name} stream error: {e}, reconnecting in {backoff:.0f}s")
+            with self._lock:
+                self.books[feed.name].synced = False
+            self.stats[feed.name]['reconnects'] += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    async def _ping(self, ws, feed: VenueFeed, interval: float):
+        message = feed.ping_message()
+        if message is None:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            await ws.send(json.dumps(feed.ping_message()))
+
+    async def _consume(self, ws, feed: VenueFeed):
+        """快照期間先緩存 delta, 同步後逐筆套用; 發現序號缺口即重新同步"""
+        book = self.books[feed.name]
+        stats = self.stats[feed.name]
+        buffer = []
+        snapshot_task = self._loop.run_in_executor(None, self._fetch_snapshot, feed)
+        receiver = None
+
+        try:
+            while True:
+                if receiver is None:
+                    receiver = asyncio.ensure_future(ws.recv())
+                waiting = {receiver} if snapshot_task is None else {receiver, snapshot_task}
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                pending = []
+                if snapshot_task is not None and snapshot_task in done:
+                    snapshot = snapshot_task.result()
+                    snapshot_task = None
+                    with self._lock:
+                        book.load_snapshot(snapshot['bids'], snapshot['asks'], snapshot['sequence'],
+                                           partial=feed.partial_snapshot)
+                    pending, buffer = buffer, []
+
+                if receiver in done:
+                    message = json.loads(receiver.result())
+                    receiver = None
+                    self._record(feed.name, 'frame', message)
+                    delta = feed.parse(message)
+                    if delta is not None:
+                        stats['frames'] += 1
+                        if snapshot_task is None:
+                            pending.append(delta)
+                        else:
+                            buffer.append(delta)
+
+                if pending and not self._apply_deltas(feed, book, pending):
+                    buffer = []
+                    snapshot_task = self._loop.run_in_executor(None, self._fetch_snapshot, feed)
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+
+    def _apply_deltas(self, feed: VenueFeed, book: LocalOrderBook, deltas: List) -> bool:
+        stats = self.stats[feed.name]
+        try:
+            with self._lock:
+                for first_seq, last_seq, bids, asks in deltas:
+                    if feed.apply(book, first_seq, last_seq, bids, asks):
+                        stats['applied'] += 1
+                thin = feed.partial_snapshot and book.levels() < feed.resync_levels
+                if thin:
+                    book.synced = False
+            if thin:
+                stats['resyncs'] += 1
+                self.logger.info(f"{feed.name} book left the snapshot range ({book.levels()} levels), resyncing")
+                return False
+            return True
+        except SequenceGap as e:
+            stats['gaps'] += 1
+            stats['resyncs'] += 1
+            self.logger.warning(f"Sequence gap, resyncing: {e}")
+            with self._lock:
+                book.synced = False
+            return False
+
+
+class RecordedSnapshots:
+    """Snapshot fetcher that replays the REST snapshots captured with `record_path`."""
+
+    def __init__(self, frames_path: str):
+        self.snapshots: Dict[str, List[Dict]] = {}
+        with open(frames_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'snapshot' in record:
+                    self.snapshots.setdefault(record['venue'], []).append(record['snapshot'])
+        self._served: Dict[str, int] = {}
+
+    def __call__(self, feed: VenueFeed) -> Dict:
+        snapshots = self.snapshots[feed.name]
+        i = self._served.get(feed.name, 0)
+        self._served[feed.name] = i + 1
+        return snapshots[min(i, len(snapshots) - 1)]
+
+
+class FrameReplayServer:
+    """Local WebSocket stand-in that replays recorded frames.
+
+    Clients connect to ws://host:port/<venue> and receive that venue's frames in
+    recorded order (`speed` scales the recorded inter-frame gaps, 0 = as fast as
+    possible). Subscribe/ping messages from the client are ignored.
+    """
+
+    def __init__(self, frames_path: str, host: str = "127.0.0.1", port: int = 0, speed: float = 0.0):
+        self.frames: Dict[str, List[Tuple[float, Dict]]] = {}
+        with open(frames_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'frame' in record:
+                    self.frames.setdefault(record['venue'], []).append((record['ts'], record['frame']))
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def url(self, venue: str) -> str:
+        return f"ws://{self.host}:{self.port}/{venue}"
+
+    async def _handler(self, websocket, path=None):
+        if path is None:
+            path = websocket.request.path if hasattr(websocket, 'request') else websocket.path
+        venue = requests.utils.unquote(path.strip('/'))
+        previous = None
+        for ts, frame in self.frames.get(venue, []):
+            if self.speed and previous is not None:
+                await asyncio.sleep(max(0.0, (ts - previous) / self.speed))
+            previous = ts
+            await websocket.send(json.dumps(frame))
+        await websocket.wait_closed()
+
+    def start(self):
+        import websockets
+
+        async def serve():
+            return await websockets.serve(self._handler, self.host, self.port)
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(serve())
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True, name="frame-replay")
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(5)
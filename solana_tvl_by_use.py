@@ -1,17 +1,37 @@
-import requests, time, pandas as pd
-from datetime import datetime, date, timezone
-from google.colab import drive
+import os, time, shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-drive.mount('/content/drive')
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
 
-OUTPUT_PATH = "/content/drive/MyDrive/crypto_analysis/solana_defillama_protocol_tvl.csv"
-REQUEST_PAUSE_S = 0.25
+from pull_defillama_chain_tvl import API, make_client
+
+BASE_DIR = os.environ.get("SOLANA_TVL_DIR", "/content/drive/MyDrive/crypto_analysis")
+OUTPUT_PATH = f"{BASE_DIR}/solana_defillama_protocol_tvl.csv"
+DATASET_PATH = f"{BASE_DIR}/solana_defillama_protocol_tvl"          # 依 category 分區的 Parquet dataset
+CATEGORY_PATH = f"{BASE_DIR}/solana_defillama_category_tvl.parquet"
+WRITE_CSV = True
+MAX_WORKERS = 8
+RATE = 8.0            # 每秒請求數
+BURST = 8
+FLUSH_ROWS = 200_000  # 累積多少列寫出一批 Parquet
 START_DAY = None
 
-def fetch_json(url, retries=3, timeout=60):
+SCHEMA = pa.schema([
+    ("day", pa.date32()),
+    ("protocol", pa.string()),
+    ("category", pa.string()),
+    ("tvl_usd", pa.float64()),
+])
+
+def fetch_json(session, url, retries=3, timeout=60):
     for i in range(retries):
         try:
-            r = requests.get(url, timeout=timeout)
+            r = session.get(url, timeout=timeout)
             r.raise_for_status()
             return r.json()
         except Exception:
@@ -19,51 +39,124 @@ def fetch_json(url, retries=3, timeout=60):
             time.sleep(1.0 + i)
     return None
 
-def to_day(ts):
-    return datetime.fromtimestamp(int(ts), tz=timezone.utc).date()
+def to_days(ts):
+    """unix 秒 -> date32 (UTC), 整欄一次轉換"""
+    return (np.asarray(ts, dtype=np.int64) // 86400).astype("datetime64[D]")
+
+def protocol_table(data, name, category):
+    """單一協議的 Solana TVL 序列 -> Arrow table (SCHEMA); 無資料時回傳 None"""
+    series = (data or {}).get("chainTvls", {}).get("Solana", {}).get("tvl", None)
+    if not series or pd.isna(category):
+        return None
+    dates = np.fromiter((p.get("date", -1) for p in series), dtype=np.int64, count=len(series))
+    tvl = np.fromiter((np.nan if p.get("totalLiquidityUSD") is None else p["totalLiquidityUSD"] for p in series),
+                      dtype=np.float64, count=len(series))
+    keep = (dates >= 0) & ~np.isnan(tvl) & (tvl >= 0)
+    days = to_days(dates[keep])
+    tvl = tvl[keep]
+    if START_DAY:
+        since = days >= np.datetime64(str(START_DAY), "D")
+        days, tvl = days[since], tvl[since]
+    if not len(days):
+        return None
+    n = len(days)
+    return pa.table({
+        "day": pa.array(days, type=pa.date32()),
+        "protocol": pa.array([name] * n, type=pa.string()),
+        "category": pa.array([category] * n, type=pa.string()),
+        "tvl_usd": pa.array(tvl, type=pa.float64()),
+    }, schema=SCHEMA)
+
+def solana_protocols(session):
+    prot_df = pd.DataFrame(fetch_json(session, f"{API}/protocols"))
+    is_solana = prot_df["chains"].apply(lambda xs: isinstance(xs, list) and ("Solana" in xs))
+    prot_sol = prot_df[is_solana]
+    slugs = prot_sol["slug"].where(prot_sol["slug"].notna(), prot_sol["name"]) if "slug" in prot_sol else prot_sol["name"]
+    categories = prot_sol["category"] if "category" in prot_sol else "Unknown"
+    return pd.DataFrame({"slug": slugs, "name": prot_sol["name"], "category": categories}).to_dict("records")
+
+def ingest(dataset_path=DATASET_PATH, workers=MAX_WORKERS, rate=RATE, burst=BURST):
+    """平行抓取所有 Solana 協議, 每累積 FLUSH_ROWS 列就追加一批到分區 Parquet
+
+    先寫到暫存目錄, 全部完成後才替換舊 dataset, 讀取端不會看到寫一半的資料。
+    """
+    session = make_client(workers, rate, burst)
+    protocols = solana_protocols(session)
+    print(f"Solana protocols: {len(protocols)}")
+
+    tmp_path = f"{dataset_path}.tmp-{int(time.time())}"
+    buffer, buffered, batch, failed = [], 0, 0, 0
 
-protocols = fetch_json("https://api.llama.fi/protocols")
-prot_df = pd.DataFrame(protocols)
+    def flush():
+        nonlocal buffer, buffered, batch
+        if not buffer:
+            return
+        pq.write_to_dataset(pa.concat_tables(buffer), tmp_path, partition_cols=["category"],
+                            basename_template=f"part-{batch:05d}-{{i}}.parquet")
+        buffer, buffered, batch = [], 0, batch + 1
 
-is_solana = prot_df["chains"].apply(lambda xs: isinstance(xs, list) and ("Solana" in xs))
-prot_sol = prot_df[is_solana].copy()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_json, session, f"{API}/protocol/{p['slug']}"): p for p in protocols}
+        for fut in as_completed(futures):
+            p = futures[fut]
+            try:
+                table = protocol_table(fut.result(), p["name"], p["category"])
+            except Exception:
+                failed += 1
+                continue
+            if table is None:
+                continue
+            buffer.append(table)
+            buffered += table.num_rows
+            if buffered >= FLUSH_ROWS:
+                flush()
+    flush()
+    if failed:
+        print(f"[WARN] {failed} protocols failed")
 
-rows = []
-for _, row in prot_sol.iterrows():
-    slug = row["slug"] if pd.notna(row.get("slug")) else row["name"]
-    category = row.get("category", "Unknown")
+    if not os.path.exists(tmp_path):
+        os.makedirs(tmp_path)
+    if os.path.exists(dataset_path):
+        shutil.rmtree(dataset_path)
+    os.replace(tmp_path, dataset_path)
+    return dataset_path
+
+def open_dataset(dataset_path=DATASET_PATH):
+    return ds.dataset(dataset_path, format="parquet", schema=SCHEMA, partitioning="hive")
+
+def category_history(dataset_path=DATASET_PATH):
+    """cat_hist: 直接在 Arrow 上依 (day, category) 加總, 只讀需要的欄位"""
+    table = open_dataset(dataset_path).to_table(columns=["day", "category", "tvl_usd"])
+    cat = table.group_by(["day", "category"]).aggregate([("tvl_usd", "sum")])
+    cat = cat.rename_columns(["day", "category", "tvl_usd"])
+    cat = cat.append_column("protocol", pa.array(["ALL_PROTOCOLS"] * cat.num_rows, type=pa.string()))
+    cat = cat.select(["day", "protocol", "category", "tvl_usd"])
+    return cat.sort_by([("day", "ascending"), ("category", "ascending")])
+
+def export_csv(cat_hist, dataset_path=DATASET_PATH, output_path=OUTPUT_PATH):
+    """與舊版相同格式的 CSV (協議明細 + ALL_PROTOCOLS 類別加總), 逐批串流寫出"""
+    with pacsv.CSVWriter(output_path, SCHEMA) as writer:
+        for record_batch in open_dataset(dataset_path).to_batches(columns=SCHEMA.names):
+            writer.write_batch(record_batch)
+        writer.write_table(cat_hist.cast(SCHEMA))
+
+def mount_drive():
     try:
-        data = fetch_json(f"https://api.llama.fi/protocol/{slug}")
-        series = (data or {}).get("chainTvls", {}).get("Solana", {}).get("tvl", None)
-        if not series:
-            time.sleep(REQUEST_PAUSE_S); continue
-        df = pd.DataFrame(series)
-        if df.empty:
-            time.sleep(REQUEST_PAUSE_S); continue
-        df["day"] = df["date"].apply(to_day)
-        if START_DAY:
-            df = df[df["day"] >= START_DAY]
-        df["protocol"] = row["name"]
-        df["category"] = category
-        df.rename(columns={"totalLiquidityUSD":"tvl_usd"}, inplace=True)
-        rows.append(df[["day","protocol","category","tvl_usd"]])
-    except Exception:
-        pass
-    finally:
-        time.sleep(REQUEST_PAUSE_S)
-
-prot_hist = (pd.concat(rows, ignore_index=True)
-             if rows else pd.DataFrame(columns=["day","protocol","category","tvl_usd"]))
-
-prot_hist = prot_hist.dropna(subset=["day","protocol","category","tvl_usd"])
-prot_hist = prot_hist[prot_hist["tvl_usd"] >= 0].copy()
-
-cat_hist = prot_hist.groupby(["day","category"], as_index=False)["tvl_usd"].sum()
-cat_hist["protocol"] = "ALL_PROTOCOLS"
-full_hist = pd.concat([prot_hist, cat_hist], ignore_index=True)
-
-full_hist.to_csv(OUTPUT_PATH, index=False)
-
-print(f"已存檔到: {OUTPUT_PATH}")
-print("Preview:")
-print(full_hist.head(10))
+        from google.colab import drive
+    except ImportError:
+        return
+    if not os.path.ismount("/content/drive"):
+        drive.mount('/content/drive')
+
+if __name__ == "__main__":
+    mount_drive()
+    os.makedirs(BASE_DIR, exist_ok=True)
+    ingest()
+    cat_hist = category_history()
+    pq.write_table(cat_hist, CATEGORY_PATH)
+    if WRITE_CSV:
+        export_csv(cat_hist)
+
+    print(f"已存檔到: {DATASET_PATH}")
+    print("Preview:")
+    print(cat_hist.slice(0, 10).to_pandas())
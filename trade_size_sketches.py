@@ -0,0 +1,357 @@
+"""Mergeable trade-size quantile sketches (KLL) for the whale activity dashboard.
+
+    python trade_size_sketches.py --ingest                    # new dex_solana.trades from the dune_local store
+    python trade_size_sketches.py --ingest trades.parquet     # or any export with the same columns
+    python trade_size_sketches.py --report week               # p50/p90/p95/p99 per week and project
+    python trade_size_sketches.py --report all --all-projects
+    python trade_size_sketches.py --verify                    # error / size / speed on synthetic trades
+
+Same population as "Solana Whale Activity - Volume USD.sql": SOL <-> USDC/USDT trades on
+dex_solana.trades, projects normalised with the same CASE. One KLL sketch per (day, project) is
+kept in SQLite (sketches.db); new trades are added to the existing sketches, and week / month /
+all-time / all-protocol views are produced by merging day sketches, never by rescanning trades.
+Merging cannot be undone, so a block_time watermark (shared by the store and export paths) is
+advanced with every ingest and trades at or before it are skipped: re-running the same export or
+loading overlapping exports does not count a trade twice. Exports must therefore be loaded in
+time order; rebuild sketches.db to load older history.
+
+Error: a KLL sketch with parameter k answers any quantile with normalized rank error of about
+1.7 / k with 99% confidence (k = 200 -> the returned value's rank is within ~0.9% of q * n). The
+error bound holds for merged sketches too. Memory and the serialized size are O(k log(n / k))
+values (a few KB per sketch, values stored as float32); sketches of up to ~k trades are exact.
+"""
+import os
+import math
+import time
+import struct
+import sqlite3
+import argparse
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+DB_PATH = os.environ.get("TRADE_SKETCH_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sketches.db"))
+K = 200
+QUANTILES = (0.50, 0.90, 0.95, 0.99)
+WSOL = 'so11111111111111111111111111111111111111112'
+STABLES = ('epjfwdd5aufqssqem2qn1xzybapc8g4weggkzwytdt1v',   # USDC
+           'es9vmfrzacermjfrf4h2fyd4kconky11mcce8benwnyb')   # USDT
+PROJECT_ALIASES = {'raydium_launchlab': 'raydium', 'whirlpool': 'orca'}
+
+
+class KLLSketch:
+    """KLL 分位數 sketch: 第 h 層的值權重為 2^h, 層滿時排序後隨機保留奇數或偶數位置升到上一層"""
+    __slots__ = ('k', 'n', 'min', 'max', 'levels', 'rng')
+
+    VERSION = 1
+    HEADER = struct.Struct('<BHQddB')
+
+    def __init__(self, k: int = K, seed: int = None):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self.capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        """把最低一個超過容量的層對半壓縮到上一層, 直到總數不超過容量"""
+        while self._size() > self._max_size():
+            for h, items in enumerate(self.levels):
+                if len(items) >= self.capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            keep_last = len(items) % 2
+            carry, rest = (items[:-1], items[-1:]) if keep_last else (items, items[:0])
+            promoted = carry[self.rng.integers(2)::2]
+            self.levels[h] = rest
+            self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return self
+        self.n += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """就地合併另一個 sketch (k 取較小者, 誤差以較小的 k 為準)"""
+        if not other.n:
+            return self
+        self.k = min(self.k, other.k)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], items))
+        self.n += other.n
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantiles(self, qs=QUANTILES) -> np.ndarray:
+        """每個 q 回傳累積權重 >= q * n 的最小值 (n 小於容量時即為精確的 nearest-rank 分位數)"""
+        if not self.n:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** h, dtype=np.int64) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(qs) * cum[-1], side='left')
+        out = values[np.minimum(idx, len(values) - 1)]
+        out[np.asarray(qs) <= 0] = self.min
+        out[np.asarray(qs) >= 1] = self.max
+        return out
+
+    def to_bytes(self) -> bytes:
+        sizes = np.array([len(items) for items in self.levels], dtype=np.uint32)
+        body = np.concatenate(self.levels).astype(np.float32) if self.n else np.empty(0, np.float32)
+        return self.HEADER.pack(self.VERSION, self.k, self.n, self.min, self.max, len(sizes)) + \
+            sizes.tobytes() + body.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, seed: int = None) -> 'KLLSketch':
+        version, k, n, lo, hi, depth = cls.HEADER.unpack_from(data)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported sketch version: {version}")
+        sketch = cls(k, seed)
+        sketch.n, sketch.min, sketch.max = n, lo, hi
+        offset = cls.HEADER.size
+        sizes = np.frombuffer(data, dtype=np.uint32, count=depth, offset=offset)
+        values = np.frombuffer(data, dtype=np.float32, offset=offset + 4 * depth).astype(np.float64)
+        sketch.levels = np.split(values, np.cumsum(sizes)[:-1]) if depth else [np.empty(0)]
+        return sketch
+
+
+# ==================== 儲存 / 增量寫入 ====================
+def open_db(path: str = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS sketches (
+        day TEXT, project TEXT, n INTEGER, sketch BLOB,
+        PRIMARY KEY (day, project)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS state (
+        key TEXT PRIMARY KEY, value TEXT
+    );
+    """)
+    return conn
+
+
+def normalize_trades(trades: pd.DataFrame) -> pd.DataFrame:
+    """SQL 的 filtered CTE: SOL <-> USDC/USDT, project 正規化 -> (day, project, trade_usd)"""
+    bought = trades['token_bought_mint_address'].fillna('').str.lower()
+    sold = trades['token_sold_mint_address'].fillna('').str.lower()
+    mask = ((bought == WSOL) & sold.isin(STABLES)) | ((sold == WSOL) & bought.isin(STABLES))
+    df = trades.loc[mask, ['block_time', 'project', 'amount_usd']]
+    project = df['project'].str.lower()
+    return pd.DataFrame({
+        'day': pd.to_datetime(df['block_time']).dt.strftime('%Y-%m-%d'),
+        'project': project.replace(PROJECT_ALIASES),
+        'trade_usd': df['amount_usd'].astype(np.float64),
+    })
+
+
+def watermark(conn: sqlite3.Connection) -> Optional[datetime]:
+    """已加入 sketch 的最後一個 block_time (UTC, naive)"""
+    row = conn.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+def ingest(conn: sqlite3.Connection, trades: pd.DataFrame, k: int = K, until: datetime = None) -> int:
+    """把 watermark 之後的交易加入對應 (day, project) 的 sketch; 回傳加入的交易數
+
+    block_time 不晚於 watermark 的列視為已加入而略過; sketch 與新的 watermark (本批最大的
+    block_time, 或 until) 在同一個 transaction 寫入。
+    """
+    block_time = pd.to_datetime(trades['block_time'], utc=True).dt.tz_localize(None)
+    mark = watermark(conn)
+    if mark is not None:
+        seen = block_time <= pd.Timestamp(mark)
+        if seen.any():
+            print(f"Skipping {int(seen.sum()):,} trades at or before the watermark {mark.isoformat()}")
+            trades, block_time = trades[~seen], block_time[~seen]
+    bounds = [pd.Timestamp(d) for d in (mark, until, block_time.max()) if d is not None and pd.notna(d)]
+    # 水位线存到微秒，向上取整以免同一微秒内的成交被重复计入
+    upper = max(bounds).ceil('us') if bounds else None
+    df = normalize_trades(trades).dropna(subset=['trade_usd'])
+    rows = []
+    for (day, project), group in df.groupby(['day', 'project'], sort=False):
+        found = conn.execute("SELECT sketch FROM sketches WHERE day = ? AND project = ?", (day, project)).fetchone()
+        sketch = KLLSketch.from_bytes(found[0]) if found else KLLSketch(k)
+        sketch.update(group['trade_usd'].to_numpy())
+        rows.append((day, project, sketch.n, sketch.to_bytes()))
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?)", rows)
+        if upper is not None:
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('watermark', ?)",
+                         (upper.to_pydatetime().isoformat(),))
+    return len(df)
+
+
+def ingest_store(conn: sqlite3.Connection, con, batch_days: int = 7) -> int:
+    """dune_local 的 dex_solana.trades 中, 上次 watermark 之後的交易 (依 block_time 分批)"""
+    lower = watermark(conn) or datetime(1970, 1, 1)
+    last = con.execute("SELECT MAX(block_time) FROM dex_solana.trades").fetchone()[0]
+    if last is None or last <= lower:
+        return 0
+    total = 0
+    while lower < last:
+        upper = min(last, max(lower, con.execute(
+            "SELECT MIN(block_time) FROM dex_solana.trades WHERE block_time > ?", [lower]).fetchone()[0])
+            + timedelta(days=batch_days))
+        trades = con.execute("""
+            SELECT block_time, project, amount_usd, token_bought_mint_address, token_sold_mint_address
+            FROM dex_solana.trades WHERE block_time > ? AND block_time <= ?
+        """, [lower, upper]).df()
+        total += ingest(conn, trades, until=upper)
+        lower = upper
+    return total
+
+
+# ==================== 查詢 ====================
+def _period(day: pd.Series, by: str) -> pd.Series:
+    day = pd.to_datetime(day)
+    if by == 'day':
+        return day
+    if by == 'week':
+        return day - pd.to_timedelta(day.dt.weekday, unit='D')
+    if by == 'month':
+        return day.dt.to_period('M').dt.start_time
+    if by == 'all':
+        return pd.Series(pd.NaT, index=day.index)
+    raise ValueError(f"Unknown period: {by}")
+
+
+def percentiles(conn: sqlite3.Connection, by: str = 'day', since: str = None, until: str = None,
+                all_projects: bool = False, qs=QUANTILES) -> pd.DataFrame:
+    """合併 day sketch 得到 (period, project, metric, usd), 與 SQL 輸出相同的長表與排序"""
+    where, params = [], []
+    if since:
+        where.append("day >= ?")
+        params.append(since)
+    if until:
+        where.append("day < ?")
+        params.append(until)
+    index = pd.read_sql_query("SELECT day, project, sketch FROM sketches" +
+                              (f" WHERE {' AND '.join(where)}" if where else ""), conn, params=params)
+    columns = ['day', 'project', 'metric', 'usd']
+    if index.empty:
+        return pd.DataFrame(columns=columns)
+    index['period'] = _period(index['day'], by)
+    if all_projects:
+        index['project'] = 'all'
+    out = []
+    for (period, project), group in index.groupby(['period', 'project'], sort=True, dropna=False):
+        merged = KLLSketch(K)
+        for blob in group['sketch']:
+            merged.merge(KLLSketch.from_bytes(blob))
+        values = merged.quantiles(qs)
+        for q, v in zip(qs, values):
+            out.append((period, project, f"p{round(q * 100):d}", float(v)))
+    return pd.DataFrame(out, columns=columns)
+
+
+# ==================== 驗證 ====================
+def _rank_error(values: np.ndarray, estimate: float, q: float) -> float:
+    """估計值在真實資料中的 normalized rank 與 q 的距離 (值相同的區間內取最接近者)"""
+    lo = np.searchsorted(values, estimate, side='left') / len(values)
+    hi = np.searchsorted(values, estimate, side='right') / len(values)
+    return 0.0 if lo <= q <= hi else min(abs(lo - q), abs(hi - q))
+
+
+def verify(n_trades: int = 2_000_000, days: int = 60, seed: int = 11):
+    import tempfile
+    rng = np.random.default_rng(seed)
+    projects = np.array(['raydium', 'raydium_launchlab', 'whirlpool', 'meteora', 'pumpswap', 'solfi'])
+    end = datetime(2025, 9, 1)
+    trades = pd.DataFrame({
+        'block_time': pd.Timestamp(end) - pd.to_timedelta(np.sort(rng.uniform(0, days * 86400, n_trades))[::-1], unit='s'),
+        'project': projects[rng.integers(0, len(projects), n_trades)],
+        'amount_usd': rng.lognormal(6, 2.5, n_trades),
+        'token_bought_mint_address': np.where(rng.random(n_trades) < 0.5, WSOL.capitalize(), STABLES[0]),
+        'token_sold_mint_address': None,
+    })
+    trades['token_sold_mint_address'] = np.where(trades['token_bought_mint_address'].str.lower() == WSOL,
+                                                  STABLES[1], WSOL)
+    path = os.path.join(tempfile.mkdtemp(), "sketches.db")
+    conn = open_db(path)
+    started = time.perf_counter()
+    for chunk in np.array_split(np.arange(n_trades), 20):   # 模擬分批到達
+        ingest(conn, trades.iloc[chunk])
+    elapsed = time.perf_counter() - started
+    sizes = [row[0] for row in conn.execute("SELECT length(sketch) FROM sketches")]
+    print(f"ingested {n_trades:,} trades in {elapsed:.1f}s ({n_trades / elapsed:,.0f}/s); "
+          f"{len(sizes)} sketches, {np.mean(sizes) / 1024:.1f} KB avg / {max(sizes) / 1024:.1f} KB max, "
+          f"db {os.path.getsize(path) / 2 ** 20:.1f} MB")
+
+    exact = normalize_trades(trades)
+    for by, all_projects in (('day', False), ('week', False), ('month', False), ('all', True)):
+        started = time.perf_counter()
+        report = percentiles(conn, by, all_projects=all_projects)
+        elapsed = time.perf_counter() - started
+        exact['period'] = _period(exact['day'], by)
+        keys = ['period'] if all_projects else ['period', 'project']
+        worst = 0.0
+        for key, group in exact.groupby(keys, dropna=False):
+            values = np.sort(group['trade_usd'].to_numpy())
+            period = key[0] if isinstance(key, tuple) else key
+            project = 'all' if all_projects else key[1]
+            sel = report[(report['project'] == project) &
+                         ((report['day'] == period) | (report['day'].isna() & pd.isna(period)))]
+            for q, est in zip(QUANTILES, sel['usd']):
+                worst = max(worst, _rank_error(values, est, q))
+        print(f"{by:>5}{' (all projects)' if all_projects else '':<15} {len(report):>6} rows in "
+              f"{elapsed * 1000:7.1f} ms, max rank error {worst:.4f} (bound ~{1.7 / K:.4f})")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--ingest', nargs='?', const='store', help='Parquet/CSV export, default: dune_local store')
+    parser.add_argument('--report', choices=['day', 'week', 'month', 'all'])
+    parser.add_argument('--all-projects', action='store_true')
+    parser.add_argument('--since', help='first day (YYYY-MM-DD), default: 365 days ago')
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+
+    if args.verify:
+        verify()
+        return
+    conn = open_db(args.db)
+    if args.ingest == 'store':
+        import dune_local
+        con = dune_local.connect()
+        print(f"{ingest_store(conn, con):,} trades added")
+        con.close()
+    elif args.ingest:
+        trades = pd.read_csv(args.ingest) if args.ingest.endswith('.csv') else pd.read_parquet(args.ingest)
+        print(f"{ingest(conn, trades):,} trades added")
+    if args.report:
+        since = args.since or (datetime.now(timezone.utc) - timedelta(days=365)).strftime('%Y-%m-%d')
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(percentiles(conn, args.report, since, all_projects=args.all_projects))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Rolling VaR/CVaR backtest for SOL-USDT Risk Management.py.
+
+For every day t the forecast uses only returns [t-window, t):
+- historical:  empirical loss quantiles of the window (sliding_window_view + np.partition per row)
+- ewma:        filtered historical simulation, window returns standardised by their EWMA
+               volatility and rescaled to the day-t EWMA forecast (RiskMetrics lambda)
+- montecarlo:  the calculator's normal model (window mean/std, num_simulations draws from
+               seed 42); the standard-normal draws are sorted once, so each day's quantiles
+               are read off mu + sigma * z without rerunning the simulator
+
+Exceptions (realised loss > VaR) are scored with Kupiec (unconditional coverage),
+Christoffersen (independence) and the joint conditional-coverage test.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal, stats
+
+from var_engine import _lerp
+
+METHODS = ('historical', 'ewma', 'montecarlo')
+
+
+def rolling_tail_metrics(losses: np.ndarray, levels=(0.95, 0.99)) -> dict:
+    """逐列的 tail_metrics: losses 為 (days, samples), 回傳 {level: (var, cvar)} 各為 (days,)"""
+    n = losses.shape[1]
+    pos = np.asarray(levels, dtype=np.float64) * (n - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, n - 1)
+    part = np.partition(losses, np.unique(np.concatenate([lo, hi])), axis=1)
+
+    result = {}
+    for level, p, l, h in zip(levels, pos, lo, hi):
+        var = _lerp(part[:, l], part[:, h], p - l)
+        tail = part[:, l:]
+        mask = tail >= var[:, None]
+        cvar = np.where(mask, tail, 0.0).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+        result[level] = (var, cvar)
+    return result
+
+
+def ewma_variance(returns: np.ndarray, lam: float = 0.94, init: float = None) -> np.ndarray:
+    """第 t 天的 EWMA 變異數預測 (只用到 t-1 為止的報酬)"""
+    r2 = np.asarray(returns, dtype=np.float64) ** 2
+    s0 = r2.mean() if init is None else init
+    # y[t] = lam * y[t-1] + (1 - lam) * r[t]^2 為 t+1 的預測
+    nxt, _ = signal.lfilter([1 - lam], [1, -lam], r2, zi=[lam * s0])
+    return np.concatenate([[s0], nxt[:-1]])
+
+
+def rolling_var(returns, portfolio_value: float, method: str = 'historical', window: int = 250,
+                levels=(0.95, 0.99), lam: float = 0.94, num_simulations: int = 50000,
+                seed: int = 42) -> pd.DataFrame:
+    """每日 VaR/CVaR 預測 (USD), index 為被預測的那一天"""
+    returns = pd.Series(returns).dropna()
+    r = returns.values.astype(np.float64)
+    if len(r) <= window:
+        raise ValueError(f"Need more than {window} returns, got {len(r)}")
+    days = returns.index[window:]
+    # 第 t 天的視窗為 r[t-window:t]
+    windows = sliding_window_view(r, window)[:-1]
+
+    if method == 'historical':
+        tails = rolling_tail_metrics(-portfolio_value * np.expm1(windows), levels)
+    elif method == 'ewma':
+        sigma = np.sqrt(ewma_variance(r, lam, init=r[:window].var()))
+        z = sliding_window_view(r / sigma, window)[:-1]
+        scenarios = z * sigma[window:, None]
+        tails = rolling_tail_metrics(-portfolio_value * np.expm1(scenarios), levels)
+    elif method == 'montecarlo':
+        mu = windows.mean(axis=1)
+        sd = windows.std(axis=1, ddof=1)
+        # 與 np.random.seed(seed); np.random.normal(mu, sigma, n) 相同的抽樣
+        z = np.random.RandomState(seed).standard_normal(num_simulations)
+        # 損失是 z 的遞減函數: 損失由小到大 = z 由大到小
+        z_desc = np.sort(z)[::-1]
+        tails = {}
+        n = num_simulations
+        for level in levels:
+            p = level * (n - 1)
+            l = int(np.floor(p))
+            h = min(l + 1, n - 1)
+            loss_l = -portfolio_value * np.expm1(mu + sd * z_desc[l])
+            loss_h = -portfolio_value * np.expm1(mu + sd * z_desc[h])
+            var = _lerp(loss_l, loss_h, p - l)
+            tail = -portfolio_value * np.expm1(mu[:, None] + sd[:, None] * z_desc[None, l:])
+            mask = tail >= var[:, None]
+            tails[level] = (var, np.where(mask, tail, 0.0).sum(axis=1) / np.maximum(mask.sum(axis=1), 1))
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    out = pd.DataFrame(index=days)
+    out['loss'] = -portfolio_value * np.expm1(r[window:])
+    for level, (var, cvar) in tails.items():
+        key = int(round(level * 100))
+        out[f'var_{key}'] = var
+        out[f'cvar_{key}'] = cvar
+        out[f'exception_{key}'] = out['loss'] > var
+    return out
+
+
+def kupiec_test(exceptions, level: float) -> dict:
+    """Kupiec POF: 例外次數是否符合 1 - level"""
+    x = np.asarray(exceptions, dtype=bool)
+    n, k = x.size, int(x.sum())
+    p = 1 - level
+    phat = k / n
+    ll_null = (n - k) * np.log(1 - p) + k * np.log(p)
+    ll_alt = (n - k) * np.log1p(-phat) + k * np.log(phat) if 0 < k < n else 0.0
+    lr = -2 * (ll_null - ll_alt)
+    return {'n': n, 'exceptions': k, 'expected': n * p, 'rate': phat,
+            'lr_uc': lr, 'p_uc': float(stats.chi2.sf(lr, 1))}
+
+
+def christoffersen_test(exceptions) -> dict:
+    """Christoffersen 獨立性檢定: 例外是否群聚 (一階馬可夫)"""
+    x = np.asarray(exceptions, dtype=np.int8)
+    prev, cur = x[:-1], x[1:]
+    n00 = int(np.sum((prev == 0) & (cur == 0)))
+    n01 = int(np.sum((prev == 0) & (cur == 1)))
+    n10 = int(np.sum((prev == 1) & (cur == 0)))
+    n11 = int(np.sum((prev == 1) & (cur == 1)))
+
+    def ll(count_0, count_1, prob):
+        # 0 * log(0) 視為 0
+        return (count_0 * np.log1p(-prob) if count_0 else 0.0) + (count_1 * np.log(prob) if count_1 else 0.0)
+
+    pi01 = n01 / (n00 + n01) if n00 + n01 else 0.0
+    pi11 = n11 / (n10 + n11) if n10 + n11 else 0.0
+    pi = (n01 + n11) / (n00 + n01 + n10 + n11)
+    lr = -2 * (ll(n00 + n10, n01 + n11, pi) - ll(n00, n01, pi01) - ll(n10, n11, pi11))
+    return {'lr_ind': lr, 'p_ind': float(stats.chi2.sf(lr, 1))}
+
+
+def backtest(returns, portfolio_value: float, methods=METHODS, window: int = 250,
+             levels=(0.95, 0.99), **kwargs):
+    """回傳 (每日預測 {method: DataFrame}, 檢定摘要 DataFrame)"""
+    forecasts, rows = {}, []
+    for method in methods:
+        df = rolling_var(returns, portfolio_value, method=method, window=window, levels=levels, **kwargs)
+        forecasts[method] = df
+        for level in levels:
+            exceptions = df[f'exception_{int(round(level * 100))}'].values
+            row = {'method': method, 'level': level}
+            row.update(kupiec_test(exceptions, level))
+            row.update(christoffersen_test(exceptions))
+            row['lr_cc'] = row['lr_uc'] + row['lr_ind']
+            row['p_cc'] = float(stats.chi2.sf(row['lr_cc'], 2))
+            rows.append(row)
+    return forecasts, pd.DataFrame(rows)